@@ -2,6 +2,8 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO
 from celery import Celery
+from metrics import instrument_commits
+from db_writes import install_sqlite_pragmas
 import os
 
 db = SQLAlchemy()
@@ -12,8 +14,12 @@ def create_app(config_class='config.Config'):
     app = Flask(__name__)
     app.config.from_object(config_class)
     
+    # WAL and a busy timeout on SQLite, set before the first connection is opened
+    install_sqlite_pragmas(app.config['SQLITE_BUSY_TIMEOUT'], app.config['SQLITE_SYNCHRONOUS'])
+    
     # Initialize extensions
     db.init_app(app)
+    instrument_commits()
     socketio.init_app(app, cors_allowed_origins="*")
     
     # Initialize Celery
@@ -33,7 +39,9 @@ def create_app(config_class='config.Config'):
     
     # Create database tables
     with app.app_context():
+        from app.models import migrate_database
         db.create_all()
+        migrate_database()
     
     # Initialize config
     from config import Config
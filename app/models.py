@@ -1,11 +1,24 @@
 from app import db
 from datetime import datetime
-import random
-import string
+from config import Config
+from movie_ids import create_id_allocator
+from ladder_analysis import ladder_quality_settings, ladder_renditions
+from queue_scheduler import position_between, scheduling_key, spaced_positions
 import json
+import time
+
+# Allocates movie IDs without a lookup per insert, see movie_ids.py
+movie_id_allocator = create_id_allocator(Config.MOVIE_ID_ALLOCATOR, lambda: db.engine)
 
 class Movie(db.Model):
-    id = db.Column(db.String(8), primary_key=True)
+    # Scans only look at the top level of INPUT, so the filename identifies a file
+    __table_args__ = (
+        db.Index('ix_movie_filename', 'filename', unique=True),
+        # Keyset pagination of the listing walks (created_at, id)
+        db.Index('ix_movie_created_at_id', 'created_at', 'id'),
+    )
+    
+    id = db.Column(db.String(20), primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
     file_size = db.Column(db.BigInteger, nullable=False)
@@ -17,6 +30,9 @@ class Movie(db.Model):
     overall_progress = db.Column(db.Integer, default=0)
     quality_progress = db.Column(db.Text, default='{}')  # JSON string
     error_message = db.Column(db.Text)
+    ladder = db.Column(db.Text)  # JSON per-title ladder, see ladder_analysis.py
+    owner = db.Column(db.String(100))  # worker converting the movie, see job_leases.py
+    heartbeat_at = db.Column(db.Float)  # unix time the owner last renewed its lease
     
     # Relationships
     quality_variants = db.relationship('QualityVariant', backref='movie', lazy=True, cascade='all, delete-orphan')
@@ -28,15 +44,13 @@ class Movie(db.Model):
     
     @staticmethod
     def generate_movie_id():
-        """Generate a unique 6-8 digit movie ID"""
-        while True:
-            # Generate 6-8 digit ID starting with 'MOV'
-            digits = ''.join(random.choices(string.digits, k=random.randint(5, 6)))
-            movie_id = f"MOV{digits}"
-            
-            # Check if ID already exists
-            if not Movie.query.filter_by(id=movie_id).first():
-                return movie_id
+        """Generate a unique, time-sortable movie ID starting with 'MOV'"""
+        return movie_id_allocator.allocate(1)[0]
+    
+    @staticmethod
+    def generate_movie_ids(count):
+        """Generate several unique movie IDs without looking up existing ones"""
+        return movie_id_allocator.allocate(count)
     
     def get_quality_progress(self):
         """Get quality progress as dictionary"""
@@ -51,10 +65,22 @@ class Movie(db.Model):
     
     def get_target_qualities(self):
         """Determine target qualities based on source resolution"""
-        if not self.source_resolution:
+        return Movie.target_qualities_for(self.source_resolution, self.ladder)
+    
+    def get_quality_settings(self):
+        """Config.QUALITIES with the bitrates of this movie's per-title ladder"""
+        return ladder_quality_settings(self.ladder, Config.QUALITIES)
+    
+    @staticmethod
+    def target_qualities_for(source_resolution, ladder=None):
+        """Determine target qualities for a source resolution string (or the per-title ladder)"""
+        if ladder_renditions(ladder):
+            return ladder_renditions(ladder)
+        
+        if not source_resolution:
             return ['720p', '480p', '360p']  # Default if unknown
         
-        height = int(self.source_resolution.split('x')[1]) if 'x' in self.source_resolution else 1080
+        height = int(source_resolution.split('x')[1]) if 'x' in source_resolution else 1080
         
         if height >= 1080:
             return ['720p', '480p', '360p']
@@ -91,7 +117,7 @@ class Movie(db.Model):
 
 class QualityVariant(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    movie_id = db.Column(db.String(8), db.ForeignKey('movie.id'), nullable=False)
+    movie_id = db.Column(db.String(20), db.ForeignKey('movie.id'), nullable=False)
     quality = db.Column(db.String(10), nullable=False)  # 720p, 480p, 360p
     status = db.Column(db.String(20), default='PENDING')  # PENDING, IN_PROGRESS, DONE, ERROR
     progress = db.Column(db.Integer, default=0)  # 0-100
@@ -102,6 +128,19 @@ class QualityVariant(db.Model):
     completed_at = db.Column(db.DateTime)
     error_message = db.Column(db.Text)
     
+    def get_checkpoint(self):
+        """This rendition's conversion checkpoint, see checkpoints.py"""
+        return {
+            'done': self.status == 'DONE',
+            'segments': self.segment_count or 0,
+            'seconds': self.duration or 0
+        }
+    
+    def set_checkpoint(self, checkpoint):
+        """Store how many segments (and seconds) of this rendition are written"""
+        self.segment_count = checkpoint['segments']
+        self.duration = checkpoint['seconds']
+    
     def to_dict(self):
         """Convert quality variant to dictionary for JSON serialization"""
         return {
@@ -113,9 +152,13 @@ class QualityVariant(db.Model):
         }
 
 class ConversionQueue(db.Model):
+    """Queued conversions, ordered by queue_scheduler.py"""
     id = db.Column(db.Integer, primary_key=True)
-    movie_id = db.Column(db.String(8), db.ForeignKey('movie.id'), nullable=False)
-    position = db.Column(db.Integer, nullable=False)
+    movie_id = db.Column(db.String(20), db.ForeignKey('movie.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)  # sparse, see queue_scheduler.POSITION_GAP
+    priority = db.Column(db.Integer, default=0)  # higher runs first
+    cost = db.Column(db.Float)  # estimated encode cost, see queue_scheduler.estimate_cost
+    dispatched_at = db.Column(db.Float)  # unix time the conversion was handed to the workers
     created_at = db.Column(db.DateTime, default=datetime.now)
     
     movie = db.relationship('Movie', backref='queue_entry')
@@ -124,9 +167,171 @@ class ConversionQueue(db.Model):
     def get_next_position():
         """Get the next position in queue"""
         last_position = db.session.query(db.func.max(ConversionQueue.position)).scalar()
-        return (last_position or 0) + 1
+        return position_between(last_position, None)
+    
+    @staticmethod
+    def get_front_position():
+        """A position ahead of every queued entry"""
+        first_position = db.session.query(db.func.min(ConversionQueue.position)).scalar()
+        return position_between(None, first_position)
+    
+    def scheduling_key(self, now=None):
+        """Sort key of this entry under the configured queue policy"""
+        waited = ((now or datetime.now()) - self.created_at).total_seconds() if self.created_at else 0
+        return scheduling_key(self.priority, self.position, self.cost, waited,
+                              Config.QUEUE_POLICY, Config.QUEUE_AGING_SECONDS)
+    
+    @staticmethod
+    def get_scheduled():
+        """Entries waiting to be converted, the next one first"""
+        now = datetime.now()
+        entries = (ConversionQueue.query.join(Movie)
+                   .filter(Movie.status == 'QUEUED', ConversionQueue.dispatched_at.is_(None)).all())
+        return sorted(entries, key=lambda entry: entry.scheduling_key(now))
     
     @staticmethod
     def get_queue():
-        """Get all movies in queue ordered by position"""
-        return ConversionQueue.query.order_by(ConversionQueue.position).all()
+        """Get all movies in queue: the ones converting, then the waiting ones in the order they will run"""
+        running = (ConversionQueue.query.filter(ConversionQueue.dispatched_at.isnot(None))
+                   .order_by(ConversionQueue.dispatched_at).all())
+        return running + ConversionQueue.get_scheduled()
+    
+    def dispatch(self, max_active):
+        """
+        Take one of max_active conversion slots for this entry.
+        
+        A single conditional UPDATE counting the dispatched entries, so web
+        and worker processes dispatching at once cannot exceed the limit.
+        Returns True when the slot was taken.
+        """
+        active = db.aliased(ConversionQueue)
+        active_count = (db.session.query(db.func.count(active.id))
+                        .filter(active.dispatched_at.isnot(None)).scalar_subquery())
+        now = time.time()
+        taken = ConversionQueue.query.filter(
+            ConversionQueue.id == self.id,
+            ConversionQueue.dispatched_at.is_(None),
+            active_count < max_active
+        ).update({ConversionQueue.dispatched_at: now}, synchronize_session=False)
+        db.session.commit()
+        if taken:
+            self.dispatched_at = now
+        return taken == 1
+    
+    @staticmethod
+    def get_lost_dispatches(max_age):
+        """Entries dispatched over max_age seconds ago whose movie no worker took up"""
+        return (ConversionQueue.query.join(Movie)
+                .filter(Movie.status == 'QUEUED', ConversionQueue.dispatched_at < time.time() - max_age).all())
+    
+    @staticmethod
+    def get_queue_positions():
+        """1-based place of every queued movie, {movie_id: place}"""
+        return {entry.movie_id: place for place, entry in enumerate(ConversionQueue.get_queue(), start=1)}
+    
+    def move(self, before=None, after=None):
+        """
+        Move this entry right in front of before, right behind after, or to the
+        back of the queue when neither is given. Positions only order entries
+        of the same (aged) priority.
+        """
+        if before is not None:
+            neighbour = (db.session.query(db.func.max(ConversionQueue.position))
+                         .filter(ConversionQueue.position < before.position, ConversionQueue.id != self.id).scalar())
+            bounds = (neighbour, before.position)
+        elif after is not None:
+            neighbour = (db.session.query(db.func.min(ConversionQueue.position))
+                         .filter(ConversionQueue.position > after.position, ConversionQueue.id != self.id).scalar())
+            bounds = (after.position, neighbour)
+        else:
+            last_position = (db.session.query(db.func.max(ConversionQueue.position))
+                             .filter(ConversionQueue.id != self.id).scalar())
+            bounds = (last_position, None)
+        
+        position = position_between(*bounds)
+        if position is None:
+            ConversionQueue.respace()
+            return self.move(before=before, after=after)
+        self.position = position
+    
+    @staticmethod
+    def respace():
+        """Spread all positions POSITION_GAP apart again, keeping their order"""
+        entries = ConversionQueue.query.order_by(ConversionQueue.position).all()
+        for entry, position in zip(entries, spaced_positions(len(entries))):
+            entry.position = position
+        db.session.flush()
+
+class ProbeCache(db.Model):
+    """Cached ffprobe results keyed by file path, size and modification time"""
+    file_path = db.Column(db.String(500), primary_key=True)
+    file_size = db.Column(db.BigInteger, nullable=False)
+    mtime_ns = db.Column(db.BigInteger, nullable=False)
+    video_info = db.Column(db.Text)  # JSON string, 'null' if the probe failed
+    probed_at = db.Column(db.DateTime, default=datetime.now)
+    
+    def matches(self, file_size, mtime_ns):
+        """Check whether the cached entry still describes the file on disk"""
+        return self.file_size == file_size and self.mtime_ns == mtime_ns
+    
+    def get_video_info(self):
+        """Get cached video info as dictionary"""
+        try:
+            return json.loads(self.video_info) if self.video_info else None
+        except:
+            return None
+    
+    def set_video_info(self, video_info):
+        """Set cached video info from dictionary"""
+        self.video_info = json.dumps(video_info)
+
+class ProbeLatency(db.Model):
+    """Probe latency histogram shared by all processes, one row per bucket (see metrics.py)"""
+    le = db.Column(db.String(10), primary_key=True)  # upper bound of the bucket
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+    seconds = db.Column(db.Float, nullable=False, default=0.0)
+
+class EncodeSample(db.Model):
+    """Encode throughput of one rendition (or ladder run), sampled every few seconds"""
+    id = db.Column(db.Integer, primary_key=True)
+    movie_id = db.Column(db.String(20), nullable=False)
+    rendition = db.Column(db.String(50), nullable=False)
+    recorded_at = db.Column(db.Float, nullable=False)  # unix time
+    out_time = db.Column(db.Float)  # seconds of output encoded
+    fps = db.Column(db.Float)
+    speed = db.Column(db.Float)  # relative to realtime
+    bitrate_kbps = db.Column(db.Float)
+    output_bytes = db.Column(db.BigInteger)
+    
+    __table_args__ = (db.Index('ix_encode_sample_movie_rendition', 'movie_id', 'rendition', 'id'),)
+
+# Schema changes for databases created before the columns/indexes existed;
+# db.create_all() only creates missing tables
+MIGRATIONS = [
+    ('unique filename index', 'CREATE UNIQUE INDEX IF NOT EXISTS ix_movie_filename ON movie (filename)'),
+    ('(created_at, id) listing index',
+     'CREATE INDEX IF NOT EXISTS ix_movie_created_at_id ON movie (created_at, id)'),
+    ('per-title ladder column', 'ALTER TABLE movie ADD COLUMN ladder TEXT'),
+    ('lease owner column', 'ALTER TABLE movie ADD COLUMN owner VARCHAR(100)'),
+    ('lease heartbeat column', 'ALTER TABLE movie ADD COLUMN heartbeat_at FLOAT'),
+    ('queue priority column', 'ALTER TABLE conversion_queue ADD COLUMN priority INTEGER DEFAULT 0'),
+    ('queue cost column', 'ALTER TABLE conversion_queue ADD COLUMN cost FLOAT'),
+    ('queue dispatch column', 'ALTER TABLE conversion_queue ADD COLUMN dispatched_at FLOAT'),
+    # Generated movie IDs are longer than the old VARCHAR(8); SQLite ignores the length
+    ('wider movie id (PostgreSQL)', 'ALTER TABLE movie ALTER COLUMN id TYPE VARCHAR(20)'),
+    ('wider movie id (MySQL)', 'ALTER TABLE movie MODIFY id VARCHAR(20)'),
+    ('wider variant movie id (PostgreSQL)', 'ALTER TABLE quality_variant ALTER COLUMN movie_id TYPE VARCHAR(20)'),
+    ('wider variant movie id (MySQL)', 'ALTER TABLE quality_variant MODIFY movie_id VARCHAR(20)'),
+    ('wider queue movie id (PostgreSQL)', 'ALTER TABLE conversion_queue ALTER COLUMN movie_id TYPE VARCHAR(20)'),
+    ('wider queue movie id (MySQL)', 'ALTER TABLE conversion_queue MODIFY movie_id VARCHAR(20)'),
+]
+
+def migrate_database():
+    """Bring an existing database up to the current schema"""
+    for name, statement in MIGRATIONS:
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(db.text(statement))
+            print(f"Applied migration: {name}")
+        except Exception as e:
+            print(f"Migration not needed: {name} ({str(e).splitlines()[0]})")
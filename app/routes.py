@@ -1,48 +1,110 @@
-from flask import Blueprint, render_template, request, jsonify, current_app
+from flask import Blueprint, Response, render_template, request, jsonify, current_app
 from app import db, socketio
-from app.models import Movie, QualityVariant, ConversionQueue
-from app.tasks import convert_video_task, scan_input_folder_task
+from app.models import Movie, QualityVariant, ConversionQueue, EncodeSample, ProbeLatency
+from app.tasks import scan_input_folder_task, enqueue_movie
 from app.utils import scan_input_folder, format_file_size, format_duration, get_status_color, get_status_icon
 from flask_socketio import emit
+from movie_listing import ListingError, keyset_page, parse_fields, parse_page_size
+from metrics import render_metrics
 import os
 
 main = Blueprint('main', __name__)
 
+# Columns each listing field needs, so /api/movies only selects what was asked for
+MOVIE_LIST_COLUMNS = {
+    'id': ['id'],
+    'filename': ['filename'],
+    'file_size': ['file_size'],
+    'file_size_formatted': ['file_size'],
+    'source_resolution': ['source_resolution'],
+    'status': ['status'],
+    'status_color': ['status'],
+    'status_icon': ['status'],
+    'created_at': ['created_at'],
+    'overall_progress': ['overall_progress'],
+    'target_qualities': ['source_resolution', 'ladder'],
+    'queue_position': ['id'],
+    'quality_variants': ['id'],
+}
+MOVIE_LIST_DEFAULT_FIELDS = [field for field in MOVIE_LIST_COLUMNS if field != 'quality_variants']
+
+def serialize_movie_row(row, fields, queue_positions, variants):
+    """Build the listing dict for a projected movie row"""
+    movie = row._mapping
+    movie_dict = {}
+    for field in fields:
+        if field == 'file_size_formatted':
+            movie_dict[field] = format_file_size(movie['file_size'])
+        elif field == 'status_color':
+            movie_dict[field] = get_status_color(movie['status'])
+        elif field == 'status_icon':
+            movie_dict[field] = get_status_icon(movie['status'])
+        elif field == 'created_at':
+            movie_dict[field] = movie['created_at'].isoformat() if movie['created_at'] else None
+        elif field == 'target_qualities':
+            movie_dict[field] = Movie.target_qualities_for(movie['source_resolution'], movie['ladder'])
+        elif field == 'queue_position':
+            movie_dict[field] = queue_positions.get(movie['id'])
+        elif field == 'quality_variants':
+            movie_dict[field] = [variant.to_dict() for variant in variants.get(movie['id'], [])]
+        else:
+            movie_dict[field] = movie[field]
+    return movie_dict
+
 @main.route('/')
 def index():
     """Main dashboard page"""
-    # Get all movies
-    movies = Movie.query.order_by(Movie.created_at.desc()).all()
-    
-    # Get queue information
-    queue = ConversionQueue.get_queue()
+    # Movies are loaded page by page from /api/movies, only counts are rendered here
+    status_counts = dict(db.session.query(Movie.status, db.func.count(Movie.id)).group_by(Movie.status).all())
+    stats = {
+        'total_movies': sum(status_counts.values()),
+        'completed_movies': status_counts.get('DONE', 0),
+        'in_progress': status_counts.get('IN_PROGRESS', 0)
+    }
     
-    # Prepare movie data for template
-    movie_data = []
-    for movie in movies:
-        movie_dict = movie.to_dict()
-        movie_dict['file_size_formatted'] = format_file_size(movie.file_size)
-        movie_dict['status_color'] = get_status_color(movie.status)
-        movie_dict['status_icon'] = get_status_icon(movie.status)
-        movie_dict['target_qualities_str'] = ', '.join(movie.get_target_qualities())
-        
-        # Check if in queue
-        queue_position = None
-        for i, queue_item in enumerate(queue):
-            if queue_item.movie_id == movie.id:
-                queue_position = i + 1
-                break
-        movie_dict['queue_position'] = queue_position
-        
-        movie_data.append(movie_dict)
-    
-    return render_template('index.html', movies=movie_data, queue_length=len(queue))
+    return render_template('index.html', stats=stats, queue_length=ConversionQueue.query.count())
 
 @main.route('/api/movies')
 def get_movies():
-    """API endpoint to get all movies"""
-    movies = Movie.query.order_by(Movie.created_at.desc()).all()
-    return jsonify([movie.to_dict() for movie in movies])
+    """
+    API endpoint to list movies, newest first, with keyset pagination.
+    
+    Query parameters: limit, cursor (next_cursor of the previous page),
+    status and fields (comma separated projection).
+    """
+    try:
+        page_size = parse_page_size(request.args.get('limit'))
+        fields = parse_fields(request.args.get('fields'), MOVIE_LIST_COLUMNS, MOVIE_LIST_DEFAULT_FIELDS)
+        
+        column_names = {'id', 'created_at'}
+        for field in fields:
+            column_names.update(MOVIE_LIST_COLUMNS[field])
+        query = db.session.query(*[getattr(Movie, name) for name in sorted(column_names)])
+        
+        if request.args.get('status'):
+            query = query.filter(Movie.status == request.args['status'])
+        
+        rows, next_cursor = keyset_page(query, Movie.created_at, Movie.id, request.args.get('cursor'), page_size)
+        movie_ids = [row.id for row in rows]
+        
+        # Queue positions and variants for the whole page, one query each
+        queue_positions = {}
+        if 'queue_position' in fields and movie_ids:
+            queue_positions = ConversionQueue.get_queue_positions()
+        variants = {}
+        if 'quality_variants' in fields and movie_ids:
+            for variant in QualityVariant.query.filter(QualityVariant.movie_id.in_(movie_ids)):
+                variants.setdefault(variant.movie_id, []).append(variant)
+        
+        return jsonify({
+            'movies': [serialize_movie_row(row, fields, queue_positions, variants) for row in rows],
+            'next_cursor': next_cursor
+        })
+        
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 @main.route('/api/movies/<movie_id>')
 def get_movie(movie_id):
@@ -59,46 +121,25 @@ def start_conversion(movie_id):
         if movie.status not in ['NEW', 'ERROR']:
             return jsonify({'error': 'Movie is not in a convertible state'}), 400
         
-        # Check if there's already a movie being processed
-        active_movie = Movie.query.filter_by(status='IN_PROGRESS').first()
-        
-        if active_movie:
-            # Add to queue
-            queue_position = ConversionQueue.get_next_position()
-            queue_entry = ConversionQueue(
-                movie_id=movie_id,
-                position=queue_position
-            )
-            db.session.add(queue_entry)
-            movie.status = 'QUEUED'
-            db.session.commit()
-            
-            return jsonify({
-                'success': True,
-                'message': f'Added to queue at position {queue_position}',
-                'queue_position': queue_position
-            })
-        else:
-            # Start conversion immediately
-            movie.status = 'QUEUED'
-            db.session.commit()
-            
-            # Add to queue with position 1
-            queue_entry = ConversionQueue(
-                movie_id=movie_id,
-                position=1
-            )
-            db.session.add(queue_entry)
-            db.session.commit()
-            
-            # Start the conversion task
-            convert_video_task.delay(movie_id)
-            
+        try:
+            priority = int((request.get_json(silent=True) or {}).get('priority') or 0)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'priority must be an integer'}), 400
+        
+        queue_position, started = enqueue_movie(movie, priority)
+        
+        if started:
             return jsonify({
                 'success': True,
                 'message': 'Conversion started',
-                'queue_position': 1
+                'queue_position': queue_position
             })
+        
+        return jsonify({
+            'success': True,
+            'message': f'Added to queue at position {queue_position}',
+            'queue_position': queue_position
+        })
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -112,19 +153,10 @@ def cancel_conversion(movie_id):
         if movie.status != 'QUEUED':
             return jsonify({'error': 'Movie is not in queue'}), 400
         
-        # Remove from queue
+        # Remove from queue, positions are sparse so the other entries stay as they are
         queue_entry = ConversionQueue.query.filter_by(movie_id=movie_id).first()
         if queue_entry:
             db.session.delete(queue_entry)
-            
-            # Update positions of remaining queue items
-            remaining_items = ConversionQueue.query.filter(
-                ConversionQueue.position > queue_entry.position
-            ).all()
-            
-            for item in remaining_items:
-                item.position -= 1
-            
             db.session.commit()
         
         # Update movie status
@@ -157,6 +189,7 @@ def delete_movie(movie_id):
             shutil.rmtree(output_dir)
         
         # Delete from database
+        EncodeSample.query.filter_by(movie_id=movie_id).delete()
         db.session.delete(movie)
         db.session.commit()
         
@@ -181,9 +214,11 @@ def get_queue():
         queue = ConversionQueue.get_queue()
         queue_data = []
         
-        for item in queue:
+        for place, item in enumerate(queue, start=1):
             movie_data = item.movie.to_dict()
-            movie_data['queue_position'] = item.position
+            movie_data['queue_position'] = place
+            movie_data['priority'] = item.priority or 0
+            movie_data['estimated_cost'] = item.cost
             queue_data.append(movie_data)
         
         return jsonify(queue_data)
@@ -191,15 +226,92 @@ def get_queue():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def get_waiting_entry(movie_id):
+    """Queue entry of a movie that is still waiting, or an error response"""
+    queue_entry = ConversionQueue.query.filter_by(movie_id=movie_id).first()
+    if not queue_entry or queue_entry.movie.status != 'QUEUED':
+        return None, (jsonify({'error': 'Movie is not waiting in the queue'}), 400)
+    return queue_entry, None
+
+@main.route('/api/queue/<movie_id>/priority', methods=['POST'])
+def set_queue_priority(movie_id):
+    """
+    Change the priority of a queued movie.
+    
+    JSON body: {"priority": n} sets it, {"bump": n} raises it by n (default 1).
+    """
+    try:
+        queue_entry, error = get_waiting_entry(movie_id)
+        if error:
+            return error
+        
+        data = request.get_json(silent=True) or {}
+        try:
+            if 'priority' in data:
+                queue_entry.priority = int(data['priority'])
+            else:
+                queue_entry.priority = (queue_entry.priority or 0) + int(data.get('bump', 1))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'priority and bump must be integers'}), 400
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'priority': queue_entry.priority,
+            'queue_position': ConversionQueue.get_queue_positions().get(movie_id)
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/queue/<movie_id>/move', methods=['POST'])
+def move_in_queue(movie_id):
+    """
+    Reorder a queued movie among the ones of the same priority.
+    
+    JSON body: {"before": movie_id}, {"after": movie_id}, {"to": "front"} or {"to": "back"}.
+    """
+    try:
+        queue_entry, error = get_waiting_entry(movie_id)
+        if error:
+            return error
+        
+        data = request.get_json(silent=True) or {}
+        neighbour_id = data.get('before') or data.get('after')
+        if neighbour_id:
+            neighbour = ConversionQueue.query.filter_by(movie_id=neighbour_id).first()
+            if not neighbour or neighbour_id == movie_id:
+                return jsonify({'error': f'{neighbour_id} is not another queued movie'}), 400
+            if data.get('before'):
+                queue_entry.move(before=neighbour)
+            else:
+                queue_entry.move(after=neighbour)
+        elif data.get('to') == 'front':
+            queue_entry.position = ConversionQueue.get_front_position()
+        elif data.get('to') == 'back':
+            queue_entry.move()
+        else:
+            return jsonify({'error': 'Give before, after or to ("front" or "back")'}), 400
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'queue_position': ConversionQueue.get_queue_positions().get(movie_id)
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @main.route('/api/stats')
 def get_stats():
     """Get dashboard statistics"""
     try:
-        total_movies = Movie.query.count()
-        completed_movies = Movie.query.filter_by(status='DONE').count()
-        in_progress = Movie.query.filter_by(status='IN_PROGRESS').count()
-        queued = Movie.query.filter_by(status='QUEUED').count()
-        errors = Movie.query.filter_by(status='ERROR').count()
+        status_counts = dict(db.session.query(Movie.status, db.func.count(Movie.id)).group_by(Movie.status).all())
+        total_movies = sum(status_counts.values())
+        completed_movies = status_counts.get('DONE', 0)
+        in_progress = status_counts.get('IN_PROGRESS', 0)
+        queued = status_counts.get('QUEUED', 0)
+        errors = status_counts.get('ERROR', 0)
         
         return jsonify({
             'total_movies': total_movies,
@@ -213,6 +325,14 @@ def get_stats():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@main.route('/metrics')
+def metrics():
+    """Prometheus metrics for the dashboard and the Celery workers"""
+    # Only entries still waiting count, dispatched ones are running on the workers
+    queue_depth = ConversionQueue.query.filter(ConversionQueue.dispatched_at.is_(None)).count()
+    return Response(render_metrics(db.session, Movie, EncodeSample, queue_depth, ProbeLatency),
+                    mimetype='text/plain; version=0.0.4')
+
 # WebSocket events
 @socketio.on('connect')
 def handle_connect():
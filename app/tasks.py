@@ -1,13 +1,30 @@
-from celery import Celery
+from celery import Celery, chord
+from sqlalchemy.exc import IntegrityError
 from app import db, socketio
-from app.models import Movie, QualityVariant, ConversionQueue
+from app.models import Movie, QualityVariant, ConversionQueue, ProbeCache, EncodeSample
 from app.utils import get_video_info, create_output_directory, create_master_playlist, cleanup_temp_files
 from config import Config
+from hls_encoder import AUDIO_BITRATE, AUDIO_GROUP_ID, encode_audio, encode_ladder, hls_output_options
+from ffmpeg_progress import run_ffmpeg
+from checkpoints import (PLAYLIST_NAME, RESUME_PLAYLIST, PlaylistWatcher, checkpoint_for, finalize_playlist,
+                         merge_resumed, reset_to_checkpoint,
+                         resume_point, verify_checkpoint)
+from metrics import EncodeSampler
+from db_writes import ProgressWriter
+from job_leases import (OWNER_ID, claim_lease, kill_orphaned_encoders, renew_leases, stale_movies,
+                        start_periodic)
+from ladder_analysis import analyze_title
+from queue_scheduler import estimate_cost
+from cpu_budget import HEAVY_QUEUE, LIGHT_QUEUE, encoder_threads, job_cores, job_queue
+from chunked_encoder import encode_chunked
+from watch_folder import WatchFolderService
+from flask import current_app
 import ffmpeg
 import os
+import json
+import time
 from pathlib import Path
 from datetime import datetime
-import re
 
 # Create Celery instance
 celery = Celery('video_dashboard')
@@ -15,15 +32,29 @@ celery.config_from_object('config.Config')
 
 @celery.task(bind=True)
 def convert_video_task(self, movie_id):
-    """Main task to convert video to multiple HLS qualities"""
+    """
+    Main task to convert video to multiple HLS qualities.
+    
+    Prepares the conversion (probe, per-title ladder, shared audio) and hands
+    the encodes to encode_renditions_task in a chord that ends with
+    finalize_conversion_task.
+    """
     try:
         # Get movie from database
         movie = db.session.get(Movie, movie_id)
         if not movie:
             return {'error': 'Movie not found'}
+        # Cancelled, or a late duplicate of a conversion that already finished
+        if not ConversionQueue.query.filter_by(movie_id=movie_id).first():
+            return {'skipped': 'Movie is not queued'}
         
-        # Update status to IN_PROGRESS
-        movie.status = 'IN_PROGRESS'
+        # Take the lease, a duplicate delivery of this task must not encode the movie twice
+        if not claim_lease(db.session, Movie, movie_id, lease_seconds=Config.JOB_LEASE_SECONDS):
+            return {'skipped': 'Movie is being converted by another worker'}
+        # Renewed while this task prepares the conversion, then by the encode tasks
+        ACTIVE_MOVIES.add(movie_id)
+        ensure_heartbeat()
+        db.session.refresh(movie)
         movie.started_at = datetime.now()
         db.session.commit()
         
@@ -34,12 +65,27 @@ def convert_video_task(self, movie_id):
             'progress': 0
         })
         
-        # Get video info if not already available
-        if not movie.source_resolution:
-            video_info = get_video_info(movie.file_path)
-            if video_info:
-                movie.source_resolution = video_info['resolution']
+        # Get video info (duration and audio layout are needed for encoding)
+        video_info = get_video_info(movie.file_path)
+        if video_info and not movie.source_resolution:
+            movie.source_resolution = video_info['resolution']
+            db.session.commit()
+        
+        # Pick this title's bitrates and rungs from a few trial encodes
+        if Config.PER_TITLE_LADDER and not movie.ladder and video_info and video_info['duration'] > 0:
+            ladder = analyze_title(
+                movie.file_path,
+                video_info['duration'],
+                movie.get_target_qualities(),
+                Config.QUALITIES,
+                samples=Config.LADDER_SAMPLES,
+                sample_seconds=Config.LADDER_SAMPLE_SECONDS
+            )
+            if ladder:
+                movie.ladder = json.dumps(ladder)
                 db.session.commit()
+                print(f"Per-title ladder for {movie_id}: {ladder['renditions']} "
+                      f"(complexity {ladder['complexity_kbps']} kbps)")
         
         # Create output directory
         output_dir = create_output_directory(movie_id)
@@ -48,78 +94,183 @@ def convert_video_task(self, movie_id):
         target_qualities = movie.get_target_qualities()
         
         if not target_qualities:
-            movie.status = 'DONE'
-            movie.completed_at = datetime.now()
-            movie.overall_progress = 100
-            db.session.commit()
-            
-            socketio.emit('status_update', {
-                'movie_id': movie_id,
-                'status': 'DONE',
-                'progress': 100
-            })
+            finalize_conversion_task.delay([], movie_id, OWNER_ID, [], [], False)
             return {'success': True, 'message': 'No conversion needed'}
         
-        # Create quality variants in database
+        # Quality variants are kept across attempts, they hold the rendition checkpoints
+        variants = {variant.quality: variant for variant in QualityVariant.query.filter_by(movie_id=movie_id)}
         for quality in target_qualities:
-            variant = QualityVariant(
-                movie_id=movie_id,
-                quality=quality,
-                status='PENDING'
-            )
-            db.session.add(variant)
-        db.session.commit()
+            if quality not in variants:
+                variants[quality] = QualityVariant(
+                    movie_id=movie_id,
+                    quality=quality,
+                    status='PENDING'
+                )
+                db.session.add(variants[quality])
         
-        # Convert each quality
+        # Renditions an earlier attempt finished are kept if their files are all there,
+        # the others are PENDING until their encode task starts
         completed_qualities = []
-        total_qualities = len(target_qualities)
+        for quality in target_qualities:
+            if verify_checkpoint(output_dir / quality, variants[quality].get_checkpoint())['done']:
+                completed_qualities.append(quality)
+            else:
+                variants[quality].status = 'PENDING'
+        db.session.commit()
+        if completed_qualities:
+            print(f"Resuming {movie_id}: keeping finished {completed_qualities}")
+        
+        total_duration = video_info['duration'] if video_info else 0
+        has_audio = video_info.get('has_audio', True) if video_info else True
+        
+        # One audio rendition for the whole ladder, the video renditions then carry no audio
+        shared_audio = False
+        audio_dir = output_dir / AUDIO_GROUP_ID
+        if Config.SHARED_AUDIO and has_audio and verify_checkpoint(audio_dir, {'done': True}, resumable=False)['done']:
+            # An earlier attempt finished it: its playlist ended and every segment is there
+            shared_audio = True
+            print(f"Resuming {movie_id}: keeping the shared audio rendition")
+        elif Config.SHARED_AUDIO and has_audio:
+            reset_to_checkpoint(audio_dir, [])
+            result = encode_audio(movie.file_path, output_dir, Config.SEGMENT_DURATION, total_duration=total_duration,
+                                  segment_format=Config.HLS_SEGMENT_FORMAT)
+            shared_audio = bool(result['completed'])
+            if not shared_audio:
+                print(f"Shared audio failed for {movie_id}, muxing audio into every rendition: "
+                      f"{' | '.join(result['stderr_tail'][-3:])}")
+        mux_audio = has_audio and not shared_audio
         
-        for i, quality in enumerate(target_qualities):
+        # Decode once and encode the whole ladder in a single ffmpeg run,
+        # split into parallel chunks when the source is long enough
+        ladder_qualities = [q for q in target_qualities if q in Config.QUALITIES and q not in completed_qualities]
+        # Chunks are stitched segment file by segment file, so single-file fMP4 encodes in one pass
+        use_chunked = (Config.ENCODE_MODE == 'chunked' and Config.HLS_SEGMENT_FORMAT == 'ts' and ladder_qualities
+                       and total_duration > Config.SEGMENT_DURATION * Config.CHUNK_SEGMENTS)
+        use_ladder = Config.ENCODE_MODE in ('ladder', 'chunked') and len(ladder_qualities) > 1
+        
+        # Every encode is its own task so idle workers pick them up: the ladder as one task,
+        # otherwise one task per rendition. The finalizer runs once all of them returned.
+        encodes = []
+        if use_chunked or use_ladder:
+            encodes.append(encode_signature(movie, ladder_qualities, video_info, mux_audio,
+                                            'chunked' if use_chunked else 'ladder'))
+        ladder_encoded = ladder_qualities if use_chunked or use_ladder else []
+        pending_qualities = [q for q in target_qualities if q not in completed_qualities and q not in ladder_encoded]
+        for quality in pending_qualities:
+            encodes.append(encode_signature(movie, [quality], video_info, mux_audio, 'single'))
+        
+        finalizer = finalize_conversion_task.s(movie_id, OWNER_ID, completed_qualities, target_qualities, shared_audio)
+        # A chord whose encodes or finalizer failed ends the conversion instead of leaving it IN_PROGRESS
+        finalizer.on_error(conversion_failed_task.s(movie_id, OWNER_ID))
+        if encodes:
+            chord(encodes)(finalizer)
+        else:
+            finalizer.delay([])
+        
+        return {
+            'success': True,
+            'dispatched_encodes': len(encodes),
+            'total_qualities': len(target_qualities)
+        }
+        
+    except Exception as e:
+        print(f"Error in convert_video_task for {movie_id}: {e}")
+        fail_conversion(movie_id, str(e))
+        return {'error': str(e)}
+    finally:
+        ACTIVE_MOVIES.discard(movie_id)
+
+def encode_signature(movie, qualities, video_info, mux_audio, mode):
+    """An encode_renditions_task for the queue its CPU cost calls for, with the cores of that queue's slots"""
+    slot_cores = {HEAVY_QUEUE: Config.HEAVY_JOB_CORES, LIGHT_QUEUE: Config.LIGHT_JOB_CORES}
+    cores = job_cores(movie.source_resolution, qualities, movie.get_quality_settings())
+    queue = job_queue(cores, Config.LIGHT_JOB_CORES)
+    return encode_renditions_task.s(movie.id, OWNER_ID, qualities, video_info, mux_audio, mode,
+                                    min(cores, slot_cores[queue])).set(queue=queue)
+
+@celery.task(bind=True)
+def encode_renditions_task(self, movie_id, owner, qualities, video_info, mux_audio, mode, cores=None):
+    """
+    Encode renditions of a movie, one part of a conversion.
+    
+    mode is 'ladder' or 'chunked' (all qualities decoded once, failed ones
+    retried one by one) or 'single' (a single quality). cores is the CPU
+    share of the job, ffmpeg's threads follow from it. Returns the
+    completed qualities; errors are logged and never raised, so the
+    finalizer always runs.
+    """
+    ACTIVE_MOVIES.add(movie_id)
+    ensure_heartbeat()
+    try:
+        movie = db.session.get(Movie, movie_id)
+        # A conversion that was requeued since is converted by its new owner
+        if not movie or movie.status != 'IN_PROGRESS' or movie.owner != owner:
+            return []
+        
+        completed = []
+        if mode in ('ladder', 'chunked'):
+            completed.extend(convert_ladder(movie, qualities, video_info, chunked=mode == 'chunked',
+                                            mux_audio=mux_audio, cores=cores))
+        
+        total_duration = video_info['duration'] if video_info else 0
+        for quality in [q for q in qualities if q not in completed]:
+            variant = QualityVariant.query.filter_by(movie_id=movie_id, quality=quality).first()
             try:
-                # Update variant status
-                variant = QualityVariant.query.filter_by(
-                    movie_id=movie_id, 
-                    quality=quality
-                ).first()
                 variant.status = 'IN_PROGRESS'
                 db.session.commit()
                 
-                # Convert quality
-                success = convert_quality(movie, quality, self)
-                
-                if success:
+                if convert_quality(movie, quality, self, total_duration, mux_audio, cores):
                     variant.status = 'DONE'
                     variant.progress = 100
                     variant.completed_at = datetime.now()
-                    completed_qualities.append(quality)
+                    completed.append(quality)
                 else:
                     variant.status = 'ERROR'
                     variant.error_message = 'Conversion failed'
-                
-                db.session.commit()
-                
-                # Update overall progress
-                overall_progress = int(((i + 1) / total_qualities) * 100)
-                movie.overall_progress = overall_progress
                 db.session.commit()
                 
-                # Emit progress update
-                socketio.emit('status_update', {
-                    'movie_id': movie_id,
-                    'status': 'IN_PROGRESS',
-                    'progress': overall_progress,
-                    'current_quality': quality
-                })
-                
             except Exception as e:
                 print(f"Error converting {quality} for {movie_id}: {e}")
+                db.session.rollback()
                 variant.status = 'ERROR'
                 variant.error_message = str(e)
                 db.session.commit()
         
+        socketio.emit('status_update', {
+            'movie_id': movie_id,
+            'status': 'IN_PROGRESS',
+            'progress': movie.overall_progress,
+            'completed_qualities': completed
+        })
+        return completed
+        
+    except Exception as e:
+        print(f"Error encoding {qualities} for {movie_id}: {e}")
+        return []
+    finally:
+        ACTIVE_MOVIES.discard(movie_id)
+
+@celery.task
+def finalize_conversion_task(results, movie_id, owner, completed_qualities, target_qualities, shared_audio):
+    """Write the master playlist and the final movie status once every encode of a conversion returned"""
+    ACTIVE_MOVIES.add(movie_id)
+    ensure_heartbeat()
+    try:
+        movie = db.session.get(Movie, movie_id)
+        if not movie:
+            return {'error': 'Movie not found'}
+        if movie.owner != owner:
+            return {'skipped': 'Conversion was requeued'}
+        
+        completed = set(completed_qualities)
+        for result in results:
+            completed.update(result or [])
+        # Keep the ladder order for the master playlist
+        completed_qualities = [quality for quality in target_qualities if quality in completed]
+        
         # Create master playlist if any qualities were successful
         if completed_qualities:
-            create_master_playlist(movie_id, completed_qualities)
+            create_master_playlist(movie_id, completed_qualities, movie.get_quality_settings(), shared_audio)
         
         # Update movie status
         if len(completed_qualities) == len(target_qualities):
@@ -130,6 +281,7 @@ def convert_video_task(self, movie_id):
             movie.status = 'ERROR'
             movie.error_message = 'All quality conversions failed'
         
+        movie.owner = None
         movie.completed_at = datetime.now()
         movie.overall_progress = 100
         db.session.commit()
@@ -150,7 +302,7 @@ def convert_video_task(self, movie_id):
             'progress': 100
         })
         
-        # Process next item in queue
+        # Start whatever the freed slot allows
         process_next_in_queue()
         
         return {
@@ -160,98 +312,237 @@ def convert_video_task(self, movie_id):
         }
         
     except Exception as e:
-        print(f"Error in convert_video_task for {movie_id}: {e}")
+        print(f"Error in finalize_conversion_task for {movie_id}: {e}")
+        fail_conversion(movie_id, str(e))
+        return {'error': str(e)}
+    finally:
+        ACTIVE_MOVIES.discard(movie_id)
+
+@celery.task
+def conversion_failed_task(request, exc, traceback, movie_id, owner):
+    """Error callback of a conversion's chord: an encode or the finalizer failed, so the conversion ends as ERROR"""
+    movie = db.session.get(Movie, movie_id)
+    if not movie or movie.status != 'IN_PROGRESS' or movie.owner != owner:
+        return {'skipped': 'Conversion already ended or was requeued'}
+    print(f"Conversion of {movie_id} failed in task {request.id}: {exc}")
+    fail_conversion(movie_id, f'Conversion task failed: {exc}')
+    return {'error': str(exc)}
+
+def fail_conversion(movie_id, error):
+    """Mark a conversion as failed, free its queue slot and start the next one"""
+    db.session.rollback()
+    movie = db.session.get(Movie, movie_id)
+    if movie:
+        movie.status = 'ERROR'
+        movie.error_message = error
+        movie.owner = None
+        movie.completed_at = datetime.now()
+        db.session.commit()
         
-        # Update movie status to error
-        movie = db.session.get(Movie, movie_id)
-        if movie:
-            movie.status = 'ERROR'
-            movie.error_message = str(e)
-            movie.completed_at = datetime.now()
+        # Remove from queue
+        queue_entry = ConversionQueue.query.filter_by(movie_id=movie_id).first()
+        if queue_entry:
+            db.session.delete(queue_entry)
             db.session.commit()
-            
-            # Remove from queue
-            queue_entry = ConversionQueue.query.filter_by(movie_id=movie_id).first()
-            if queue_entry:
-                db.session.delete(queue_entry)
-                db.session.commit()
-            
-            socketio.emit('status_update', {
-                'movie_id': movie_id,
-                'status': 'ERROR',
-                'error': str(e)
-            })
         
-        # Process next item in queue
-        process_next_in_queue()
+        socketio.emit('status_update', {
+            'movie_id': movie_id,
+            'status': 'ERROR',
+            'error': error
+        })
+    
+    # Process next item in queue
+    process_next_in_queue()
+
+def convert_ladder(movie, qualities, video_info, chunked=False, mux_audio=True, cores=None):
+    """Convert all qualities in a single ffmpeg run that decodes the source once, on cores threads if given"""
+    variants = {
+        variant.quality: variant
+        for variant in QualityVariant.query.filter_by(movie_id=movie.id).all()
+        if variant.quality in qualities
+    }
+    for variant in variants.values():
+        variant.status = 'IN_PROGRESS'
+    db.session.commit()
+    
+    output_dir = Config.OUTPUT_FOLDER / movie.id
+    
+    # A single pass continues where every rendition's verified checkpoint ends,
+    # chunks are written to a scratch folder and always start over
+    verified = {
+        quality: verify_checkpoint(output_dir / quality, variants[quality].get_checkpoint(),
+                                   resumable=Config.HLS_SEGMENT_FORMAT == 'ts')
+        for quality in qualities
+    }
+    resume = (0, 0) if chunked else resume_point(verified)
+    for quality in qualities:
+        reset_to_checkpoint(output_dir / quality, verified[quality]['entries'][:resume[0]])
+    if resume[0]:
+        print(f"Resuming ladder of {movie.id} at segment {resume[0]} ({resume[1]}s)")
+    
+    sampler = EncodeSampler(EncodeSample, movie.id, output_dir, Config.ENCODE_SAMPLE_INTERVAL)
+    progress_writer = ProgressWriter(db.session, Config.PROGRESS_FLUSH_INTERVAL)
+    playlist_watcher = PlaylistWatcher()
+    
+    def on_progress(rendition_progress, stats):
+        for quality, progress in rendition_progress.items():
+            variants[quality].progress = int(progress)
+            if playlist_watcher.changed(output_dir / quality):
+                variants[quality].set_checkpoint(checkpoint_for(output_dir / quality))
+        movie.set_quality_progress({q: int(p) for q, p in rendition_progress.items()})
+        with db.session.no_autoflush:
+            movie.update_overall_progress()
+        sample = sampler.sample('+'.join(qualities), stats, force=min(rendition_progress.values()) >= 100)
+        if sample:
+            db.session.add(sample)
+        progress_writer.changed()
         
-        return {'error': str(e)}
+        socketio.emit('status_update', {
+            'movie_id': movie.id,
+            'status': 'IN_PROGRESS',
+            'progress': movie.overall_progress,
+            'quality_progress': movie.get_quality_progress(),
+            'fps': stats.get('fps'),
+            'speed': stats.get('speed')
+        })
+    
+    total_duration = video_info['duration'] if video_info else 0
+    has_audio = mux_audio and (video_info.get('has_audio', True) if video_info else True)
+    quality_settings = movie.get_quality_settings()
+    try:
+        if chunked:
+            # Parallel keyframe-aligned chunks, each chunk still decoded once
+            result = encode_chunked(
+                movie.file_path,
+                output_dir,
+                qualities,
+                quality_settings,
+                Config.SEGMENT_DURATION,
+                total_duration,
+                has_audio=has_audio,
+                chunk_segments=Config.CHUNK_SEGMENTS,
+                max_workers=min(Config.CHUNK_WORKERS, cores or Config.CHUNK_WORKERS),
+                cpu_budget=cores,
+                on_progress=on_progress
+            )
+        else:
+            result = encode_ladder(
+                movie.file_path,
+                output_dir,
+                qualities,
+                quality_settings,
+                Config.SEGMENT_DURATION,
+                total_duration=total_duration,
+                has_audio=has_audio,
+                on_progress=on_progress,
+                segment_format=Config.HLS_SEGMENT_FORMAT,
+                resume=resume if resume[0] else None,
+                threads=encoder_threads(cores, len(qualities)) if cores else None
+            )
+    except Exception as e:
+        print(f"Error in ladder encode for {movie.id}: {e}")
+        result = {'completed': [], 'failed': list(qualities)}
+    
+    for quality in result['completed']:
+        variant = variants[quality]
+        variant.status = 'DONE'
+        variant.progress = 100
+        variant.completed_at = datetime.now()
+        variant.file_path = str(output_dir / quality / 'playlist.m3u8')
+        variant.set_checkpoint(checkpoint_for(output_dir / quality, done=True))
+    
+    # Failed renditions go back to PENDING and are retried one by one, from their checkpoint
+    for quality in result['failed']:
+        variants[quality].status = 'PENDING'
+        variants[quality].progress = 0
+    db.session.commit()
+    
+    return result['completed']
 
-def convert_quality(movie, quality, task):
-    """Convert video to specific quality"""
+def convert_quality(movie, quality, task, total_duration=0, mux_audio=True, cores=None):
+    """Convert video to specific quality, on cores threads if given"""
     try:
-        quality_config = Config.QUALITIES[quality]
+        quality_config = movie.get_quality_settings()[quality]
         output_dir = Config.OUTPUT_FOLDER / movie.id / quality
-        playlist_path = output_dir / 'playlist.m3u8'
+        variant = QualityVariant.query.filter_by(
+            movie_id=movie.id,
+            quality=quality
+        ).first()
+        
+        # Continue from the last complete segment an earlier attempt (or the ladder run) wrote
+        checkpoint = verify_checkpoint(output_dir, variant.get_checkpoint() if variant else None,
+                                       resumable=Config.HLS_SEGMENT_FORMAT == 'ts')
+        start_number, start = resume_point({quality: checkpoint})
+        reset_to_checkpoint(output_dir, checkpoint['entries'])
+        playlist_path = output_dir / (RESUME_PLAYLIST if start_number else PLAYLIST_NAME)
+        resume_args = {'output_ts_offset': start, 'start_number': start_number} if start_number else {}
         
         # Build FFmpeg command
-        input_stream = ffmpeg.input(movie.file_path)
+        input_stream = ffmpeg.input(movie.file_path, **({'ss': start} if start_number else {}))
         
-        # Video filters and encoding
-        video_stream = input_stream.video.filter(
-            'scale', quality_config['resolution']
-        ).output(
+        # Video filters and encoding, audio only when there is no shared audio rendition
+        streams = [input_stream.video.filter('scale', quality_config['resolution'])]
+        audio_args = {}
+        if mux_audio:
+            streams.append(input_stream.audio)
+            audio_args = {'acodec': 'aac', 'audio_bitrate': AUDIO_BITRATE}
+        video_stream = ffmpeg.output(
+            *streams,
             str(playlist_path),
             vcodec='libx264',
             video_bitrate=quality_config['bitrate'],
-            acodec='aac',
-            audio_bitrate='128k',
-            format='hls',
-            hls_time=Config.SEGMENT_DURATION,
-            hls_playlist_type='vod',
-            hls_segment_filename=str(output_dir / 'segment_%03d.ts')
+            **audio_args,
+            **hls_output_options(output_dir, Config.SEGMENT_DURATION, Config.HLS_SEGMENT_FORMAT),
+            **resume_args,
+            **({'threads': cores} if cores else {})
         )
         
-        # Run FFmpeg with progress tracking
-        process = ffmpeg.run_async(
-            video_stream,
-            pipe_stderr=True,
-            overwrite_output=True
-        )
+        sampler = EncodeSampler(EncodeSample, movie.id, output_dir.parent, Config.ENCODE_SAMPLE_INTERVAL)
+        progress_writer = ProgressWriter(db.session, Config.PROGRESS_FLUSH_INTERVAL)
+        playlist_watcher = PlaylistWatcher()
         
-        # Track progress (simplified - in production you'd parse FFmpeg output)
-        while True:
-            output = process.stderr.readline()
-            if output == b'' and process.poll() is not None:
-                break
+        def on_progress(percent, stats):
+            if percent is None or not variant:
+                return
+            variant.progress = int(percent)
+            if playlist_watcher.changed(output_dir):
+                variant.set_checkpoint(checkpoint_for(output_dir))
+            # Other renditions may be encoding on other workers, their progress is only in the database
+            with db.session.no_autoflush:
+                quality_progress = dict(db.session.query(QualityVariant.quality, QualityVariant.progress)
+                                        .filter_by(movie_id=movie.id))
+            quality_progress[quality] = variant.progress
+            movie.set_quality_progress(quality_progress)
+            movie.overall_progress = sum(quality_progress.values()) // len(quality_progress)
+            sample = sampler.sample(quality, stats, force=stats['done'])
+            if sample:
+                db.session.add(sample)
+            progress_writer.changed()
             
-            if output:
-                line = output.decode('utf-8').strip()
-                # Parse progress from FFmpeg output (simplified)
-                if 'time=' in line:
-                    # Extract time and calculate progress
-                    # This is a simplified version - you'd want more robust parsing
-                    pass
-        
-        # Wait for process to complete
-        return_code = process.wait()
-        
-        if return_code == 0:
+            socketio.emit('status_update', {
+                'movie_id': movie.id,
+                'status': 'IN_PROGRESS',
+                'progress': movie.overall_progress,
+                'current_quality': quality,
+                'quality_progress': quality_progress,
+                'fps': stats.get('fps'),
+                'speed': stats.get('speed')
+            })
+        
+        # Run FFmpeg with progress reported on its -progress pipe
+        result = run_ffmpeg(video_stream.compile(overwrite_output=True), total_duration, on_progress, offset=start)
+        
+        if (result['returncode'] == 0 and (not start_number or merge_resumed(output_dir))
+                and finalize_playlist(output_dir / PLAYLIST_NAME)):
             # Update variant with file info
-            variant = QualityVariant.query.filter_by(
-                movie_id=movie.id,
-                quality=quality
-            ).first()
-            
             if variant:
-                variant.file_path = str(playlist_path)
-                # Count segments
-                segment_files = list(output_dir.glob('segment_*.ts'))
-                variant.segment_count = len(segment_files)
+                variant.file_path = str(output_dir / PLAYLIST_NAME)
+                variant.set_checkpoint(checkpoint_for(output_dir, done=True))
                 db.session.commit()
             
             return True
         else:
+            print(f"FFmpeg failed for {quality} of {movie.id}: {' | '.join(result['stderr_tail'][-5:])}")
             return False
             
     except Exception as e:
@@ -259,53 +550,243 @@ def convert_quality(movie, quality, task):
         return False
 
 def process_next_in_queue():
-    """Process the next movie in the conversion queue"""
+    """Start queued movies while fewer than MAX_ACTIVE_CONVERSIONS run across the cluster"""
     try:
-        # Get next item in queue
-        next_item = ConversionQueue.query.order_by(ConversionQueue.position).first()
-        
-        if next_item:
+        # Next items in queue (priority, aging and queue policy decide)
+        for entry in ConversionQueue.get_scheduled():
+            if not entry.dispatch(Config.MAX_ACTIVE_CONVERSIONS):
+                break
             # Start conversion
-            convert_video_task.delay(next_item.movie_id)
+            convert_video_task.delay(entry.movie_id)
             
     except Exception as e:
         print(f"Error processing next in queue: {e}")
 
+def ingest_video_files(video_files, retry=True):
+    """
+    Add Movie rows for files that are not known yet and return them.
+    
+    Known filenames are loaded in one query and all new movies are inserted
+    in a single transaction.
+    """
+    known_filenames = {filename for (filename,) in db.session.query(Movie.filename)}
+    
+    new_files = []
+    for file_info in video_files:
+        if file_info['filename'] not in known_filenames:
+            known_filenames.add(file_info['filename'])
+            new_files.append(file_info)
+    
+    if not new_files:
+        return []
+    
+    movie_ids = Movie.generate_movie_ids(len(new_files))
+    new_movies = []
+    for movie_id, file_info in zip(movie_ids, new_files):
+        # Create new movie entry
+        movie = Movie(
+            id=movie_id,
+            filename=file_info['filename'],
+            file_path=file_info['file_path'],
+            file_size=file_info['file_size'],
+            created_at=datetime.now()
+        )
+        
+        if file_info['video_info']:
+            movie.source_resolution = file_info['video_info']['resolution']
+        
+        new_movies.append(movie)
+    
+    # Serialize before committing so no per-movie reload is needed
+    new_movie_events = [movie.to_dict() for movie in new_movies]
+    
+    db.session.add_all(new_movies)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent scan inserted some of these meanwhile, or another process
+        # allocated one of the time-ordered IDs; the retry takes new IDs
+        db.session.rollback()
+        if not retry:
+            raise
+        return ingest_video_files(video_files, retry=False)
+    
+    # Emit new movie events
+    for event in new_movie_events:
+        socketio.emit('new_movie', event)
+    
+    return new_movies
+
+def enqueue_movie(movie, priority=0):
+    """
+    Queue a movie for conversion and start it right away if nothing is running.
+    
+    Returns (queue_position, started).
+    """
+    # Scans cached the probe, so the cost estimate needs no ffprobe run
+    cached = db.session.get(ProbeCache, movie.file_path)
+    queue_entry = ConversionQueue(
+        movie_id=movie.id,
+        position=ConversionQueue.get_next_position(),
+        priority=priority,
+        cost=estimate_cost(cached.get_video_info() if cached else None, len(movie.get_target_qualities()))
+    )
+    db.session.add(queue_entry)
+    movie.status = 'QUEUED'
+    db.session.commit()
+    
+    process_next_in_queue()
+    
+    return ConversionQueue.get_queue_positions().get(movie.id), queue_entry.dispatched_at is not None
+
 @celery.task
 def scan_input_folder_task():
     """Task to scan input folder for new files"""
     from app.utils import scan_input_folder
     
     try:
-        video_files = scan_input_folder()
-        new_files = 0
-        
-        for file_info in video_files:
-            # Check if movie already exists
-            existing_movie = Movie.query.filter_by(
-                filename=file_info['filename']
-            ).first()
-            
-            if not existing_movie:
-                # Create new movie entry
-                movie = Movie(
-                    filename=file_info['filename'],
-                    file_path=file_info['file_path'],
-                    file_size=file_info['file_size']
-                )
-                
-                if file_info['video_info']:
-                    movie.source_resolution = file_info['video_info']['resolution']
-                
-                db.session.add(movie)
-                db.session.commit()
-                new_files += 1
-                
-                # Emit new movie event
-                socketio.emit('new_movie', movie.to_dict())
+        video_files, scan_stats = scan_input_folder()
+        new_movies = ingest_video_files(video_files)
+        
+        if Config.WATCH_AUTO_CONVERT:
+            for movie in new_movies:
+                enqueue_movie(movie)
         
-        return {'scanned_files': len(video_files), 'new_files': new_files}
+        return {'scanned_files': len(video_files), 'new_files': len(new_movies), 'scan_stats': scan_stats}
         
     except Exception as e:
         print(f"Error scanning input folder: {e}")
         return {'error': str(e)}
+
+@celery.task
+def ingest_file_task(file_path):
+    """Task to register a single file reported by the watch folder"""
+    from app.utils import describe_video_file
+    
+    try:
+        new_movies = ingest_video_files([describe_video_file(Path(file_path))])
+        
+        if Config.WATCH_AUTO_CONVERT:
+            for movie in new_movies:
+                enqueue_movie(movie)
+        
+        return {'new_files': len(new_movies)}
+        
+    except Exception as e:
+        print(f"Error ingesting {file_path}: {e}")
+        return {'error': str(e)}
+
+@celery.task
+def remove_file_task(file_path):
+    """Task to forget a file that was deleted or moved out of the INPUT folder"""
+    try:
+        ProbeCache.query.filter_by(file_path=file_path).delete()
+        
+        # Converted movies keep their row and output, only unconverted ones go away
+        movie = Movie.query.filter_by(file_path=file_path).first()
+        removed = bool(movie and movie.status == 'NEW')
+        if removed:
+            db.session.delete(movie)
+        db.session.commit()
+        
+        return {'removed': removed}
+        
+    except Exception as e:
+        print(f"Error removing {file_path}: {e}")
+        return {'error': str(e)}
+
+# Movies a task of this worker process is working on right now; only their leases
+# are renewed, so a conversion whose tasks were all lost stops renewing and is requeued
+ACTIVE_MOVIES = set()
+
+def ensure_heartbeat():
+    """Renew the leases of this worker process's conversions in the background (once per process)"""
+    if getattr(ensure_heartbeat, 'pid', None) == os.getpid():
+        return
+    ensure_heartbeat.pid = os.getpid()
+    app = current_app._get_current_object()
+    
+    def renew():
+        with app.app_context():
+            renew_leases(db.session, Movie, owner=None, movie_ids=list(ACTIVE_MOVIES))
+    
+    start_periodic(renew, Config.HEARTBEAT_INTERVAL, 'lease-heartbeat')
+
+def encodes_waiting(movie):
+    """
+    Whether a conversion still has encodes waiting for a worker, within ENCODE_START_TIMEOUT of its dispatch.
+    
+    Nothing renews the lease of an encode that has not started yet.
+    """
+    queue_entry = ConversionQueue.query.filter_by(movie_id=movie.id).first()
+    if not queue_entry or not queue_entry.dispatched_at:
+        return False
+    if queue_entry.dispatched_at < time.time() - Config.ENCODE_START_TIMEOUT:
+        return False
+    return QualityVariant.query.filter_by(movie_id=movie.id, status='PENDING').first() is not None
+
+def reconcile_jobs():
+    """
+    Requeue conversions whose worker died and fill the free conversion slots.
+    
+    A conversion is requeued once none of its tasks renewed its lease for
+    JOB_LEASE_SECONDS, unless encodes are still waiting for a worker;
+    encodes that did not start within ENCODE_START_TIMEOUT are taken as
+    lost too. Leftover ffmpeg processes of a dead conversion on this host
+    are killed first; the requeued movie goes to the front of the queue and
+    resumes from its checkpoints.
+    """
+    for movie in stale_movies(db.session, Movie, Config.JOB_LEASE_SECONDS):
+        if encodes_waiting(movie):
+            continue
+        killed = kill_orphaned_encoders(movie)
+        print(f"Requeueing {movie.id}, its owner {movie.owner or '(none)'} is gone"
+              + (f", killed orphaned ffmpeg {killed}" if killed else ''))
+        movie.status = 'QUEUED'
+        movie.owner = None
+        movie.heartbeat_at = None
+        queue_entry = ConversionQueue.query.filter_by(movie_id=movie.id).first()
+        if queue_entry:
+            queue_entry.dispatched_at = None
+        else:
+            db.session.add(ConversionQueue(movie_id=movie.id, position=ConversionQueue.get_front_position()))
+        db.session.commit()
+        
+        socketio.emit('status_update', {
+            'movie_id': movie.id,
+            'status': 'QUEUED',
+            'progress': movie.overall_progress or 0
+        })
+    
+    # Dispatched conversions no worker took up within a lease (lost task messages) can be dispatched again,
+    # convert_video_task's lease keeps a late duplicate from encoding twice
+    for queue_entry in ConversionQueue.get_lost_dispatches(Config.JOB_LEASE_SECONDS):
+        print(f"Dispatching {queue_entry.movie_id} again, no worker started it")
+        queue_entry.dispatched_at = None
+    db.session.commit()
+    
+    process_next_in_queue()
+
+def start_job_reconciler(app):
+    """Reconcile now and then every RECONCILE_INTERVAL seconds"""
+    def reconcile():
+        with app.app_context():
+            reconcile_jobs()
+    
+    reconcile()
+    return start_periodic(reconcile, Config.RECONCILE_INTERVAL, 'job-reconciler')
+
+def start_watch_folder():
+    """Start the watch folder service, handing its events to Celery tasks"""
+    service = WatchFolderService(
+        Config.INPUT_FOLDER,
+        Config.SUPPORTED_FORMATS,
+        on_ready=lambda path: ingest_file_task.delay(str(path)),
+        on_removed=lambda path: remove_file_task.delay(str(path)),
+        on_reconcile=lambda: scan_input_folder_task.delay(),
+        recursive=False,  # scan_input_folder only looks at the top level
+        settle_seconds=Config.WATCH_SETTLE_SECONDS,
+        reconcile_interval=Config.WATCH_RECONCILE_INTERVAL
+    )
+    service.start()
+    return service
@@ -1,7 +1,15 @@
 import os
 import ffmpeg
 from pathlib import Path
+from datetime import datetime
+import time
 from config import Config
+from probe_engine import probe_files
+from ladder_analysis import parse_bitrate
+from hls_encoder import AUDIO_BITRATE, AUDIO_GROUP_ID, PLAYLIST_VERSIONS, audio_media_tag
+from app import db
+from app.models import ProbeCache, ProbeLatency
+from metrics import record_probe_latencies
 
 def get_video_info(file_path):
     """Get video information using ffprobe"""
@@ -13,13 +21,15 @@ def get_video_info(file_path):
             width = int(video_stream['width'])
             height = int(video_stream['height'])
             duration = float(probe['format']['duration'])
+            has_audio = any(stream['codec_type'] == 'audio' for stream in probe['streams'])
             
             return {
                 'resolution': f"{width}x{height}",
                 'width': width,
                 'height': height,
                 'duration': duration,
-                'format': probe['format']['format_name']
+                'format': probe['format']['format_name'],
+                'has_audio': has_audio
             }
     except Exception as e:
         print(f"Error getting video info for {file_path}: {e}")
@@ -49,32 +59,123 @@ def format_duration(seconds):
     else:
         return f"{minutes:02d}:{seconds:02d}"
 
+def update_probe_cache(file_path, stat, video_info, probe_cache):
+    """Store a fresh probe result for a new or changed file"""
+    cached = probe_cache.get(file_path)
+    if not cached:
+        cached = ProbeCache(file_path=file_path)
+        db.session.add(cached)
+        probe_cache[file_path] = cached
+    cached.file_size = stat.st_size
+    cached.mtime_ns = stat.st_mtime_ns
+    cached.set_video_info(video_info)
+    cached.probed_at = datetime.now()
+
+def describe_video_file(file_path):
+    """Stat and probe (through the probe cache) a single file in the INPUT folder"""
+    stat = file_path.stat()
+    probe_cache = {entry.file_path: entry for entry in ProbeCache.query.filter_by(file_path=str(file_path))}
+    cached = probe_cache.get(str(file_path))
+    
+    if cached and cached.matches(stat.st_size, stat.st_mtime_ns):
+        video_info = cached.get_video_info()
+    else:
+        latencies = []
+        probe_results, _ = probe_files(
+            [str(file_path)],
+            probesize=Config.PROBE_SIZE,
+            analyzeduration=Config.PROBE_ANALYZE_DURATION,
+            timeout=Config.PROBE_TIMEOUT,
+            on_latency=latencies.append
+        )
+        record_probe_latencies(db.session, ProbeLatency, latencies)
+        video_info = probe_results[str(file_path)]
+        update_probe_cache(str(file_path), stat, video_info, probe_cache)
+        db.session.commit()
+    
+    return {
+        'filename': file_path.name,
+        'file_path': str(file_path),
+        'file_size': stat.st_size,
+        'video_info': video_info
+    }
+
 def scan_input_folder():
-    """Scan INPUT folder for new video files"""
+    """
+    Scan INPUT folder for new video files.
+    
+    Returns (video_files, scan_stats); only new or changed files are probed,
+    in parallel, and scan_stats reports the scan throughput.
+    """
     input_folder = Config.INPUT_FOLDER
     supported_formats = Config.SUPPORTED_FORMATS
     
     video_files = []
+    scan_start_time = time.time()
     
     if not input_folder.exists():
-        return video_files
+        return video_files, {}
+    
+    # Load the whole probe cache in one query
+    probe_cache = {entry.file_path: entry for entry in ProbeCache.query.all()}
     
+    candidates = []
     for file_path in input_folder.iterdir():
         if file_path.is_file() and file_path.suffix.lower() in supported_formats:
             try:
-                file_size = file_path.stat().st_size
-                video_info = get_video_info(str(file_path))
-                
-                video_files.append({
-                    'filename': file_path.name,
-                    'file_path': str(file_path),
-                    'file_size': file_size,
-                    'video_info': video_info
-                })
+                candidates.append((file_path, file_path.stat()))
             except Exception as e:
                 print(f"Error processing file {file_path}: {e}")
     
-    return video_files
+    # Probe only new or changed files, in parallel
+    stale_paths = [
+        str(file_path) for file_path, stat in candidates
+        if not (str(file_path) in probe_cache
+                and probe_cache[str(file_path)].matches(stat.st_size, stat.st_mtime_ns))
+    ]
+    latencies = []
+    probe_results, scan_stats = probe_files(
+        stale_paths,
+        max_workers=Config.PROBE_WORKERS,
+        probesize=Config.PROBE_SIZE,
+        analyzeduration=Config.PROBE_ANALYZE_DURATION,
+        timeout=Config.PROBE_TIMEOUT,
+        on_latency=latencies.append
+    )
+    record_probe_latencies(db.session, ProbeLatency, latencies)
+    
+    for file_path, stat in candidates:
+        try:
+            if str(file_path) in probe_results:
+                video_info = probe_results[str(file_path)]
+                update_probe_cache(str(file_path), stat, video_info, probe_cache)
+            else:
+                video_info = probe_cache[str(file_path)].get_video_info()
+            
+            video_files.append({
+                'filename': file_path.name,
+                'file_path': str(file_path),
+                'file_size': stat.st_size,
+                'video_info': video_info
+            })
+        except Exception as e:
+            print(f"Error processing file {file_path}: {e}")
+    
+    # Forget files that are no longer in the INPUT folder
+    seen_paths = {str(file_path) for file_path, _ in candidates}
+    for path, entry in probe_cache.items():
+        if path not in seen_paths:
+            db.session.delete(entry)
+    db.session.commit()
+    
+    elapsed = time.time() - scan_start_time
+    scan_stats['scanned_files'] = len(video_files)
+    scan_stats['scan_seconds'] = round(elapsed, 3)
+    scan_stats['files_per_second'] = round(len(video_files) / elapsed, 1) if elapsed > 0 else 0
+    print(f"Scanned {len(video_files)} files in {elapsed:.2f}s ({scan_stats['files_per_second']} files/s), "
+          f"probed {scan_stats['probed_files']} ({scan_stats['probe_files_per_second']} files/s)")
+    
+    return video_files, scan_stats
 
 def create_output_directory(movie_id):
     """Create output directory structure for a movie"""
@@ -88,24 +189,30 @@ def create_output_directory(movie_id):
     
     return output_dir
 
-def create_master_playlist(movie_id, qualities):
+def create_master_playlist(movie_id, qualities, quality_settings=None, shared_audio=False):
     """Create master HLS playlist for adaptive streaming"""
     output_dir = Config.OUTPUT_FOLDER / movie_id
     master_playlist_path = output_dir / 'master.m3u8'
     
-    playlist_content = "#EXTM3U\n#EXT-X-VERSION:3\n"
+    playlist_content = f"#EXTM3U\n#EXT-X-VERSION:{PLAYLIST_VERSIONS[Config.HLS_SEGMENT_FORMAT]}\n"
     
-    # Quality settings for bitrates
-    quality_settings = {
-        '720p': {'bandwidth': 2500000, 'resolution': '1280x720'},
-        '480p': {'bandwidth': 1000000, 'resolution': '854x480'},
-        '360p': {'bandwidth': 600000, 'resolution': '640x360'}
-    }
+    # Video-only renditions all play the one audio rendition
+    stream_audio = ''
+    audio_bandwidth = 0
+    if shared_audio:
+        playlist_content += audio_media_tag()
+        stream_audio = f',AUDIO="{AUDIO_GROUP_ID}"'
+        audio_bandwidth = parse_bitrate(AUDIO_BITRATE)
+    
+    # BANDWIDTH is the bitrate each rendition was encoded with
+    quality_settings = quality_settings or Config.QUALITIES
     
     for quality in qualities:
         if quality in quality_settings:
             settings = quality_settings[quality]
-            playlist_content += f"#EXT-X-STREAM-INF:BANDWIDTH={settings['bandwidth']},RESOLUTION={settings['resolution']}\n"
+            bandwidth = parse_bitrate(settings['bitrate']) + audio_bandwidth
+            resolution = settings['resolution'].replace(':', 'x')
+            playlist_content += f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={resolution}{stream_audio}\n"
             playlist_content += f"{quality}/playlist.m3u8\n"
     
     with open(master_playlist_path, 'w') as f:
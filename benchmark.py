@@ -0,0 +1,339 @@
+"""
+Encode benchmark for the HLS conversion pipelines.
+
+Generates deterministic test sources with ffmpeg's testsrc2/sine, runs them
+through the real convert_video_simple (simple mode) and convert_quality
+(Celery mode) code paths and records wall time, CPU time, peak RSS,
+realtime factor and output size per rendition as JSON.
+
+    python benchmark.py run --output baseline.json
+    python benchmark.py run --sources 720p:30,1080p:60 --pipelines simple --output current.json
+    python benchmark.py compare baseline.json current.json
+
+Every case runs in its own Python process, so peak RSS and CPU time
+belong to that case only and each run starts from an empty database.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows: no rusage, CPU time and peak RSS are reported as null
+    resource = None
+
+BASE_DIR = Path(__file__).parent
+SOURCE_SIZES = {
+    '360p': '640x360',
+    '480p': '854x480',
+    '720p': '1280x720',
+    '1080p': '1920x1080',
+}
+DEFAULT_SOURCES = '480p:20,720p:30,1080p:30'
+DEFAULT_PIPELINES = 'simple,celery'
+CELERY_QUALITIES = ['720p', '480p', '360p']
+
+
+def parse_sources(value):
+    """Parse '720p:30,1080p:60' into [(size name, seconds)]"""
+    sources = []
+    for item in value.split(','):
+        name, _, duration = item.strip().partition(':')
+        if name not in SOURCE_SIZES:
+            raise ValueError(f"Unknown source size {name}, use one of {', '.join(SOURCE_SIZES)}")
+        sources.append((name, int(duration or 30)))
+    return sources
+
+
+def generate_source(sources_dir, name, duration):
+    """Create (once) a bit-exact testsrc2 + sine source of the given size and length"""
+    path = Path(sources_dir) / f"testsrc2_{name}_{duration}s.mp4"
+    if path.exists():
+        return path
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    args = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'lavfi', '-i', f"testsrc2=size={SOURCE_SIZES[name]}:rate=25:duration={duration}",
+        '-f', 'lavfi', '-i', f"sine=frequency=440:sample_rate=48000:duration={duration}",
+        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-threads', '1',
+        '-c:a', 'aac', '-b:a', '128k',
+        '-flags', '+bitexact', '-fflags', '+bitexact', '-map_metadata', '-1',
+        str(path.with_suffix('.tmp.mp4'))
+    ]
+    subprocess.run(args, check=True)
+    os.replace(path.with_suffix('.tmp.mp4'), path)
+    return path
+
+
+def ffmpeg_version():
+    try:
+        output = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout
+        return output.splitlines()[0] if output else None
+    except OSError:
+        return None
+
+
+def rendition_sizes(movie_output_dir):
+    """Bytes written per rendition directory"""
+    from metrics import directory_size
+
+    movie_output_dir = Path(movie_output_dir)
+    if not movie_output_dir.exists():
+        return {}
+    return {
+        quality_dir.name: directory_size([quality_dir])
+        for quality_dir in sorted(movie_output_dir.iterdir())
+        if quality_dir.is_dir() and not quality_dir.name.startswith('.')
+    }
+
+
+def usage_snapshot():
+    if resource is None:
+        return None
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'cpu': own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        'maxrss_kb': max(own.ru_maxrss, children.ru_maxrss) // (1024 if sys.platform == 'darwin' else 1)
+    }
+
+
+def run_simple_case(case, workdir):
+    """Convert one source with simple_run.convert_video_simple"""
+    os.environ['SIMPLE_DATABASE_PATH'] = str(workdir / 'simple.db')
+    os.environ['INPUT_FOLDER'] = str(workdir / 'INPUT')
+    os.environ['OUTPUT_FOLDER'] = str(workdir / 'OUTPUT')
+    if case.get('encode_mode'):
+        os.environ['ENCODE_MODE'] = case['encode_mode']
+    import simple_run
+
+    source = Path(case['source_path'])
+    with simple_run.app.app_context():
+        simple_run.db.create_all()
+        movie = simple_run.Movie(
+            id=simple_run.Movie.generate_movie_id(),
+            filename=source.name,
+            file_path=str(source),
+            file_size=source.stat().st_size,
+            source_resolution=SOURCE_SIZES[case['source']]
+        )
+        simple_run.db.session.add(movie)
+        simple_run.db.session.commit()
+        movie_id = movie.id
+        output_dir = simple_run.OUTPUT_FOLDER / movie.get_output_folder_name()
+
+    before = usage_snapshot()
+    start_time = time.perf_counter()
+    simple_run.convert_video_simple(movie_id)
+    wall = time.perf_counter() - start_time
+    after = usage_snapshot()
+
+    with simple_run.app.app_context():
+        status = simple_run.db.session.get(simple_run.Movie, movie_id).status
+    return wall, before, after, status, rendition_sizes(output_dir)
+
+
+def run_celery_case(case, workdir):
+    """Convert one source to one quality with app.tasks.convert_quality"""
+    os.environ['DATABASE_URL'] = f"sqlite:///{workdir / 'celery.db'}"
+    os.environ['INPUT_FOLDER'] = str(workdir / 'INPUT')
+    os.environ['OUTPUT_FOLDER'] = str(workdir / 'OUTPUT')
+    os.environ['WATCH_INPUT'] = '0'
+    from app import create_app, db
+    from app.models import Movie, QualityVariant
+    from app.tasks import convert_quality
+    from app.utils import create_output_directory
+    from config import Config
+
+    app = create_app()
+    Config.init_app(app)
+    source = Path(case['source_path'])
+    quality = case['rendition']
+    with app.app_context():
+        movie = Movie(
+            id=Movie.generate_movie_id(),
+            filename=source.name,
+            file_path=str(source),
+            file_size=source.stat().st_size,
+            source_resolution=SOURCE_SIZES[case['source']]
+        )
+        db.session.add(movie)
+        db.session.add(QualityVariant(movie_id=movie.id, quality=quality, status='IN_PROGRESS'))
+        db.session.commit()
+        output_dir = create_output_directory(movie.id)
+
+        before = usage_snapshot()
+        start_time = time.perf_counter()
+        success = convert_quality(movie, quality, None, case['duration'])
+        wall = time.perf_counter() - start_time
+        after = usage_snapshot()
+
+    sizes = rendition_sizes(output_dir)
+    return wall, before, after, 'DONE' if success else 'ERROR', {quality: sizes.get(quality, 0)}
+
+
+def run_case(case, result_path):
+    """Entry point of the per-case subprocess"""
+    workdir = Path(tempfile.mkdtemp(prefix='hls-bench-'))
+    try:
+        runner = run_simple_case if case['pipeline'] == 'simple' else run_celery_case
+        wall, before, after, status, sizes = runner(case, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = dict(case)
+    result.pop('source_path')
+    result.update({
+        'status': status,
+        'wall_seconds': round(wall, 3),
+        'cpu_seconds': round(after['cpu'] - before['cpu'], 3) if after else None,
+        'peak_rss_kb': after['maxrss_kb'] if after else None,
+        'realtime_factor': round(case['duration'] / wall, 3) if wall > 0 else None,
+        'output_bytes': sum(sizes.values()),
+        'renditions': sizes
+    })
+    with open(result_path, 'w') as f:
+        json.dump(result, f)
+
+
+def case_key(result):
+    return f"{result['pipeline']}/{result.get('encode_mode') or 'default'}/{result['source']}_{result['duration']}s/{result['rendition']}"
+
+
+def plan_cases(sources, pipelines, encode_mode, sources_dir):
+    cases = []
+    for name, duration in sources:
+        source_path = str(generate_source(sources_dir, name, duration))
+        base = {'source': name, 'duration': duration, 'source_path': source_path}
+        if 'simple' in pipelines:
+            cases.append(dict(base, pipeline='simple', encode_mode=encode_mode, rendition='all'))
+        if 'celery' in pipelines:
+            for quality in CELERY_QUALITIES:
+                cases.append(dict(base, pipeline='celery', encode_mode=None, rendition=quality))
+    return cases
+
+
+def run_benchmark(args):
+    sources = parse_sources(args.sources)
+    pipelines = [p.strip() for p in args.pipelines.split(',')]
+    cases = plan_cases(sources, pipelines, args.encode_mode, args.sources_dir)
+
+    results = []
+    for case in cases:
+        runs = []
+        for _ in range(args.repeat):
+            with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+                result_path = f.name
+            try:
+                # Case output (conversion logs) goes to stderr, results to the file
+                subprocess.run([sys.executable, str(Path(__file__).resolve()), 'case', json.dumps(case), result_path],
+                               check=True, cwd=BASE_DIR, stdout=sys.stderr)
+                with open(result_path) as f:
+                    runs.append(json.load(f))
+            finally:
+                os.remove(result_path)
+
+        # Keep the median run by wall time
+        median_wall = statistics.median(run['wall_seconds'] for run in runs)
+        result = min(runs, key=lambda run: abs(run['wall_seconds'] - median_wall))
+        result['repeats'] = len(runs)
+        results.append(result)
+        print(f"{case_key(result):45} {result['wall_seconds']:8.2f}s  "
+              f"x{result['realtime_factor']}  {result['output_bytes']} bytes  {result['status']}")
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'host': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'ffmpeg': ffmpeg_version()
+        },
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+
+def percent_change(old, new):
+    if old in (None, 0) or new is None:
+        return None
+    return (new - old) / old * 100
+
+
+def compare_reports(args):
+    with open(args.baseline) as f:
+        baseline = {case_key(result): result for result in json.load(f)['results']}
+    with open(args.current) as f:
+        current = {case_key(result): result for result in json.load(f)['results']}
+
+    metrics = ['wall_seconds', 'cpu_seconds', 'peak_rss_kb', 'output_bytes']
+    regressions = []
+    print(f"{'case':45} " + ' '.join(f"{metric:>16}" for metric in metrics))
+    for key in sorted(baseline.keys() | current.keys()):
+        if key not in baseline or key not in current:
+            print(f"{key:45} only in {'current' if key in current else 'baseline'}")
+            continue
+        cells = []
+        for metric in metrics:
+            change = percent_change(baseline[key].get(metric), current[key].get(metric))
+            cells.append(f"{change:+15.1f}%" if change is not None else f"{'n/a':>16}")
+            # Time and memory regressions fail the comparison, size changes are informational
+            if metric != 'output_bytes' and change is not None and change > args.threshold:
+                regressions.append(f"{key} {metric} {change:+.1f}%")
+        print(f"{key:45} " + ' '.join(cells))
+
+    if regressions:
+        print(f"\nRegressions above {args.threshold}%:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the HLS encode pipelines')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run the benchmark and write a JSON report')
+    run_parser.add_argument('--sources', default=DEFAULT_SOURCES, help='size:seconds list, e.g. 720p:30,1080p:60')
+    run_parser.add_argument('--pipelines', default=DEFAULT_PIPELINES, help='simple, celery or both')
+    run_parser.add_argument('--encode-mode', choices=['ladder', 'chunked', 'per_quality'],
+                            help='ENCODE_MODE for the simple pipeline (default: its configured mode)')
+    run_parser.add_argument('--repeat', type=int, default=1, help='runs per case, the median is kept')
+    run_parser.add_argument('--sources-dir', default=str(BASE_DIR / 'data' / 'benchmark_sources'))
+    run_parser.add_argument('--output', default='benchmark.json')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare a report against a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=10.0,
+                                help='percent slowdown that counts as a regression')
+
+    case_parser = subparsers.add_parser('case')  # internal: one case in a fresh process
+    case_parser.add_argument('case')
+    case_parser.add_argument('result_path')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run_benchmark(args)
+    elif args.command == 'compare':
+        sys.exit(compare_reports(args))
+    else:
+        run_case(json.loads(args.case), args.result_path)
+
+
+if __name__ == '__main__':
+    main()
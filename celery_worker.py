@@ -1,9 +1,16 @@
+import sys
+
 from app import create_app, make_celery
+from config import Config
+from cpu_budget import HEAVY_QUEUE, LIGHT_QUEUE, worker_concurrency
 
 # Create Flask app and Celery instance
 app = create_app()
 celery = make_celery(app)
 
 if __name__ == '__main__':
-    # Start Celery worker
-    celery.start()
+    # Start Celery worker on WORKER_QUEUES, with as many processes as its CPU budget has job slots
+    queues = [queue.strip() for queue in Config.WORKER_QUEUES.split(',') if queue.strip()]
+    concurrency = worker_concurrency(Config.WORKER_CPU_BUDGET, queues,
+                                     {HEAVY_QUEUE: Config.HEAVY_JOB_CORES, LIGHT_QUEUE: Config.LIGHT_JOB_CORES})
+    celery.worker_main(['worker', '--loglevel=info', '-Q', ','.join(queues), '-c', str(concurrency)] + sys.argv[1:])
@@ -0,0 +1,199 @@
+import math
+import os
+from pathlib import Path
+
+# Checkpoints for resumable conversions.
+#
+# Encodes write EVENT playlists, which ffmpeg rewrites after every finished
+# segment (a VOD playlist is only written once the encode ends), so the
+# files on disk show how far an interrupted encode got. finalize_playlist()
+# turns the playlist of a finished encode into a VOD one. The database
+# keeps one checkpoint per rendition ({'done', 'segments', 'seconds'}), and
+# it is only trusted as far as the files still confirm it. A resumed encode
+# seeks to the end of the last complete segment and writes the rest of the
+# rendition into resume.m3u8; merge_resumed() appends it to the playlist
+# once the encode finished.
+# Kept free of Flask/Celery imports so the simple mode can use it too.
+
+PLAYLIST_NAME = 'playlist.m3u8'
+RESUME_PLAYLIST = 'resume.m3u8'
+EVENT_PLAYLIST_TYPE = '#EXT-X-PLAYLIST-TYPE:EVENT'
+VOD_PLAYLIST_TYPE = '#EXT-X-PLAYLIST-TYPE:VOD'
+
+
+def read_media_playlist(playlist_path):
+    """([(duration, uri)], ended) of a media playlist, ([], False) if it cannot be read"""
+    entries = []
+    ended = False
+    duration = None
+    try:
+        with open(playlist_path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('#EXTINF:'):
+                    duration = float(line[len('#EXTINF:'):].split(',')[0])
+                elif line == '#EXT-X-ENDLIST':
+                    ended = True
+                elif line and not line.startswith('#') and duration is not None:
+                    entries.append((duration, line))
+                    duration = None
+    except (OSError, ValueError):
+        return [], False
+    return entries, ended
+
+
+def write_vod_playlist(playlist_path, entries, ended=True):
+    """Write a VOD media playlist for (duration, uri) entries"""
+    target_duration = math.ceil(max((duration for duration, _ in entries), default=0))
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        f'#EXT-X-TARGETDURATION:{target_duration}',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+        VOD_PLAYLIST_TYPE,
+        '#EXT-X-INDEPENDENT-SEGMENTS',
+    ]
+    for duration, uri in entries:
+        lines.append(f'#EXTINF:{duration:.6f},')
+        lines.append(uri)
+    if ended:
+        lines.append('#EXT-X-ENDLIST')
+
+    with open(playlist_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def finalize_playlist(playlist_path):
+    """Mark the EVENT playlist of a finished encode as VOD, False if it did not end"""
+    playlist_path = Path(playlist_path)
+    try:
+        content = playlist_path.read_text()
+    except OSError:
+        return False
+    if '#EXT-X-ENDLIST' not in content:
+        return False
+    if EVENT_PLAYLIST_TYPE in content:
+        partial_path = playlist_path.with_name(playlist_path.name + '.tmp')
+        partial_path.write_text(content.replace(EVENT_PLAYLIST_TYPE, VOD_PLAYLIST_TYPE))
+        os.replace(partial_path, playlist_path)
+    return True
+
+
+class PlaylistWatcher:
+    """
+    Tells whether a rendition's playlists changed since the last look.
+
+    ffmpeg only rewrites them when a segment is finished, so checkpoints of
+    a running encode are recomputed on new segments instead of on every
+    progress update.
+    """
+
+    def __init__(self):
+        self.signatures = {}
+
+    def changed(self, rendition_dir):
+        rendition_dir = Path(rendition_dir)
+        signature = []
+        for name in (PLAYLIST_NAME, RESUME_PLAYLIST):
+            try:
+                stat = (rendition_dir / name).stat()
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        if self.signatures.get(rendition_dir) == signature:
+            return False
+        self.signatures[rendition_dir] = signature
+        return True
+
+
+def rendition_segments(rendition_dir):
+    """
+    ([(duration, uri)], ended) of the segments a rendition directory holds.
+
+    A resumed part is appended to the playlist's segments. The list stops
+    at the first segment whose file is missing or empty, and ended is only
+    True when every listed segment is there.
+    """
+    rendition_dir = Path(rendition_dir)
+    entries, ended = read_media_playlist(rendition_dir / PLAYLIST_NAME)
+    if (rendition_dir / RESUME_PLAYLIST).exists():
+        resumed, ended = read_media_playlist(rendition_dir / RESUME_PLAYLIST)
+        entries = entries + resumed
+
+    present = []
+    for duration, uri in entries:
+        path = rendition_dir / uri
+        if not path.is_file() or path.stat().st_size == 0:
+            return present, False
+        present.append((duration, uri))
+    return present, ended
+
+
+def checkpoint_for(rendition_dir, done=False):
+    """The checkpoint to store for what a rendition directory holds right now"""
+    entries, ended = rendition_segments(rendition_dir)
+    return {
+        'done': bool(done and ended),
+        'segments': len(entries),
+        'seconds': round(sum(duration for duration, _ in entries), 3)
+    }
+
+
+def verify_checkpoint(rendition_dir, checkpoint, resumable=True):
+    """
+    The part of a stored checkpoint the files still confirm.
+
+    Returns {'done': bool, 'entries': [(duration, uri)]}. A rendition only
+    counts as done when both the checkpoint and the files say so. A partial
+    one keeps at most the checkpointed number of segments, and none when
+    the rendition cannot be resumed (single-file or remuxed output).
+    """
+    checkpoint = checkpoint or {}
+    entries, ended = rendition_segments(rendition_dir)
+    if checkpoint.get('done') and ended:
+        return {'done': True, 'entries': entries}
+    if not resumable:
+        return {'done': False, 'entries': []}
+    return {'done': False, 'entries': entries[:checkpoint.get('segments') or 0]}
+
+
+def resume_point(verified):
+    """
+    (segments, seconds) all the given renditions can resume from.
+
+    Renditions encoded together share their segment boundaries, so the
+    shortest verified prefix is where a joint encode continues.
+    """
+    prefixes = [result['entries'] for result in verified.values()]
+    if not prefixes:
+        return 0, 0.0
+    shortest = min(prefixes, key=len)
+    return len(shortest), round(sum(duration for duration, _ in shortest), 3)
+
+
+def reset_to_checkpoint(rendition_dir, entries):
+    """Keep entries as the finished part of a rendition and delete everything written after them"""
+    rendition_dir = Path(rendition_dir)
+    rendition_dir.mkdir(parents=True, exist_ok=True)
+    keep = {uri for _, uri in entries}
+    for segment in rendition_dir.glob('segment_*.ts'):
+        if segment.name not in keep:
+            segment.unlink()
+    (rendition_dir / RESUME_PLAYLIST).unlink(missing_ok=True)
+    if entries:
+        write_vod_playlist(rendition_dir / PLAYLIST_NAME, entries, ended=False)
+    else:
+        (rendition_dir / PLAYLIST_NAME).unlink(missing_ok=True)
+
+
+def merge_resumed(rendition_dir):
+    """Append a finished resumed part to the rendition's playlist, False if it did not finish"""
+    rendition_dir = Path(rendition_dir)
+    if not (rendition_dir / RESUME_PLAYLIST).exists():
+        return False
+    entries, ended = rendition_segments(rendition_dir)
+    if not ended:
+        return False
+    write_vod_playlist(rendition_dir / PLAYLIST_NAME, entries)
+    (rendition_dir / RESUME_PLAYLIST).unlink()
+    return True
@@ -0,0 +1,193 @@
+import math
+import os
+import shutil
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from checkpoints import read_media_playlist, write_vod_playlist
+from ffmpeg_progress import run_ffmpeg
+from cpu_budget import encoder_threads
+from hls_encoder import build_ladder_command, is_playlist_complete
+
+# Chunked encoding: the source is cut into keyframe-aligned time ranges that
+# are encoded by parallel ffmpeg processes and stitched back into one playlist.
+#
+# The pool is a pool of ffmpeg processes; each one is babysat by a thread so
+# this also works inside daemonic Celery prefork workers, which are not
+# allowed to fork multiprocessing children of their own.
+
+CHUNKS_DIR_NAME = '.chunks'
+
+
+def plan_chunks(total_duration, segment_duration, chunk_segments):
+    """
+    Split a duration into chunks that are whole multiples of the segment duration.
+
+    Keyframes are forced every segment_duration seconds, so every chunk starts
+    on a keyframe and segment boundaries stay where a linear encode puts them.
+    """
+    chunk_duration = segment_duration * chunk_segments
+    chunk_count = max(1, math.ceil(total_duration / chunk_duration))
+
+    chunks = []
+    for index in range(chunk_count):
+        start = index * chunk_duration
+        chunks.append({
+            'index': index,
+            'start': start,
+            'duration': min(chunk_duration, total_duration - start)
+        })
+    return chunks
+
+
+def default_chunk_workers():
+    """Default number of chunks encoded at the same time"""
+    return os.cpu_count() or 1
+
+
+def _encode_chunk(input_path, chunk_dir, chunk, renditions, qualities, segment_duration, has_audio, threads,
+                  on_progress=None):
+    """
+    Encode one time range of the source into its own chunk directory.
+
+    on_progress(stats) receives the -progress stats of the chunk, out_time
+    being relative to the chunk start.
+    """
+    for quality in renditions:
+        (chunk_dir / quality).mkdir(parents=True, exist_ok=True)
+
+    args = build_ladder_command(
+        input_path, chunk_dir, renditions, qualities, segment_duration,
+        has_audio=has_audio,
+        start=chunk['start'],
+        duration=chunk['duration'],
+        threads=threads
+    )
+    # Only errors are kept so the captured stderr stays small
+    args[1:1] = ['-loglevel', 'error']
+
+    def report(percent, stats):
+        if on_progress:
+            on_progress(stats)
+
+    result = run_ffmpeg(args, on_progress=report)
+
+    completed = [q for q in renditions if is_playlist_complete(chunk_dir / q / 'playlist.m3u8')]
+    return {
+        'index': chunk['index'],
+        'completed': completed,
+        'returncode': result['returncode'],
+        'stderr': '\n'.join(result['stderr_tail'])[-2000:]
+    }
+
+
+def stitch_rendition(chunk_dirs, quality_dir):
+    """
+    Move the chunk segments of one rendition into quality_dir with continuous
+    numbering and write a single VOD playlist for them.
+    """
+    quality_dir = Path(quality_dir)
+    quality_dir.mkdir(parents=True, exist_ok=True)
+
+    entries = []
+    for chunk_dir in chunk_dirs:
+        rendition_dir = chunk_dir / quality_dir.name
+        for duration, filename in read_media_playlist(rendition_dir / 'playlist.m3u8')[0]:
+            segment_name = f"segment_{len(entries):03d}.ts"
+            os.replace(rendition_dir / filename, quality_dir / segment_name)
+            entries.append((duration, segment_name))
+
+    write_vod_playlist(quality_dir / 'playlist.m3u8', entries)
+
+    return len(entries)
+
+
+def encode_chunked(input_path, output_dir, renditions, qualities, segment_duration, total_duration,
+                   has_audio=True, chunk_segments=30, max_workers=None, on_progress=None,
+                   progress_interval=2, cpu_budget=None):
+    """
+    Encode every rendition by splitting the source into chunks and encoding
+    the chunks in parallel.
+
+    Progress is the encoded time summed over all chunks, reported through
+    on_progress({quality: percent}, stats) from the calling thread; stats
+    sums fps and speed over the running chunks. The chunks share cpu_budget
+    cores (all of the machine's by default), and each chunk's share is split
+    between its rendition encoders as ffmpeg threads.
+    Returns the same dict shape as hls_encoder.encode_ladder, so callers can
+    fall back to per-rendition encodes for renditions with a failed chunk.
+    """
+    output_dir = Path(output_dir)
+    chunks_root = output_dir / CHUNKS_DIR_NAME
+    if chunks_root.exists():
+        shutil.rmtree(chunks_root)
+
+    chunks = plan_chunks(total_duration, segment_duration, chunk_segments)
+    max_workers = max(1, min(max_workers or default_chunk_workers(), len(chunks)))
+    # -threads applies to every encoder of a chunk's output
+    threads = encoder_threads((cpu_budget or os.cpu_count() or 1) // max_workers, len(renditions))
+    chunk_dirs = [chunks_root / f"{chunk['index']:04d}" for chunk in chunks]
+
+    finished = {quality: 0 for quality in renditions}
+    errors = []
+
+    # Chunk threads only record their latest stats, the callback runs here
+    chunk_stats = {}
+    stats_lock = threading.Lock()
+
+    def record_stats(index, stats):
+        with stats_lock:
+            chunk_stats[index] = stats
+
+    def report():
+        with stats_lock:
+            running = [stats for stats in chunk_stats.values() if not stats['done']]
+            encoded = sum(min(stats['out_time'] or 0, chunks[index]['duration'])
+                          for index, stats in chunk_stats.items())
+        percent = min(encoded / total_duration * 100, 99) if total_duration > 0 else 0
+        stats = {
+            'out_time': encoded,
+            'fps': sum(stats['fps'] or 0 for stats in running),
+            'speed': sum(stats['speed'] or 0 for stats in running),
+            'chunks_running': len(running)
+        }
+        on_progress({q: percent for q in renditions}, stats)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = {
+            pool.submit(_encode_chunk, input_path, chunk_dirs[chunk['index']], chunk,
+                        renditions, qualities, segment_duration, has_audio, threads,
+                        lambda stats, index=chunk['index']: record_stats(index, stats))
+            for chunk in chunks
+        }
+        while pending:
+            done, pending = wait(pending, timeout=progress_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                for quality in result['completed']:
+                    finished[quality] += 1
+                if result['returncode'] != 0:
+                    errors.append(f"chunk {result['index']}: {result['stderr'].strip()}")
+
+            if on_progress:
+                report()
+
+    completed = []
+    for quality in renditions:
+        if finished[quality] == len(chunks):
+            stitch_rendition(chunk_dirs, output_dir / quality)
+            completed.append(quality)
+    failed = [q for q in renditions if q not in completed]
+
+    shutil.rmtree(chunks_root, ignore_errors=True)
+
+    if on_progress:
+        on_progress({q: (100 if q in completed else 0) for q in renditions}, {'out_time': total_duration})
+
+    return {
+        'completed': completed,
+        'failed': failed,
+        'returncode': 0 if not errors else 1,
+        'stderr_tail': errors
+    }
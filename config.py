@@ -8,6 +8,10 @@ class Config:
     # Database settings
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///video_dashboard.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # SQLite runs in WAL mode so dashboard reads never wait for encoder writes (see db_writes.py)
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 30000)  # milliseconds
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    PROGRESS_FLUSH_INTERVAL = int(os.environ.get('PROGRESS_FLUSH_INTERVAL') or 5)  # seconds between progress commits
     
     
     # Celery settings
@@ -20,8 +24,8 @@ class Config:
     
 
 
-    INPUT_FOLDER = BASE_DIR / 'INPUT'
-    OUTPUT_FOLDER = BASE_DIR / 'OUTPUT'
+    INPUT_FOLDER = Path(os.environ.get('INPUT_FOLDER') or BASE_DIR / 'INPUT')
+    OUTPUT_FOLDER = Path(os.environ.get('OUTPUT_FOLDER') or BASE_DIR / 'OUTPUT')
     
     # Video processing settings
     SEGMENT_DURATION = 10  # seconds
@@ -31,11 +35,71 @@ class Config:
         '360p': {'resolution': '640:360', 'bitrate': '600k'}
     }
     
+    # Encoding mode: 'ladder' decodes the source once and writes every quality
+    # in a single ffmpeg run, 'chunked' additionally splits long sources into
+    # chunks encoded in parallel, 'per_quality' runs one ffmpeg process per quality
+    ENCODE_MODE = os.environ.get('ENCODE_MODE') or 'ladder'
+    CHUNK_SEGMENTS = int(os.environ.get('CHUNK_SEGMENTS') or 30)  # segments per chunk
+    CHUNK_WORKERS = int(os.environ.get('CHUNK_WORKERS') or os.cpu_count() or 1)
+    
+    # ffprobe limits for folder scans: only headers are read, one bad file cannot stall a scan
+    PROBE_WORKERS = int(os.environ.get('PROBE_WORKERS') or 8)
+    PROBE_SIZE = int(os.environ.get('PROBE_SIZE') or 5 * 1024 * 1024)  # bytes
+    PROBE_ANALYZE_DURATION = int(os.environ.get('PROBE_ANALYZE_DURATION') or 5000000)  # microseconds
+    PROBE_TIMEOUT = int(os.environ.get('PROBE_TIMEOUT') or 30)  # seconds per file
+    
+    # Watch folder: pick up new files without a manual scan
+    WATCH_INPUT = (os.environ.get('WATCH_INPUT') or '1') == '1'
+    WATCH_AUTO_CONVERT = (os.environ.get('WATCH_AUTO_CONVERT') or '0') == '1'
+    WATCH_SETTLE_SECONDS = int(os.environ.get('WATCH_SETTLE_SECONDS') or 10)  # file must stop growing this long
+    WATCH_RECONCILE_INTERVAL = int(os.environ.get('WATCH_RECONCILE_INTERVAL') or 3600)  # full folder walk
+    
+    # Movie IDs: 'sequence' (counter table, unique across processes) or 'time' (time-ordered, no database access)
+    MOVIE_ID_ALLOCATOR = os.environ.get('MOVIE_ID_ALLOCATOR') or 'sequence'
+    
+    # Seconds between stored encode throughput samples (see /metrics)
+    ENCODE_SAMPLE_INTERVAL = int(os.environ.get('ENCODE_SAMPLE_INTERVAL') or 10)
+    
+    # Per-title ladder: trial-encode a few samples and pick bitrates/rungs per movie
+    PER_TITLE_LADDER = (os.environ.get('PER_TITLE_LADDER') or '0') == '1'
+    LADDER_SAMPLES = int(os.environ.get('LADDER_SAMPLES') or 3)
+    LADDER_SAMPLE_SECONDS = int(os.environ.get('LADDER_SAMPLE_SECONDS') or 4)
+    
+    # Conversions renew a lease; one without a heartbeat for JOB_LEASE_SECONDS lost its worker
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS') or 60)
+    HEARTBEAT_INTERVAL = int(os.environ.get('HEARTBEAT_INTERVAL') or 15)
+    RECONCILE_INTERVAL = int(os.environ.get('RECONCILE_INTERVAL') or 30)  # requeue orphaned conversions
+    # Dispatched encodes still waiting for a worker after this long are taken as lost
+    ENCODE_START_TIMEOUT = int(os.environ.get('ENCODE_START_TIMEOUT') or 3600)
+    
+    # Movies converting at once across all workers; their renditions are encoded as separate tasks
+    MAX_ACTIVE_CONVERSIONS = int(os.environ.get('MAX_ACTIVE_CONVERSIONS') or 2)
+    
+    # Worker CPU budget: encodes go to the 'heavy' or 'light' queue by their CPU cost (see cpu_budget.py)
+    # and run with up to HEAVY_JOB_CORES / LIGHT_JOB_CORES ffmpeg threads; a worker started with
+    # `python celery_worker.py` runs WORKER_CPU_BUDGET // job cores of them at once
+    WORKER_CPU_BUDGET = int(os.environ.get('WORKER_CPU_BUDGET') or os.cpu_count() or 1)
+    WORKER_QUEUES = os.environ.get('WORKER_QUEUES') or 'celery,heavy,light'
+    # A job never gets more cores than the worker has
+    HEAVY_JOB_CORES = min(int(os.environ.get('HEAVY_JOB_CORES') or 8), WORKER_CPU_BUDGET)
+    LIGHT_JOB_CORES = min(int(os.environ.get('LIGHT_JOB_CORES') or 4), WORKER_CPU_BUDGET)
+    
+    # Conversion queue: 'fifo' or 'shortest' (cheapest estimated job first) within a priority level;
+    # waiting QUEUE_AGING_SECONDS raises an entry by one priority level
+    QUEUE_POLICY = os.environ.get('QUEUE_POLICY') or 'fifo'
+    QUEUE_AGING_SECONDS = int(os.environ.get('QUEUE_AGING_SECONDS') or 1800)
+    
+    # HLS segments: 'ts' (a file per segment) or 'fmp4' (one byte-range addressed CMAF file per rendition)
+    HLS_SEGMENT_FORMAT = os.environ.get('HLS_SEGMENT_FORMAT') or 'ts'
+    
+    # Encode audio once into an audio-only rendition shared by video-only renditions
+    SHARED_AUDIO = (os.environ.get('SHARED_AUDIO') or '0') == '1'
+    
     # Supported video formats
     SUPPORTED_FORMATS = ['.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm']
     
     @staticmethod
     def init_app(app):
         # Create directories if they don't exist
-        Config.INPUT_FOLDER.mkdir(exist_ok=True)
-        Config.OUTPUT_FOLDER.mkdir(exist_ok=True)
+        Config.INPUT_FOLDER.mkdir(parents=True, exist_ok=True)
+        Config.OUTPUT_FOLDER.mkdir(parents=True, exist_ok=True)
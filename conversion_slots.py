@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+
+# Conversion slots of one process.
+#
+# The process runs up to `size` conversions at once, one per slot, and
+# every slot encodes on an equal share of the host's cores (ffmpeg
+# -threads), so several small encodes fill a large host without all of
+# them fighting over every core. The size can change at runtime: growing
+# takes effect on the next dispatch, shrinking lets the running
+# conversions of the dropped slots finish and does not refill those slots.
+# Kept free of Flask/Celery imports so the simple mode can use it too.
+
+
+class SlotPool:
+    """Numbered conversion slots (1..size) and what runs in them"""
+
+    def __init__(self, size, cores=None):
+        if size < 1:
+            raise ValueError(f"At least one conversion slot is needed, got {size}")
+        self.size = size
+        self.cores = cores or os.cpu_count() or 1
+        self.lock = threading.Lock()
+        self.running = {}  # slot -> {'job_id', 'movie_id', 'cores', 'started_at'}
+
+    def resize(self, size):
+        """Change the number of slots"""
+        if size < 1:
+            raise ValueError(f"At least one conversion slot is needed, got {size}")
+        with self.lock:
+            self.size = size
+
+    def cores_per_slot(self):
+        """Cores each slot encodes on at the current size, at least 1"""
+        return max(1, self.cores // self.size)
+
+    def acquire(self):
+        """Reserve the lowest free slot; returns (slot, cores), or None when every slot is busy"""
+        with self.lock:
+            # After a shrink, conversions of dropped slots still count until they end
+            if len(self.running) >= self.size:
+                return None
+            for slot in range(1, self.size + 1):
+                if slot not in self.running:
+                    cores = self.cores_per_slot()
+                    self.running[slot] = {'job_id': None, 'movie_id': None, 'cores': cores,
+                                          'started_at': time.time()}
+                    return slot, cores
+            return None
+
+    def assign(self, slot, job_id, movie_id):
+        """Record the conversion that runs in a reserved slot"""
+        with self.lock:
+            self.running[slot].update(job_id=job_id, movie_id=movie_id, started_at=time.time())
+
+    def release(self, slot):
+        """Free a slot whose conversion ended"""
+        with self.lock:
+            self.running.pop(slot, None)
+
+    def slot_of(self, movie_id):
+        """The slot converting movie_id, None if it is not running here"""
+        with self.lock:
+            for slot, conversion in self.running.items():
+                if conversion['movie_id'] == movie_id:
+                    return slot
+            return None
+
+    def snapshot(self):
+        """Size, cores and the running conversions, for the API"""
+        with self.lock:
+            return {
+                'size': self.size,
+                'cores': self.cores,
+                'cores_per_slot': self.cores_per_slot(),
+                'busy': len(self.running),
+                'slots': [dict(conversion, slot=slot) for slot, conversion in sorted(self.running.items())]
+            }
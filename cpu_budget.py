@@ -0,0 +1,50 @@
+import math
+
+from ladder_analysis import resolution_pixels
+
+# CPU model for encode jobs on the Celery workers.
+#
+# A job costs the cores it can keep busy: the source pixels it decodes plus
+# the pixels of every rendition it encodes, PIXELS_PER_CORE pixels per core.
+# Jobs that need more cores than a light slot has go to the heavy queue
+# (in practice ladders of 1080p and larger sources), the rest to the light
+# queue. A worker serves its queues with a core budget split into slots of
+# the queue's cores per job: its concurrency is budget // slot cores and
+# each job runs ffmpeg with at most the slot's cores as threads, so a node
+# is fully used without encoders fighting over the same cores.
+# Kept free of Flask/Celery imports so the simple mode can use it too.
+
+HEAVY_QUEUE = 'heavy'
+LIGHT_QUEUE = 'light'
+PIXELS_PER_CORE = 640 * 360     # about one core of libx264 per 360p stream
+DECODE_WEIGHT = 0.25            # decoding a pixel costs about a quarter of encoding it
+
+
+def job_cores(source_resolution, renditions, qualities):
+    """Cores an encode of renditions (keys of qualities) from the source keeps busy, at least 1"""
+    pixels = sum(resolution_pixels(qualities[quality]['resolution']) for quality in renditions if quality in qualities)
+    if source_resolution and 'x' in source_resolution:
+        pixels += resolution_pixels(source_resolution) * DECODE_WEIGHT
+    return max(1, math.ceil(pixels / PIXELS_PER_CORE))
+
+
+def job_queue(cores, light_slot_cores):
+    """Queue for a job of the given cost"""
+    return HEAVY_QUEUE if cores > light_slot_cores else LIGHT_QUEUE
+
+
+def encoder_threads(cores, encoders=1):
+    """ffmpeg -threads per encoder when encoders share a job's cores"""
+    return max(1, cores // max(encoders, 1))
+
+
+def worker_concurrency(cpu_budget, queues, slot_cores):
+    """
+    Jobs a worker with cpu_budget cores runs at once.
+
+    slot_cores maps each encode queue to its cores per job. A worker that
+    serves several encode queues is sized for the largest slot, so it never
+    runs more than its budget even when all its jobs are heavy.
+    """
+    cores = max([slot_cores[queue] for queue in queues if queue in slot_cores] or [1])
+    return max(1, cpu_budget // cores)
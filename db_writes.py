@@ -0,0 +1,89 @@
+import sqlite3
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Keeping encoder progress writes from stalling the dashboard.
+#
+# SQLite connections are switched to WAL, so readers see the last commit
+# while a writer is busy instead of waiting for its lock, and get a busy
+# timeout so concurrent writers wait instead of failing with "database is
+# locked". Progress of a running encode goes through a ProgressWriter,
+# which commits the coalesced changes every few seconds instead of on
+# every ffmpeg progress line.
+# Kept free of Flask/Celery imports so the simple mode can use it too.
+
+DEFAULT_BUSY_TIMEOUT_MS = 30000
+DEFAULT_SYNCHRONOUS = 'NORMAL'      # durable in WAL mode, only the last commits can be lost on power failure
+DEFAULT_CACHE_SIZE_KB = 20000
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+DEFAULT_FLUSH_INTERVAL = 5          # seconds between progress commits
+
+
+def sqlite_pragmas(busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS, synchronous=DEFAULT_SYNCHRONOUS,
+                   cache_size_kb=DEFAULT_CACHE_SIZE_KB):
+    """PRAGMA statements run on every new SQLite connection"""
+    if str(synchronous).upper() not in SYNCHRONOUS_MODES:
+        raise ValueError(f"Unknown SQLite synchronous mode {synchronous!r}, "
+                         f"expected one of {', '.join(SYNCHRONOUS_MODES)}")
+    return [
+        'PRAGMA journal_mode=WAL',
+        f'PRAGMA busy_timeout={int(busy_timeout_ms)}',
+        f'PRAGMA synchronous={synchronous}',
+        f'PRAGMA cache_size=-{int(cache_size_kb)}',
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+def install_sqlite_pragmas(busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS, synchronous=DEFAULT_SYNCHRONOUS,
+                           cache_size_kb=DEFAULT_CACHE_SIZE_KB):
+    """Apply sqlite_pragmas() to every SQLite connection this process opens (other databases are left alone)"""
+    if getattr(install_sqlite_pragmas, 'installed', False):
+        return
+    install_sqlite_pragmas.installed = True
+    pragmas = sqlite_pragmas(busy_timeout_ms, synchronous, cache_size_kb)
+
+    @event.listens_for(Engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+class ProgressWriter:
+    """
+    Write-behind for the progress of one running encode.
+
+    Callers change their ORM objects as before and call changed() instead
+    of committing. The session keeps the changes in memory, repeated
+    updates of a column collapse into its latest value, and they are
+    committed at most every interval seconds. flush() commits right away,
+    for state transitions. Queries between two commits must run under
+    session.no_autoflush, or they would write the pending changes early
+    and hold the write lock until the next commit.
+    """
+
+    def __init__(self, session, interval=DEFAULT_FLUSH_INTERVAL):
+        self.session = session
+        self.interval = interval
+        self.pending = False
+        self.last_flush = time.monotonic()
+
+    def changed(self):
+        """Note pending changes and commit them if the interval has passed; True when committed"""
+        self.pending = True
+        if time.monotonic() - self.last_flush < self.interval:
+            return False
+        self.flush()
+        return True
+
+    def flush(self):
+        """Commit pending changes now"""
+        if self.pending:
+            self.session.commit()
+        self.pending = False
+        self.last_flush = time.monotonic()
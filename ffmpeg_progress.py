@@ -0,0 +1,132 @@
+import subprocess
+import threading
+import time
+from collections import deque
+
+# Machine-readable ffmpeg progress shared by both pipelines.
+#
+# ffmpeg runs with -progress pipe:1 -nostats, so stdout carries blocks of
+# key=value lines ending in progress=continue/end while stderr only has
+# log messages. stderr is drained by its own thread into a bounded tail, so
+# neither pipe can fill up and block ffmpeg.
+
+PROGRESS_ARGS = ['-progress', 'pipe:1', '-nostats']
+STDERR_TAIL_LINES = 50
+MAX_LINE_LENGTH = 1024
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_out_time(fields):
+    """Encoded position in seconds from a progress block"""
+    # out_time_ms is in microseconds too, despite its name
+    for key in ('out_time_us', 'out_time_ms'):
+        value = _parse_float(fields.get(key))
+        if value is not None and value >= 0:
+            return value / 1000000
+    out_time = fields.get('out_time', '')
+    try:
+        hours, minutes, seconds = out_time.split(':')
+        return max(int(hours) * 3600 + int(minutes) * 60 + float(seconds), 0)
+    except ValueError:
+        return None
+
+
+def parse_progress_block(fields):
+    """Turn one block of -progress key=value pairs into a stats dict"""
+    speed = fields.get('speed', '').rstrip('x')
+    bitrate = fields.get('bitrate', '').replace('kbits/s', '')
+    return {
+        'out_time': parse_out_time(fields),
+        'frame': int(_parse_float(fields.get('frame')) or 0),
+        'fps': _parse_float(fields.get('fps')),
+        'speed': _parse_float(speed),
+        'bitrate_kbps': _parse_float(bitrate),
+        'done': fields.get('progress') == 'end'
+    }
+
+
+class ProgressParser:
+    """
+    Incremental parser for ffmpeg -progress output.
+
+    feed() accepts arbitrary chunks of bytes and returns the stats of every
+    block completed by them. Memory is bounded: one partial line and the
+    keys of the current block.
+    """
+
+    def __init__(self):
+        self.partial = b''
+        self.fields = {}
+
+    def feed(self, data):
+        blocks = []
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        if len(self.partial) > MAX_LINE_LENGTH:
+            self.partial = b''
+
+        for line in lines:
+            key, sep, value = line.decode('utf-8', errors='ignore').strip().partition('=')
+            if not sep:
+                continue
+            self.fields[key] = value
+            if key == 'progress':
+                blocks.append(parse_progress_block(self.fields))
+                self.fields = {}
+        return blocks
+
+
+def drain_stderr(stream, tail):
+    """Read ffmpeg stderr until EOF so the pipe can never fill up"""
+    for chunk in iter(lambda: stream.read(4096), b''):
+        for line in chunk.decode('utf-8', errors='ignore').replace('\r', '\n').splitlines():
+            if line.strip():
+                tail.append(line)
+
+
+def run_ffmpeg(args, total_duration=0, on_progress=None, min_interval=1.0, offset=0):
+    """
+    Run an ffmpeg command line and report its progress.
+
+    on_progress(percent, stats) is called from the calling thread at most
+    every min_interval seconds and once more at the end; percent is None
+    when total_duration is unknown. offset is the position in seconds the
+    encode starts at, for runs that continue an earlier one. Returns a dict
+    with returncode, stderr_tail and the last stats.
+    """
+    args = list(args)
+    args[1:1] = PROGRESS_ARGS
+    process = subprocess.Popen(args, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    drain_thread = threading.Thread(target=drain_stderr, args=(process.stderr, stderr_tail), daemon=True)
+    drain_thread.start()
+
+    parser = ProgressParser()
+    stats = {}
+    last_report = 0
+    for chunk in iter(lambda: process.stdout.read1(4096), b''):
+        for stats in parser.feed(chunk):
+            if not on_progress or (not stats['done'] and time.monotonic() - last_report < min_interval):
+                continue
+            last_report = time.monotonic()
+            percent = None
+            if total_duration > 0 and stats['out_time'] is not None:
+                percent = min((offset + stats['out_time']) / total_duration * 100, 100 if stats['done'] else 99)
+            on_progress(percent, stats)
+
+    process.wait()
+    drain_thread.join(timeout=5)
+
+    return {
+        'returncode': process.returncode,
+        'stderr_tail': list(stderr_tail),
+        'stats': stats
+    }
@@ -0,0 +1,306 @@
+from pathlib import Path
+
+from checkpoints import PLAYLIST_NAME, RESUME_PLAYLIST, finalize_playlist, merge_resumed
+from ffmpeg_progress import run_ffmpeg
+from ladder_analysis import parse_bitrate
+
+# Shared HLS encoding helpers used by both simple_run.py and app/tasks.py.
+# Kept free of Flask/Celery imports so the simple mode can use it too.
+
+# Sources with these properties can be segmented as they are (see passthrough_rendition)
+PASSTHROUGH_VIDEO_CODECS = ('h264',)
+PASSTHROUGH_PIX_FMTS = ('yuv420p', 'yuvj420p')
+PASSTHROUGH_MAX_SEGMENT_RATIO = 2   # source keyframes too sparse beyond this many segment durations
+
+# Shared audio: one audio-only rendition referenced by every video rendition
+AUDIO_GROUP_ID = 'audio'
+AUDIO_BITRATE = '128k'
+
+# 'ts' writes a .ts file per segment, 'fmp4' one fMP4 (CMAF) file per
+# rendition that the playlist addresses with byte ranges
+SEGMENT_FORMATS = ('ts', 'fmp4')
+PLAYLIST_VERSIONS = {'ts': 3, 'fmp4': 7}
+SINGLE_FILE_NAME = 'stream.mp4'
+
+
+def hls_output_options(segment_dir, segment_duration, segment_format='ts', flags=()):
+    """
+    Options of ffmpeg's hls muxer for one rendition directory, as a dict ffmpeg-python accepts.
+
+    The playlist is an EVENT one so ffmpeg rewrites it after every segment
+    (checkpoints read it); finalize_playlist() makes it VOD once it ended.
+    """
+    flags = list(flags)
+    options = {'f': 'hls', 'hls_time': segment_duration, 'hls_playlist_type': 'event'}
+    if segment_format == 'fmp4':
+        flags.append('single_file')
+        options['hls_segment_type'] = 'fmp4'
+        options['hls_segment_filename'] = str(Path(segment_dir) / SINGLE_FILE_NAME)
+    else:
+        options['hls_segment_filename'] = str(Path(segment_dir) / 'segment_%03d.ts')
+    if flags:
+        options['hls_flags'] = '+'.join(flags)
+    return options
+
+
+def option_args(options):
+    """{'hls_time': 10} -> ['-hls_time', '10']"""
+    args = []
+    for name, value in options.items():
+        args += [f'-{name}', str(value)]
+    return args
+
+
+def remove_segments(rendition_dir):
+    """Delete the media files of a rendition written in either segment format"""
+    rendition_dir = Path(rendition_dir)
+    for segment in list(rendition_dir.glob('segment_*.ts')) + [rendition_dir / SINGLE_FILE_NAME]:
+        try:
+            segment.unlink()
+        except OSError:
+            pass
+
+
+def build_ladder_command(input_path, output_dir, renditions, qualities, segment_duration, has_audio=True,
+                         start=None, duration=None, threads=None, segment_format='ts',
+                         start_number=None, playlist_name=PLAYLIST_NAME):
+    """
+    Build a single ffmpeg command that decodes once and writes every rendition.
+
+    start/duration restrict the encode to a time range of the source; the
+    output timestamps are then offset by start so ranges can be stitched.
+    start_number is the number of the first segment written.
+    """
+    output_dir = Path(output_dir)
+    count = len(renditions)
+
+    input_args = []
+    if start is not None:
+        input_args += ['-ss', str(start)]
+    if duration is not None:
+        input_args += ['-t', str(duration)]
+
+    # Decode once, split the decoded frames and scale each branch
+    filters = [f"[0:v]split={count}" + ''.join(f"[v{i}]" for i in range(count))]
+    for i, quality in enumerate(renditions):
+        filters.append(f"[v{i}]scale={qualities[quality]['resolution']}[v{i}out]")
+
+    args = ['ffmpeg', '-hide_banner', '-y'] + input_args + ['-i', str(input_path),
+            '-filter_complex', ';'.join(filters)]
+
+    stream_map = []
+    for i, quality in enumerate(renditions):
+        args += ['-map', f'[v{i}out]']
+        if has_audio:
+            args += ['-map', '0:a:0']
+        args += [f'-c:v:{i}', 'libx264', f'-b:v:{i}', qualities[quality]['bitrate']]
+        if has_audio:
+            stream_map.append(f'v:{i},a:{i},name:{quality}')
+        else:
+            stream_map.append(f'v:{i},name:{quality}')
+
+    if has_audio:
+        args += ['-c:a', 'aac', '-b:a', AUDIO_BITRATE]
+    if threads:
+        args += ['-threads', str(threads)]
+    if start is not None:
+        args += ['-output_ts_offset', str(start)]
+
+    args += [
+        '-force_key_frames', f'expr:gte(t,n_forced*{segment_duration})',
+        '-g', '250',
+        '-keyint_min', '250',
+        '-sc_threshold', '0',
+    ]
+    args += option_args(hls_output_options(output_dir / '%v', segment_duration, segment_format,
+                                           ['independent_segments']))
+    if start_number:
+        args += ['-start_number', str(start_number)]
+    args += [
+        '-var_stream_map', ' '.join(stream_map),
+        str(output_dir / '%v' / playlist_name),
+    ]
+    return args
+
+
+def is_playlist_complete(playlist_path):
+    """Check whether an HLS playlist was fully written by ffmpeg"""
+    try:
+        with open(playlist_path, 'r') as f:
+            return '#EXT-X-ENDLIST' in f.read()
+    except OSError:
+        return False
+
+
+def count_segments(quality_dir):
+    """Count the segments listed in a rendition's playlist"""
+    try:
+        with open(Path(quality_dir) / 'playlist.m3u8', 'r') as f:
+            return sum(1 for line in f if line.startswith('#EXTINF:'))
+    except OSError:
+        return 0
+
+
+def encode_ladder(input_path, output_dir, renditions, qualities, segment_duration,
+                  total_duration=0, has_audio=True, on_progress=None, segment_format='ts', resume=None, threads=None):
+    """
+    Encode every rendition of the ladder in one ffmpeg run.
+
+    All renditions advance together, so ffmpeg's encoded position is reported
+    for each of them through on_progress({quality: percent}, stats), stats
+    being the fps/speed/bitrate of the run. resume=(segments, seconds)
+    continues renditions whose first segments are already there (see
+    checkpoints.py). threads is ffmpeg's -threads for each encoder.
+    Returns a dict with the completed and failed renditions so callers can
+    fall back to per-rendition encodes for whatever did not finish.
+    """
+    output_dir = Path(output_dir)
+    for quality in renditions:
+        (output_dir / quality).mkdir(parents=True, exist_ok=True)
+
+    start_number, start = resume or (0, 0)
+    if start_number:
+        args = build_ladder_command(input_path, output_dir, renditions, qualities, segment_duration,
+                                    has_audio=has_audio, start=start, threads=threads, segment_format=segment_format,
+                                    start_number=start_number, playlist_name=RESUME_PLAYLIST)
+    else:
+        args = build_ladder_command(input_path, output_dir, renditions, qualities, segment_duration,
+                                    has_audio=has_audio, threads=threads, segment_format=segment_format)
+
+    last_progress = {}
+
+    def report(percent, stats):
+        if percent is None:
+            return
+        last_progress.update({quality: percent for quality in renditions})
+        if on_progress:
+            on_progress(dict(last_progress), stats)
+
+    result = run_ffmpeg(args, total_duration, report, offset=start if start_number else 0)
+
+    if start_number:
+        for quality in renditions:
+            merge_resumed(output_dir / quality)
+    completed = [q for q in renditions if finalize_playlist(output_dir / q / PLAYLIST_NAME)]
+    failed = [q for q in renditions if q not in completed]
+
+    if on_progress:
+        on_progress({q: (100 if q in completed else last_progress.get(q, 0)) for q in renditions}, result['stats'])
+
+    return {
+        'completed': completed,
+        'failed': failed,
+        'returncode': result['returncode'],
+        'stderr_tail': result['stderr_tail']
+    }
+
+
+def passthrough_rendition(video_info, renditions, qualities):
+    """
+    The rendition a source already is, so it can be remuxed instead of re-encoded.
+
+    The source has to be 8-bit 4:2:0 H.264 at exactly the rendition's
+    resolution with a known bitrate not above the rendition's. Returns the
+    quality name or None.
+    """
+    if not video_info or video_info.get('video_codec') not in PASSTHROUGH_VIDEO_CODECS:
+        return None
+    if video_info.get('pix_fmt') not in PASSTHROUGH_PIX_FMTS or not video_info.get('video_bitrate'):
+        return None
+    for quality in renditions:
+        if quality not in qualities:
+            continue
+        width, height = qualities[quality]['resolution'].split(':')
+        if (video_info['width'], video_info['height']) != (int(width), int(height)):
+            continue
+        if video_info['video_bitrate'] <= parse_bitrate(qualities[quality]['bitrate']):
+            return quality
+    return None
+
+
+def playlist_target_duration(playlist_path):
+    """#EXT-X-TARGETDURATION of a playlist, None if it cannot be read"""
+    try:
+        with open(playlist_path, 'r') as f:
+            for line in f:
+                if line.startswith('#EXT-X-TARGETDURATION:'):
+                    return int(line.split(':', 1)[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def remux_rendition(input_path, output_dir, quality, segment_duration, total_duration=0,
+                    has_audio=True, copy_audio=False, on_progress=None, segment_format='ts'):
+    """
+    Segment the source into one rendition without re-encoding the video.
+
+    Segments can only start on the source's own keyframes; when those are so
+    sparse that segments end up much longer than segment_duration the
+    rendition is reported as failed so the caller encodes it instead. AAC
+    audio is copied too, anything else is encoded to AAC. Returns the same
+    dict shape as encode_ladder, on_progress gets (percent, stats).
+    """
+    quality_dir = Path(output_dir) / quality
+    quality_dir.mkdir(parents=True, exist_ok=True)
+    playlist_path = quality_dir / 'playlist.m3u8'
+
+    args = ['ffmpeg', '-hide_banner', '-y', '-i', str(input_path), '-map', '0:v:0', '-c:v', 'copy']
+    if has_audio:
+        args += ['-map', '0:a:0'] + (['-c:a', 'copy'] if copy_audio else ['-c:a', 'aac', '-b:a', AUDIO_BITRATE])
+    args += option_args(hls_output_options(quality_dir, segment_duration, segment_format))
+    args.append(str(playlist_path))
+
+    result = run_ffmpeg(args, total_duration, on_progress)
+
+    completed = result['returncode'] == 0 and finalize_playlist(playlist_path)
+    target_duration = playlist_target_duration(playlist_path)
+    if completed and target_duration and target_duration > segment_duration * PASSTHROUGH_MAX_SEGMENT_RATIO:
+        completed = False
+        result['stderr_tail'].append(f"source keyframes too sparse: {target_duration}s segments")
+    if not completed:
+        remove_segments(quality_dir)
+
+    return {
+        'completed': [quality] if completed else [],
+        'failed': [] if completed else [quality],
+        'returncode': result['returncode'],
+        'stderr_tail': result['stderr_tail']
+    }
+
+
+def encode_audio(input_path, output_dir, segment_duration, total_duration=0, on_progress=None, segment_format='ts'):
+    """
+    Write the audio-only rendition every video rendition of a movie shares.
+
+    The first audio stream is encoded to AAC once into output_dir/audio, so
+    the video renditions can be encoded without audio. It is encoded even
+    when it already is AAC so the master playlist's BANDWIDTH holds.
+    Returns the same dict shape as encode_ladder.
+    """
+    audio_dir = Path(output_dir) / AUDIO_GROUP_ID
+    audio_dir.mkdir(parents=True, exist_ok=True)
+    playlist_path = audio_dir / 'playlist.m3u8'
+
+    args = [
+        'ffmpeg', '-hide_banner', '-y', '-i', str(input_path),
+        '-map', '0:a:0', '-vn', '-c:a', 'aac', '-b:a', AUDIO_BITRATE,
+    ]
+    args += option_args(hls_output_options(audio_dir, segment_duration, segment_format))
+    args.append(str(playlist_path))
+
+    result = run_ffmpeg(args, total_duration, on_progress)
+
+    completed = result['returncode'] == 0 and finalize_playlist(playlist_path)
+    return {
+        'completed': [AUDIO_GROUP_ID] if completed else [],
+        'failed': [] if completed else [AUDIO_GROUP_ID],
+        'returncode': result['returncode'],
+        'stderr_tail': result['stderr_tail']
+    }
+
+
+def audio_media_tag():
+    """#EXT-X-MEDIA line of the shared audio rendition for a master playlist"""
+    return (f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="{AUDIO_GROUP_ID}",NAME="Default",'
+            f'DEFAULT=YES,AUTOSELECT=YES,URI="{AUDIO_GROUP_ID}/playlist.m3u8"\n')
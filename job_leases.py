@@ -0,0 +1,168 @@
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from sqlalchemy import or_
+
+# Leases on running conversions, so a restarted process can tell work whose
+# owner died from work another live process is still doing.
+#
+# The process converting a movie stores its owner id on the row and renews
+# heartbeat_at every few seconds. A movie that is IN_PROGRESS without a
+# fresh heartbeat has lost its owner: its leftover ffmpeg processes are
+# killed and the movie is queued again, resuming from its checkpoints.
+# Kept free of Flask/Celery imports so the simple mode can use it too.
+
+DEFAULT_LEASE_SECONDS = 60
+KILL_GRACE_SECONDS = 5
+
+# host:pid:random, the random part tells a restarted process from a reused pid
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def owner_host(owner):
+    """Host part of an owner id"""
+    return owner.split(':', 1)[0] if owner else None
+
+
+def claim_lease(session, movie_model, movie_id, owner=OWNER_ID, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    Mark a movie IN_PROGRESS for owner unless a live owner already holds it.
+
+    A single conditional UPDATE, so two processes racing for the same movie
+    cannot both win. Returns True when the lease was taken.
+    """
+    now = time.time()
+    claimed = session.query(movie_model).filter(
+        movie_model.id == movie_id,
+        or_(
+            movie_model.status != 'IN_PROGRESS',
+            movie_model.heartbeat_at.is_(None),
+            movie_model.heartbeat_at < now - lease_seconds
+        )
+    ).update({
+        movie_model.status: 'IN_PROGRESS',
+        movie_model.owner: owner,
+        movie_model.heartbeat_at: now
+    }, synchronize_session=False)
+    session.commit()
+    return claimed == 1
+
+
+def renew_leases(session, movie_model, owner=OWNER_ID, movie_ids=()):
+    """
+    Refresh the heartbeat of every movie this owner converts, or encodes a part of (movie_ids).
+
+    With owner None only the movie_ids are renewed.
+    """
+    renewed = movie_model.id.in_(list(movie_ids))
+    if owner is not None:
+        renewed = or_(movie_model.owner == owner, renewed)
+    session.query(movie_model).filter(
+        renewed,
+        movie_model.status == 'IN_PROGRESS'
+    ).update({movie_model.heartbeat_at: time.time()}, synchronize_session=False)
+    session.commit()
+
+
+def stale_movies(session, movie_model, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """IN_PROGRESS movies without a live owner"""
+    cutoff = time.time() - lease_seconds
+    return session.query(movie_model).filter(
+        movie_model.status == 'IN_PROGRESS',
+        or_(movie_model.heartbeat_at.is_(None), movie_model.heartbeat_at < cutoff)
+    ).all()
+
+
+def encoder_processes(file_path):
+    """
+    Pids of ffmpeg processes on this host that read file_path.
+
+    Uses /proc, so on platforms without it nothing is found and orphans are
+    left to finish on their own.
+    """
+    proc = Path('/proc')
+    if not proc.is_dir():
+        return []
+
+    file_path = str(file_path)
+    pids = []
+    for entry in proc.iterdir():
+        if not entry.name.isdigit() or int(entry.name) == os.getpid():
+            continue
+        try:
+            args = (entry / 'cmdline').read_bytes().decode('utf-8', errors='ignore').split('\0')
+        except OSError:
+            continue
+        if args and os.path.basename(args[0]).startswith('ffmpeg') and file_path in args:
+            pids.append(int(entry.name))
+    return pids
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    # A killed child of ours stays a zombie until reaped
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except (OSError, IndexError):
+        return True
+
+
+def kill_processes(pids, grace=KILL_GRACE_SECONDS):
+    """SIGTERM the processes, SIGKILL whatever is still running after grace seconds"""
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    deadline = time.monotonic() + grace
+    while time.monotonic() < deadline and any(_alive(pid) for pid in pids):
+        time.sleep(0.2)
+
+    for pid in pids:
+        if _alive(pid):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+
+def kill_orphaned_encoders(movie):
+    """
+    Kill the leftover ffmpeg processes of a movie whose owner is gone.
+
+    Only processes on this host can be found; a movie last owned by
+    another host is left alone there. Returns the killed pids.
+    """
+    if movie.owner and owner_host(movie.owner) != socket.gethostname():
+        return []
+    pids = encoder_processes(movie.file_path)
+    if pids:
+        kill_processes(pids)
+    return pids
+
+
+def start_periodic(callback, interval, name):
+    """Call callback every interval seconds on a daemon thread; errors are printed and the loop goes on"""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in {name}: {e}")
+
+    thread = threading.Thread(target=loop, name=name, daemon=True)
+    thread.start()
+    return thread
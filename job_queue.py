@@ -0,0 +1,154 @@
+import time
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+# Durable conversion queue in the application database, for the simple
+# mode that runs without Redis and Celery.
+#
+# A job row is 'queued' until a process claims it with a lease, then
+# 'running' until it is completed as 'done' or 'failed'. Claiming is a
+# single conditional UPDATE that also checks how many jobs run, so several
+# processes sharing the database never exceed the slot limit. The claiming
+# process renews its leases; a job whose lease expired lost its process and
+# goes back to the queue, available again after an exponential backoff,
+# until it has used up its attempts.
+# Kept free of Flask/Celery imports so the simple mode can use it too.
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_SECONDS = 30
+DEFAULT_BACKOFF_MAX_SECONDS = 1800
+CLAIM_CANDIDATES = 5    # queued jobs tried per claim when other processes win the race
+
+
+def backoff_seconds(attempts, base=DEFAULT_BACKOFF_SECONDS, cap=DEFAULT_BACKOFF_MAX_SECONDS):
+    """Delay before the next attempt of a job that already had attempts: base, 2x base, 4x base... up to cap"""
+    return min(base * 2 ** max(attempts - 1, 0), cap)
+
+
+def enqueue_job(session, job_model, movie_id):
+    """Queue a conversion of movie_id unless one is queued or running already; returns the active job"""
+    job = active_job(session, job_model, movie_id)
+    if job:
+        return job
+    now = time.time()
+    job = job_model(movie_id=movie_id, state='queued', attempts=0, created_at=now, available_at=now)
+    session.add(job)
+    try:
+        session.commit()
+    except IntegrityError:
+        # Another process queued it first (unique index on the active job of a movie)
+        session.rollback()
+        return active_job(session, job_model, movie_id)
+    return job
+
+
+def active_job(session, job_model, movie_id):
+    """The queued or running job of a movie, if any"""
+    return session.query(job_model).filter(
+        job_model.movie_id == movie_id,
+        job_model.state.in_(['queued', 'running'])
+    ).first()
+
+
+def queue_position(session, job_model, job):
+    """1-based place of a queued job among the queued jobs, None if it is not queued"""
+    if job.state != 'queued':
+        return None
+    ahead = session.query(func.count(job_model.id)).filter(
+        job_model.state == 'queued',
+        (job_model.available_at < job.available_at)
+        | ((job_model.available_at == job.available_at) & (job_model.id < job.id))
+    ).scalar()
+    return ahead + 1
+
+
+def claim_next_job(session, job_model, owner, lease_seconds, max_running=1):
+    """
+    Claim the next available queued job for owner, if fewer than max_running run.
+
+    Returns the claimed job, or None when nothing is available or every
+    slot is taken.
+    """
+    now = time.time()
+    running = aliased(job_model)
+    running_count = (session.query(func.count(running.id))
+                     .filter(running.state == 'running').scalar_subquery())
+    candidates = (session.query(job_model.id)
+                  .filter(job_model.state == 'queued', job_model.available_at <= now)
+                  .order_by(job_model.available_at, job_model.id)
+                  .limit(CLAIM_CANDIDATES).all())
+
+    for (job_id,) in candidates:
+        claimed = session.query(job_model).filter(
+            job_model.id == job_id,
+            job_model.state == 'queued',
+            running_count < max_running
+        ).update({
+            job_model.state: 'running',
+            job_model.owner: owner,
+            job_model.lease_until: now + lease_seconds,
+            job_model.attempts: job_model.attempts + 1,
+            job_model.started_at: now
+        }, synchronize_session=False)
+        session.commit()
+        if claimed:
+            return session.get(job_model, job_id)
+    return None
+
+
+def renew_job_leases(session, job_model, owner, lease_seconds):
+    """Extend the lease of every job owner is running"""
+    session.query(job_model).filter(
+        job_model.owner == owner,
+        job_model.state == 'running'
+    ).update({job_model.lease_until: time.time() + lease_seconds}, synchronize_session=False)
+    session.commit()
+
+
+def complete_job(session, job_model, job_id, failed=False, error=None):
+    """Mark a job done (or failed) and release its lease"""
+    session.query(job_model).filter(job_model.id == job_id).update({
+        job_model.state: 'failed' if failed else 'done',
+        job_model.owner: None,
+        job_model.lease_until: None,
+        job_model.finished_at: time.time(),
+        job_model.last_error: error
+    }, synchronize_session=False)
+    session.commit()
+
+
+def requeue_expired(session, job_model, max_attempts=DEFAULT_MAX_ATTEMPTS, backoff_base=DEFAULT_BACKOFF_SECONDS,
+                    backoff_max=DEFAULT_BACKOFF_MAX_SECONDS):
+    """
+    Put running jobs whose lease expired back into the queue after a backoff.
+
+    Jobs that used up max_attempts fail instead. Every job is updated with
+    a conditional UPDATE, so an owner renewing its lease at the same moment
+    keeps the job. Returns the jobs that were taken from their owner.
+    """
+    now = time.time()
+    expired = session.query(job_model).filter(job_model.state == 'running', job_model.lease_until < now).all()
+
+    taken = []
+    for job in expired:
+        owner = job.owner
+        if job.attempts >= max_attempts:
+            values = {job_model.state: 'failed', job_model.finished_at: now,
+                      job_model.last_error: f'Lease expired, gave up after {job.attempts} attempts'}
+        else:
+            values = {job_model.state: 'queued',
+                      job_model.available_at: now + backoff_seconds(job.attempts, backoff_base, backoff_max),
+                      job_model.last_error: f'Lease of {owner} expired'}
+        values.update({job_model.owner: None, job_model.lease_until: None})
+        updated = session.query(job_model).filter(
+            job_model.id == job.id,
+            job_model.state == 'running',
+            job_model.lease_until < now
+        ).update(values, synchronize_session=False)
+        if updated:
+            taken.append(job.id)
+    session.commit()
+
+    return [session.get(job_model, job_id) for job_id in taken]
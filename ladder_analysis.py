@@ -0,0 +1,160 @@
+import json
+import os
+import subprocess
+import tempfile
+
+# Per-title bitrate ladder from a fast complexity probe.
+#
+# A few short segments spread over the title are encoded at 360p with a
+# constant quality (CRF) setting. The bitrate x264 needs to hold that
+# quality measures how hard the content is: a static talking head needs a
+# fraction of what a high-motion sports clip does. Each rung then gets the
+# bitrate the measured complexity calls for at its resolution, bounded by
+# the configured bitrate, and rungs too close to the next higher one are
+# dropped because they add a switch point but no real quality step.
+# Kept free of Flask/Celery imports so the simple mode can use it too.
+
+DEFAULT_SAMPLES = 3
+DEFAULT_SAMPLE_SECONDS = 4
+DEFAULT_TIMEOUT = 120           # seconds per trial encode
+TRIAL_RESOLUTION = '640:360'
+TRIAL_CRF = 23
+RESOLUTION_EXPONENT = 0.75      # bits needed grow slower than pixel count
+MIN_BITRATE_RATIO = 0.35        # never below this share of the configured bitrate
+MAX_BITRATE_RATIO = 1.0         # never above the configured bitrate
+MIN_RUNG_STEP = 1.5             # a rung needs 1.5x fewer bits than the one above it
+BITRATE_STEP = 50000            # chosen bitrates are rounded to 50k
+
+
+def parse_bitrate(value):
+    """'2500k' / '2M' / 2500000 -> bits per second"""
+    value = str(value).strip().lower()
+    multipliers = {'k': 1000, 'm': 1000000}
+    if value and value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(float(value))
+
+
+def format_bitrate(bits_per_second):
+    return f"{int(bits_per_second // 1000)}k"
+
+
+def resolution_pixels(resolution):
+    """'1280:720' or '1280x720' -> pixel count"""
+    width, height = resolution.replace('x', ':').split(':')
+    return int(width) * int(height)
+
+
+def sample_offsets(duration, samples=DEFAULT_SAMPLES, sample_seconds=DEFAULT_SAMPLE_SECONDS):
+    """Start times of samples spread evenly over the title, skipping the very start and end"""
+    if duration <= sample_seconds * samples:
+        return [0]
+    step = duration / (samples + 1)
+    return [round(step * (i + 1) - sample_seconds / 2, 3) for i in range(samples)]
+
+
+def trial_encode_kbps(input_path, start, seconds, timeout=DEFAULT_TIMEOUT):
+    """Bitrate in kbit/s x264 needs for one constant-quality 360p sample, None on failure"""
+    fd, output_path = tempfile.mkstemp(suffix='.ts')
+    os.close(fd)
+    args = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-ss', str(start), '-t', str(seconds), '-i', str(input_path),
+        '-map', '0:v:0', '-an',
+        '-vf', f'scale={TRIAL_RESOLUTION}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', str(TRIAL_CRF),
+        '-f', 'mpegts', output_path
+    ]
+    try:
+        result = subprocess.run(args, stdin=subprocess.DEVNULL, capture_output=True, timeout=timeout)
+        size = os.path.getsize(output_path)
+        if result.returncode != 0 or size == 0:
+            return None
+        return size * 8 / 1000 / seconds
+    except (subprocess.TimeoutExpired, OSError):
+        return None
+    finally:
+        try:
+            os.remove(output_path)
+        except OSError:
+            pass
+
+
+def measure_complexity(input_path, duration, samples=DEFAULT_SAMPLES, sample_seconds=DEFAULT_SAMPLE_SECONDS):
+    """
+    Constant-quality 360p bitrate of the hardest sampled segment, in kbit/s.
+
+    The hardest segment decides so that an easy intro cannot starve the
+    action scenes. Returns None when no sample could be encoded.
+    """
+    rates = []
+    for start in sample_offsets(duration, samples, sample_seconds):
+        seconds = min(sample_seconds, duration - start) if duration > 0 else sample_seconds
+        rate = trial_encode_kbps(input_path, start, max(seconds, 1))
+        if rate is not None:
+            rates.append(rate)
+    return max(rates) if rates else None
+
+
+def plan_ladder(complexity_kbps, renditions, qualities):
+    """
+    Pick a bitrate for every rendition and drop rungs too close to a higher one.
+
+    Returns {'complexity_kbps': ..., 'renditions': {quality: '1400k'}} with
+    the renditions in their original order.
+    """
+    trial_pixels = resolution_pixels(TRIAL_RESOLUTION)
+    bitrates = {}
+    for quality in renditions:
+        configured = parse_bitrate(qualities[quality]['bitrate'])
+        scale = (resolution_pixels(qualities[quality]['resolution']) / trial_pixels) ** RESOLUTION_EXPONENT
+        needed = complexity_kbps * 1000 * scale
+        bitrate = min(max(needed, configured * MIN_BITRATE_RATIO), configured * MAX_BITRATE_RATIO)
+        bitrates[quality] = max(BITRATE_STEP, round(bitrate / BITRATE_STEP) * BITRATE_STEP)
+
+    by_size = sorted(renditions, key=lambda q: resolution_pixels(qualities[q]['resolution']), reverse=True)
+    kept = []
+    for quality in by_size:
+        if not kept or bitrates[quality] * MIN_RUNG_STEP <= bitrates[kept[-1]]:
+            kept.append(quality)
+    # The smallest rung is the floor for slow connections, it replaces a too-close middle rung
+    lowest = by_size[-1]
+    if lowest not in kept and len(kept) > 1:
+        kept[-1] = lowest
+
+    return {
+        'complexity_kbps': round(complexity_kbps, 1),
+        'renditions': {q: format_bitrate(bitrates[q]) for q in renditions if q in kept}
+    }
+
+
+def analyze_title(input_path, duration, renditions, qualities, samples=DEFAULT_SAMPLES,
+                  sample_seconds=DEFAULT_SAMPLE_SECONDS):
+    """Measure a title and plan its ladder, None if the title could not be measured"""
+    renditions = [q for q in renditions if q in qualities]
+    if not renditions:
+        return None
+    complexity = measure_complexity(input_path, duration, samples, sample_seconds)
+    if complexity is None:
+        return None
+    return plan_ladder(complexity, renditions, qualities)
+
+
+def ladder_renditions(ladder):
+    """Renditions of a stored (JSON) ladder, None if there is none"""
+    try:
+        return list(json.loads(ladder)['renditions']) if ladder else None
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def ladder_quality_settings(ladder, qualities):
+    """qualities with the bitrates of a stored (JSON) ladder applied"""
+    try:
+        chosen = json.loads(ladder)['renditions'] if ladder else {}
+    except (ValueError, KeyError, TypeError):
+        chosen = {}
+    return {
+        quality: dict(settings, bitrate=chosen.get(quality, settings['bitrate']))
+        for quality, settings in qualities.items()
+    }
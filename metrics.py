@@ -0,0 +1,295 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+from sqlalchemy import event, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+# Prometheus text-format metrics shared by simple_run.py and the app package.
+#
+# Commit latency lives in process memory. Everything the dashboard
+# processes and Celery workers both touch (jobs, queue, encode throughput,
+# probe latency) is read from the database at scrape time, so /metrics in
+# the web process also reflects probes and encodes running in worker
+# processes.
+
+DEFAULT_SAMPLE_INTERVAL = 10   # seconds between stored encode samples
+LIVE_SAMPLE_WINDOW = 60        # samples newer than this describe running encodes
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = []
+    for name, value in zip(labelnames, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type_name = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, labels, value) for labels, value in self.values.items()]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.type_name}']
+        for name, labels, value in self.samples():
+            lines.append(f'{name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    def load(self, per_bucket, **labels):
+        """Replace the values of labels with {upper bound: (count, sum)} of each bucket alone, e.g. from the database"""
+        counts = []
+        cumulative, total = 0, 0.0
+        for bound in self.buckets:
+            count, seconds = per_bucket.get(_format_value(bound), (0, 0.0))
+            cumulative += count
+            total += seconds
+            counts.append(cumulative)
+        with self.lock:
+            self.values[self._key(labels)] = (counts, total)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for labels, (counts, total) in self.values.items():
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f'{self.name}_bucket', labels + (_format_value(bound),), count))
+                samples.append((f'{self.name}_sum', labels, total))
+                samples.append((f'{self.name}_count', labels, counts[-1]))
+        return samples
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.type_name}']
+        for name, labels, value in self.samples():
+            labelnames = self.labelnames + ('le',) if name.endswith('_bucket') else self.labelnames
+            lines.append(f'{name}{_format_labels(labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+PROBE_SECONDS = registry.register(Histogram(
+    'video_probe_seconds', 'ffprobe latency per file',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+))
+DB_COMMIT_SECONDS = registry.register(Histogram(
+    'video_db_commit_seconds', 'Database commit latency',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+))
+QUEUE_DEPTH = registry.register(Gauge('video_queue_depth', 'Movies waiting to be converted'))
+JOBS = registry.register(Gauge('video_jobs', 'Movies by status', ['status']))
+ENCODE_FPS = registry.register(Gauge(
+    'video_encode_fps', 'Frames per second of running encodes', ['movie_id', 'rendition']))
+ENCODE_SPEED = registry.register(Gauge(
+    'video_encode_speed', 'Encode speed relative to realtime of running encodes', ['movie_id', 'rendition']))
+ENCODE_BITRATE = registry.register(Gauge(
+    'video_encode_bitrate_kbps', 'Output bitrate of running encodes', ['movie_id', 'rendition']))
+ENCODE_OUTPUT_BYTES = registry.register(Gauge(
+    'video_encode_output_bytes', 'Bytes written so far by running encodes', ['movie_id', 'rendition']))
+OUTPUT_BYTES = registry.register(Gauge(
+    'video_output_bytes', 'Bytes written by all recorded encodes'))
+
+
+def instrument_commits():
+    """Time every SQLAlchemy session commit in this process into DB_COMMIT_SECONDS"""
+    if getattr(instrument_commits, 'installed', False):
+        return
+    instrument_commits.installed = True
+
+    @event.listens_for(Session, 'before_commit')
+    def start_commit_timer(session):
+        session.info['commit_started'] = time.perf_counter()
+
+    @event.listens_for(Session, 'after_commit')
+    def stop_commit_timer(session):
+        started = session.info.pop('commit_started', None)
+        if started is not None:
+            DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+
+def record_probe_latencies(session, latency_model, latencies):
+    """
+    Add probe durations to the PROBE_SECONDS histogram kept in the database (commits).
+
+    latency_model has one row per bucket (le: upper bound, count and seconds
+    of the probes in that bucket alone), so recording is one UPDATE per
+    touched bucket and the table never grows.
+    """
+    if not latencies:
+        return
+    if session.query(latency_model).count() < len(PROBE_SECONDS.buckets):
+        existing = {le for (le,) in session.query(latency_model.le)}
+        session.add_all(latency_model(le=_format_value(bound), count=0, seconds=0.0)
+                        for bound in PROBE_SECONDS.buckets if _format_value(bound) not in existing)
+        try:
+            session.commit()
+        except IntegrityError:
+            # Another process created the buckets first
+            session.rollback()
+
+    per_bucket = {}
+    for seconds in latencies:
+        le = _format_value(next(bound for bound in PROBE_SECONDS.buckets if seconds <= bound))
+        count, total = per_bucket.get(le, (0, 0.0))
+        per_bucket[le] = (count + 1, total + seconds)
+    for le, (count, total) in per_bucket.items():
+        session.query(latency_model).filter(latency_model.le == le).update({
+            latency_model.count: latency_model.count + count,
+            latency_model.seconds: latency_model.seconds + total
+        }, synchronize_session=False)
+    session.commit()
+
+
+def directory_size(paths):
+    """Total size in bytes of the files directly inside the given directories"""
+    total = 0
+    for path in paths:
+        try:
+            with os.scandir(path) as entries:
+                total += sum(entry.stat().st_size for entry in entries if entry.is_file())
+        except OSError:
+            pass
+    return total
+
+
+class EncodeSampler:
+    """
+    Turns progress callbacks of one conversion into EncodeSample rows.
+
+    At most one row per rendition every interval seconds (plus forced final
+    samples) keeps the table compact. A ladder run encodes its renditions
+    in lockstep, so it is sampled once with the renditions joined by '+'.
+    """
+
+    def __init__(self, sample_model, movie_id, output_dir, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.sample_model = sample_model
+        self.movie_id = movie_id
+        self.output_dir = Path(output_dir)
+        self.interval = interval
+        self.last_sample = {}
+
+    def sample(self, rendition, stats, force=False):
+        """Return a new sample row when one is due, else None"""
+        now = time.time()
+        if not force and now - self.last_sample.get(rendition, 0) < self.interval:
+            return None
+        self.last_sample[rendition] = now
+
+        rendition_dirs = [self.output_dir / name for name in rendition.split('+')]
+        return self.sample_model(
+            movie_id=self.movie_id,
+            rendition=rendition,
+            recorded_at=now,
+            out_time=stats.get('out_time'),
+            fps=stats.get('fps'),
+            speed=stats.get('speed'),
+            bitrate_kbps=stats.get('bitrate_kbps'),
+            output_bytes=directory_size(rendition_dirs)
+        )
+
+
+def render_metrics(session, movie_model, sample_model, queue_depth, latency_model=None):
+    """Refresh the database backed metrics and render all metrics"""
+    if latency_model is not None:
+        PROBE_SECONDS.load({row.le: (row.count, row.seconds) for row in session.query(latency_model)})
+    JOBS.clear()
+    for status, count in session.query(movie_model.status, func.count(movie_model.id)).group_by(movie_model.status):
+        JOBS.set(count, status=status)
+    QUEUE_DEPTH.set(queue_depth)
+
+    # Latest sample of every (movie, rendition)
+    latest_ids = (
+        session.query(func.max(sample_model.id))
+        .group_by(sample_model.movie_id, sample_model.rendition)
+    )
+    latest = session.query(sample_model).filter(sample_model.id.in_(latest_ids)).all()
+
+    for gauge in (ENCODE_FPS, ENCODE_SPEED, ENCODE_BITRATE, ENCODE_OUTPUT_BYTES):
+        gauge.clear()
+    live_since = time.time() - LIVE_SAMPLE_WINDOW
+    for sample in latest:
+        if sample.recorded_at < live_since:
+            continue
+        labels = {'movie_id': sample.movie_id, 'rendition': sample.rendition}
+        ENCODE_FPS.set(sample.fps or 0, **labels)
+        ENCODE_SPEED.set(sample.speed or 0, **labels)
+        ENCODE_BITRATE.set(sample.bitrate_kbps or 0, **labels)
+        ENCODE_OUTPUT_BYTES.set(sample.output_bytes or 0, **labels)
+    OUTPUT_BYTES.set(sum(sample.output_bytes or 0 for sample in latest))
+
+    return registry.render()
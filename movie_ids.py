@@ -0,0 +1,135 @@
+import os
+import random
+import threading
+import time
+
+from sqlalchemy import text
+
+# Movie ID allocators. Both keep the MOV prefix used in output folder names,
+# never need an existence check per insert and sort by creation time.
+# Existing random IDs (MOV + 5-6 digits) are shorter than any generated
+# here, so old and new IDs can never collide. Only the sequence allocator
+# is unique across processes; inserts of time-ordered IDs are retried with
+# new IDs when one already exists.
+
+ID_PREFIX = 'MOV'
+BASE36 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def _to_base36(value, width):
+    digits = []
+    while value:
+        value, remainder = divmod(value, 36)
+        digits.append(BASE36[remainder])
+    return ''.join(reversed(digits)).rjust(width, '0')
+
+
+class TimeOrderedIdAllocator:
+    """
+    MOV + 9 base-36 digits of milliseconds since the epoch + 2 digits of
+    process node + 2 digits of sequence within the millisecond.
+
+    IDs of one process are unique and ordered. Up to 36^2 IDs share a
+    millisecond; a larger batch waits for the next millisecond instead of
+    running ahead of the clock. While the clock is behind the last
+    millisecond used (it was set back), IDs keep that millisecond and wait
+    once its sequence is used up, so a large step back stalls allocation
+    until the clock catches up. Processes are told apart by a random node,
+    two of them share one with a chance of 1 in 36^2, so IDs are not
+    guaranteed unique across processes.
+    """
+
+    SEQUENCE_SIZE = 36 ** 2
+
+    def __init__(self, prefix=ID_PREFIX):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.last_millis = 0
+        self.sequence = 0
+        self.node = _to_base36(random.Random(os.getpid() ^ time.time_ns()).randrange(36 ** 2), 2)
+
+    def _next_millis(self):
+        """Millisecond and sequence number of the next ID (lock held)"""
+        millis = int(time.time() * 1000)
+        if millis > self.last_millis:
+            self.last_millis = millis
+            self.sequence = 0
+        elif self.sequence + 1 < self.SEQUENCE_SIZE:
+            self.sequence += 1
+        else:
+            # This millisecond is used up, wait for the clock to pass it
+            while int(time.time() * 1000) <= self.last_millis:
+                time.sleep(0.001)
+            self.last_millis = int(time.time() * 1000)
+            self.sequence = 0
+        return self.last_millis, self.sequence
+
+    def allocate(self, count=1):
+        movie_ids = []
+        with self.lock:
+            for _ in range(count):
+                millis, sequence = self._next_millis()
+                movie_ids.append(f"{self.prefix}{_to_base36(millis, 9)}{self.node}{_to_base36(sequence, 2)}")
+        return movie_ids
+
+
+class SequenceIdAllocator:
+    """
+    MOV + 8-digit number from a counter table, reserved in blocks.
+
+    A block of block_size numbers is taken in its own short transaction, so
+    most inserts do not touch the database at all. Unused numbers of a block
+    are lost on restart, which only leaves gaps.
+    """
+
+    START_VALUE = 10000000
+
+    def __init__(self, get_engine, prefix=ID_PREFIX, block_size=100, name='movie'):
+        self.get_engine = get_engine
+        self.prefix = prefix
+        self.block_size = block_size
+        self.name = name
+        self.lock = threading.Lock()
+        self.next_value = 0
+        self.block_end = 0
+
+    def _reserve_block(self, size):
+        with self.get_engine().begin() as connection:
+            connection.execute(text(
+                'CREATE TABLE IF NOT EXISTS movie_id_sequence '
+                '(name VARCHAR(50) PRIMARY KEY, next_value BIGINT NOT NULL)'
+            ))
+            connection.execute(
+                text('INSERT INTO movie_id_sequence (name, next_value) SELECT :name, :value '
+                     'WHERE NOT EXISTS (SELECT 1 FROM movie_id_sequence WHERE name = :name)'),
+                {'name': self.name, 'value': self.START_VALUE}
+            )
+            connection.execute(
+                text('UPDATE movie_id_sequence SET next_value = next_value + :size WHERE name = :name'),
+                {'size': size, 'name': self.name}
+            )
+            block_end = connection.execute(
+                text('SELECT next_value FROM movie_id_sequence WHERE name = :name'),
+                {'name': self.name}
+            ).scalar()
+        self.next_value = block_end - size
+        self.block_end = block_end
+
+    def allocate(self, count=1):
+        movie_ids = []
+        with self.lock:
+            while len(movie_ids) < count:
+                if self.next_value >= self.block_end:
+                    self._reserve_block(max(self.block_size, count - len(movie_ids)))
+                movie_ids.append(f"{self.prefix}{self.next_value:08d}")
+                self.next_value += 1
+        return movie_ids
+
+
+def create_id_allocator(kind, get_engine=None, prefix=ID_PREFIX):
+    """Create the allocator configured for this deployment ('time' or 'sequence')"""
+    if kind == 'sequence':
+        return SequenceIdAllocator(get_engine, prefix=prefix)
+    if kind == 'time':
+        return TimeOrderedIdAllocator(prefix=prefix)
+    raise ValueError(f"Unknown movie ID allocator: {kind}")
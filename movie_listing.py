@@ -0,0 +1,77 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+# Keyset pagination helpers for the movie listing APIs of both apps.
+# Pages are ordered newest first on (created_at, id); the cursor is the
+# key of the last row of the previous page, so every page costs one
+# index range scan no matter how deep it is.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class ListingError(ValueError):
+    """Raised for invalid listing parameters (bad cursor, unknown field...)"""
+
+
+def encode_cursor(created_at, movie_id):
+    payload = json.dumps([created_at.isoformat() if created_at else None, movie_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, movie_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), movie_id
+    except (ValueError, TypeError):
+        raise ListingError('Invalid cursor')
+
+
+def parse_page_size(value):
+    """Parse the limit parameter, clamped to MAX_PAGE_SIZE"""
+    if not value:
+        return DEFAULT_PAGE_SIZE
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except ValueError:
+        raise ListingError('limit must be a number')
+
+
+def parse_fields(value, allowed, default):
+    """Parse the comma separated fields parameter against the allowed fields"""
+    if not value:
+        return list(default)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ListingError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def keyset_page(query, created_column, id_column, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Fetch one page of query, newest first.
+
+    The query must select created_column and id_column. Returns
+    (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if cursor:
+        created_at, movie_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            created_column < created_at,
+            and_(created_column == created_at, id_column < movie_id)
+        ))
+
+    rows = query.order_by(created_column.desc(), id_column.desc()).limit(page_size + 1).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]._mapping
+        next_cursor = encode_cursor(last[created_column.key], last[id_column.key])
+    return rows, next_cursor
@@ -0,0 +1,99 @@
+import json
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Parallel, bounded ffprobe runs for ingest scans.
+# Kept free of Flask/Celery imports so the simple mode can use it too.
+
+DEFAULT_PROBE_WORKERS = 8
+DEFAULT_PROBE_SIZE = 5 * 1024 * 1024      # bytes read to find the streams
+DEFAULT_ANALYZE_DURATION = 5 * 1000000    # microseconds of media analysed
+DEFAULT_PROBE_TIMEOUT = 30                # seconds per file
+
+
+def parse_video_info(probe):
+    """Turn ffprobe JSON output into the video info dict used across the app"""
+    video_stream = next((stream for stream in probe.get('streams', []) if stream.get('codec_type') == 'video'), None)
+    if not video_stream:
+        return None
+
+    audio_stream = next((stream for stream in probe.get('streams', []) if stream.get('codec_type') == 'audio'), None)
+
+    width = int(video_stream['width'])
+    height = int(video_stream['height'])
+    duration = probe.get('format', {}).get('duration') or video_stream.get('duration') or 0
+    # Containers like MKV only carry the overall bitrate, an upper bound for the video stream
+    bitrate = video_stream.get('bit_rate') or probe.get('format', {}).get('bit_rate')
+
+    return {
+        'resolution': f"{width}x{height}",
+        'width': width,
+        'height': height,
+        'duration': float(duration),
+        'format': probe.get('format', {}).get('format_name'),
+        'has_audio': audio_stream is not None,
+        'video_codec': video_stream.get('codec_name'),
+        'pix_fmt': video_stream.get('pix_fmt'),
+        'video_bitrate': int(bitrate) if bitrate else None,
+        'audio_codec': audio_stream.get('codec_name') if audio_stream else None
+    }
+
+
+def probe_file(file_path, probesize=DEFAULT_PROBE_SIZE, analyzeduration=DEFAULT_ANALYZE_DURATION,
+               timeout=DEFAULT_PROBE_TIMEOUT):
+    """
+    Probe a single file reading only its headers.
+
+    probesize/analyzeduration cap how much data ffprobe reads, and the
+    process is killed after timeout seconds. Returns None on any failure.
+    """
+    args = [
+        'ffprobe', '-v', 'error',
+        '-probesize', str(probesize),
+        '-analyzeduration', str(analyzeduration),
+        '-show_format', '-show_streams',
+        '-of', 'json',
+        str(file_path)
+    ]
+    try:
+        result = subprocess.run(args, stdin=subprocess.DEVNULL, capture_output=True, timeout=timeout)
+        if result.returncode != 0:
+            return None
+        return parse_video_info(json.loads(result.stdout))
+    except (subprocess.TimeoutExpired, ValueError, KeyError, OSError):
+        return None
+
+
+def probe_files(file_paths, max_workers=DEFAULT_PROBE_WORKERS, probesize=DEFAULT_PROBE_SIZE,
+                analyzeduration=DEFAULT_ANALYZE_DURATION, timeout=DEFAULT_PROBE_TIMEOUT, on_latency=None):
+    """
+    Probe many files on a bounded thread pool.
+
+    on_latency, if given, is called with the seconds every single probe
+    took. Returns ({file_path: video_info or None}, stats) where stats holds
+    the file count, elapsed seconds and throughput in files per second.
+    """
+    file_paths = list(file_paths)
+    start_time = time.time()
+    results = {}
+
+    def timed_probe(path):
+        started = time.perf_counter()
+        info = probe_file(path, probesize, analyzeduration, timeout)
+        if on_latency:
+            on_latency(time.perf_counter() - started)
+        return info
+
+    if file_paths:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(file_paths)))) as pool:
+            results = dict(zip(file_paths, pool.map(timed_probe, file_paths)))
+
+    elapsed = time.time() - start_time
+    stats = {
+        'probed_files': len(file_paths),
+        'failed_probes': sum(1 for info in results.values() if info is None),
+        'probe_seconds': round(elapsed, 3),
+        'probe_files_per_second': round(len(file_paths) / elapsed, 1) if elapsed > 0 else 0
+    }
+    return results, stats
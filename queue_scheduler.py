@@ -0,0 +1,69 @@
+import math
+
+# Ordering of the conversion queue.
+#
+# Queue entries carry a sparse position (POSITION_GAP apart), a priority and
+# an estimated cost. Moving or cancelling an entry only writes that row: a
+# moved entry takes a position between its new neighbours, and the queue is
+# only respaced in the rare case two neighbours have no room left between
+# them. The next job is the one with the highest priority, where every
+# aging_seconds an entry waits count as one extra priority level so nothing
+# starves. Within a level, 'fifo' keeps position order and 'shortest' runs
+# the cheapest job first (duration x pixels x renditions from the probe).
+# Kept free of Flask/Celery imports so the simple mode can use it too.
+
+POSITION_GAP = 1024
+QUEUE_POLICIES = ('fifo', 'shortest')
+DEFAULT_AGING_SECONDS = 1800
+
+
+def estimate_cost(video_info, renditions):
+    """Relative encode cost of a title (seconds x source pixels x renditions), None without probe data"""
+    if not video_info or not video_info.get('duration'):
+        return None
+    pixels = (video_info.get('width') or 0) * (video_info.get('height') or 0)
+    return float(video_info['duration']) * max(pixels, 1) * max(renditions, 1)
+
+
+def effective_priority(priority, waited_seconds, aging_seconds=DEFAULT_AGING_SECONDS):
+    """A priority raised by one level for every aging_seconds waited"""
+    if aging_seconds and aging_seconds > 0:
+        return (priority or 0) + int(max(waited_seconds, 0) // aging_seconds)
+    return priority or 0
+
+
+def scheduling_key(priority, position, cost, waited_seconds, policy='fifo', aging_seconds=DEFAULT_AGING_SECONDS):
+    """
+    Sort key of a queue entry, the smallest key runs next.
+
+    Under 'shortest' an entry without a cost estimate goes behind the
+    estimated ones of its priority level until aging lifts it.
+    """
+    if policy not in QUEUE_POLICIES:
+        raise ValueError(f"Unknown queue policy {policy!r}, expected one of {', '.join(QUEUE_POLICIES)}")
+    job_cost = 0
+    if policy == 'shortest':
+        job_cost = cost if cost is not None else math.inf
+    return (-effective_priority(priority, waited_seconds, aging_seconds), job_cost, position)
+
+
+def position_between(before, after):
+    """
+    A free position between two neighbouring positions (None for an open end).
+
+    Returns None when there is no room, the queue has to be respaced first.
+    """
+    if before is None and after is None:
+        return POSITION_GAP
+    if before is None:
+        return after - POSITION_GAP
+    if after is None:
+        return before + POSITION_GAP
+    if after - before > 1:
+        return (before + after) // 2
+    return None
+
+
+def spaced_positions(count):
+    """Evenly spaced positions for count entries"""
+    return [POSITION_GAP * (index + 1) for index in range(count)]
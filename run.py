@@ -12,6 +12,16 @@ if __name__ == '__main__':
     # Create INPUT and OUTPUT directories if they don't exist
     Config.init_app(app)
     
+    # Watch the INPUT folder (only in the reloader child when debugging)
+    if Config.WATCH_INPUT and (not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        from app.tasks import start_watch_folder
+        start_watch_folder()
+    
+    # Requeue conversions a dead worker left behind, now and periodically
+    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from app.tasks import start_job_reconciler
+        start_job_reconciler(app)
+    
     # Run the Flask app
     app.run(
         host='0.0.0.0',
@@ -1,5 +1,6 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 import os
 import subprocess
 import threading
@@ -7,16 +8,36 @@ import time
 from pathlib import Path
 import ffmpeg
 from datetime import datetime, timezone
-import random
 import logging
 from logging.handlers import RotatingFileHandler
-import string
 import json
+from hls_encoder import (AUDIO_BITRATE, AUDIO_GROUP_ID, PLAYLIST_VERSIONS, SEGMENT_FORMATS, audio_media_tag,
+                         encode_audio, encode_ladder, hls_output_options, passthrough_rendition,
+                         remux_rendition)
+from ffmpeg_progress import run_ffmpeg
+from checkpoints import (PLAYLIST_NAME, RESUME_PLAYLIST, PlaylistWatcher, checkpoint_for, finalize_playlist,
+                         merge_resumed, reset_to_checkpoint,
+                         resume_point, verify_checkpoint)
+from chunked_encoder import encode_chunked, default_chunk_workers
+from probe_engine import parse_video_info, probe_files
+from watch_folder import WatchFolderService, inotify_supported
+from movie_ids import create_id_allocator
+from movie_listing import ListingError, keyset_page, parse_fields, parse_page_size
+from metrics import EncodeSampler, instrument_commits, record_probe_latencies, render_metrics
+from db_writes import ProgressWriter, install_sqlite_pragmas
+from status_store import create_status_store
+from job_leases import (OWNER_ID, claim_lease, kill_orphaned_encoders, renew_leases, stale_movies,
+                        start_periodic)
+from conversion_slots import SlotPool
+from cpu_budget import encoder_threads
+from job_queue import (active_job, claim_next_job, complete_job, enqueue_job, queue_position, renew_job_leases,
+                       requeue_expired)
+from ladder_analysis import analyze_title, ladder_quality_settings, ladder_renditions, parse_bitrate
 
 # Simple Flask app without Celery
 # Configuration
 BASE_DIR = Path(__file__).parent
-DATABASE_PATH = BASE_DIR / 'data' / 'simple_video_dashboard.db'
+DATABASE_PATH = Path(os.environ.get('SIMPLE_DATABASE_PATH', BASE_DIR / 'data' / 'simple_video_dashboard.db'))
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'simple-video-dashboard'
 # app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///simple_video_dashboard.db'
@@ -50,12 +71,13 @@ app.logger.setLevel(logging.INFO)
 app.logger.info("Video Processing Dashboard starting up...")
 
 db = SQLAlchemy(app)
+instrument_commits()
 
 # Create data directory if it doesn't exist
-(BASE_DIR / 'data').mkdir(exist_ok=True)
+DATABASE_PATH.parent.mkdir(parents=True, exist_ok=True)
 print(f"Database will be created at: {DATABASE_PATH}")
-INPUT_FOLDER = BASE_DIR / 'INPUT'
-OUTPUT_FOLDER = BASE_DIR / 'OUTPUT'
+INPUT_FOLDER = Path(os.environ.get('INPUT_FOLDER', BASE_DIR / 'INPUT'))
+OUTPUT_FOLDER = Path(os.environ.get('OUTPUT_FOLDER', BASE_DIR / 'OUTPUT'))
 SEGMENT_DURATION = 10
 QUALITIES = {
     '720p': {'resolution': '1280:720', 'bitrate': '2500k'},
@@ -63,16 +85,75 @@ QUALITIES = {
     '360p': {'resolution': '640:360', 'bitrate': '600k'}
 }
 SUPPORTED_FORMATS = ['.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm']
+# 'ladder' decodes the source once and writes every quality in one ffmpeg run,
+# 'chunked' additionally splits long sources into chunks encoded in parallel,
+# 'per_quality' runs a separate ffmpeg process for each quality
+ENCODE_MODE = os.environ.get('ENCODE_MODE', 'ladder')
+CHUNK_SEGMENTS = int(os.environ.get('CHUNK_SEGMENTS', 30))  # segments per chunk
+CHUNK_WORKERS = int(os.environ.get('CHUNK_WORKERS', default_chunk_workers()))
+# ffprobe limits for folder scans: only headers are read, one bad file cannot stall a scan
+PROBE_WORKERS = int(os.environ.get('PROBE_WORKERS', 8))
+PROBE_SIZE = int(os.environ.get('PROBE_SIZE', 5 * 1024 * 1024))  # bytes
+PROBE_ANALYZE_DURATION = int(os.environ.get('PROBE_ANALYZE_DURATION', 5000000))  # microseconds
+PROBE_TIMEOUT = int(os.environ.get('PROBE_TIMEOUT', 30))  # seconds per file
+# Watch folder: pick up new files without a manual scan
+WATCH_INPUT = os.environ.get('WATCH_INPUT', '1') == '1'
+WATCH_AUTO_CONVERT = os.environ.get('WATCH_AUTO_CONVERT', '0') == '1'
+WATCH_SETTLE_SECONDS = int(os.environ.get('WATCH_SETTLE_SECONDS', 10))  # file must stop growing this long
+WATCH_RECONCILE_INTERVAL = int(os.environ.get('WATCH_RECONCILE_INTERVAL', 3600))  # full-tree walk
+ENCODE_SAMPLE_INTERVAL = int(os.environ.get('ENCODE_SAMPLE_INTERVAL', 10))  # seconds between throughput samples
+# Per-title ladder: trial-encode a few samples and pick bitrates/rungs per movie
+PER_TITLE_LADDER = os.environ.get('PER_TITLE_LADDER', '0') == '1'
+LADDER_SAMPLES = int(os.environ.get('LADDER_SAMPLES', 3))
+LADDER_SAMPLE_SECONDS = int(os.environ.get('LADDER_SAMPLE_SECONDS', 4))
+# 'ts' (a file per segment) or 'fmp4' (one byte-range addressed CMAF file per rendition)
+HLS_SEGMENT_FORMAT = os.environ.get('HLS_SEGMENT_FORMAT', 'ts')
+if HLS_SEGMENT_FORMAT not in SEGMENT_FORMATS:
+    raise ValueError(f"HLS_SEGMENT_FORMAT must be one of {', '.join(SEGMENT_FORMATS)}")
+# Encode audio once into an audio-only rendition shared by video-only renditions
+SHARED_AUDIO = os.environ.get('SHARED_AUDIO', '0') == '1'
+# Conversions renew a lease; one without a heartbeat for JOB_LEASE_SECONDS lost its process
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 60))
+HEARTBEAT_INTERVAL = int(os.environ.get('HEARTBEAT_INTERVAL', 15))
+RECONCILE_INTERVAL = int(os.environ.get('RECONCILE_INTERVAL', 30))  # requeue orphaned conversions
+# Conversions go through a job queue in the database; a job whose lease expired is retried after a backoff
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+JOB_BACKOFF_SECONDS = int(os.environ.get('JOB_BACKOFF_SECONDS', 30))  # doubles with every attempt
+JOB_BACKOFF_MAX_SECONDS = int(os.environ.get('JOB_BACKOFF_MAX_SECONDS', 1800))
+# Conversions running at once, each on an equal share of CONVERSION_CORES; changed at runtime with /api/slots
+CONVERSION_SLOTS = int(os.environ.get('CONVERSION_SLOTS', 1))
+CONVERSION_CORES = int(os.environ.get('CONVERSION_CORES', os.cpu_count() or 1))
+conversion_slots = SlotPool(CONVERSION_SLOTS, CONVERSION_CORES)
+# SQLite in WAL mode so dashboard reads never wait for encoder writes, progress committed every few seconds
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 30000))  # milliseconds
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+PROGRESS_FLUSH_INTERVAL = int(os.environ.get('PROGRESS_FLUSH_INTERVAL', 5))  # seconds
+install_sqlite_pragmas(SQLITE_BUSY_TIMEOUT, SQLITE_SYNCHRONOUS)
+# Remux (no re-encode) a source that already is H.264 at a rung's resolution and within its bitrate
+PASSTHROUGH = os.environ.get('PASSTHROUGH', '1') == '1'
 
 # Create directories
-INPUT_FOLDER.mkdir(exist_ok=True)
-OUTPUT_FOLDER.mkdir(exist_ok=True)
+INPUT_FOLDER.mkdir(parents=True, exist_ok=True)
+OUTPUT_FOLDER.mkdir(parents=True, exist_ok=True)
 
-# Global conversion status
-conversion_status = {}
+# Live conversion status, only changed through publish_status() so /events can stream it.
+# 'sqlite' (default) is shared by all processes on this host and survives restarts, 'redis'
+# is shared across hosts, 'memory' only lives in this process (see status_store.py)
+STATUS_STORE = os.environ.get('STATUS_STORE', 'sqlite')
+STATUS_DB_PATH = Path(os.environ.get('STATUS_DB_PATH', DATABASE_PATH.parent / 'live_status.db'))
+STATUS_REDIS_URL = os.environ.get('STATUS_REDIS_URL', 'redis://localhost:6379/1')
+# Removed movies are streamed as removals for this long, browsers offline for longer reload the list
+STATUS_TOMBSTONE_SECONDS = int(os.environ.get('STATUS_TOMBSTONE_SECONDS', 3600))
+status_store = create_status_store(STATUS_STORE, sqlite_path=STATUS_DB_PATH, redis_url=STATUS_REDIS_URL,
+                                   retention=STATUS_TOMBSTONE_SECONDS)
+SSE_KEEPALIVE_SECONDS = 15
+
+# Movie IDs: 'sequence' (counter table, unique across processes) or 'time' (time-ordered, no database access)
+MOVIE_ID_ALLOCATOR = os.environ.get('MOVIE_ID_ALLOCATOR', 'sequence')
+movie_id_allocator = create_id_allocator(MOVIE_ID_ALLOCATOR, lambda: db.engine)
 
 class Movie(db.Model):
-    id = db.Column(db.String(8), primary_key=True)
+    id = db.Column(db.String(20), primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
     file_size = db.Column(db.BigInteger, nullable=False)
@@ -82,6 +163,10 @@ class Movie(db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     completed_at = db.Column(db.DateTime)
     overall_progress = db.Column(db.Integer, default=0)
+    ladder = db.Column(db.Text)  # JSON per-title ladder, see ladder_analysis.py
+    checkpoints = db.Column(db.Text)  # JSON {rendition: checkpoint}, see checkpoints.py
+    owner = db.Column(db.String(100))  # process converting the movie, see job_leases.py
+    heartbeat_at = db.Column(db.Float)  # unix time the owner last renewed its lease
     
     def __init__(self, **kwargs):
         super(Movie, self).__init__(**kwargs)
@@ -90,27 +175,53 @@ class Movie(db.Model):
     
     @staticmethod
     def generate_movie_id():
-        while True:
-            digits = ''.join(random.choices(string.digits, k=random.randint(5, 6)))
-            movie_id = f"MOV{digits}"
-            if not Movie.query.filter_by(id=movie_id).first():
-                return movie_id
+        return movie_id_allocator.allocate(1)[0]
+    
+    @staticmethod
+    def generate_movie_ids(count):
+        """Generate several unique movie IDs without looking up existing ones"""
+        return movie_id_allocator.allocate(count)
     
     def get_output_folder_name(self):
         """Generate output folder name based on movie ID and subdirectory"""
-        if self.subdirectory:
+        return Movie.output_folder_name_for(self.id, self.subdirectory)
+    
+    @staticmethod
+    def output_folder_name_for(movie_id, subdirectory):
+        if subdirectory:
             # Clean subdirectory name for folder naming
-            clean_subdir = self.subdirectory.replace(' ', '_').replace('/', '_').replace('\\', '_')
-            return f"{self.id}_{clean_subdir}"
+            clean_subdir = subdirectory.replace(' ', '_').replace('/', '_').replace('\\', '_')
+            return f"{movie_id}_{clean_subdir}"
         else:
-            return self.id
+            return movie_id
     
     def get_target_qualities(self):
-        if not self.source_resolution:
+        return Movie.target_qualities_for(self.source_resolution, self.ladder)
+    
+    def get_checkpoints(self):
+        """Per-rendition conversion checkpoints as dictionary"""
+        try:
+            return json.loads(self.checkpoints) if self.checkpoints else {}
+        except ValueError:
+            return {}
+    
+    def set_checkpoints(self, checkpoints):
+        self.checkpoints = json.dumps(checkpoints)
+    
+    def get_quality_settings(self):
+        """QUALITIES with the bitrates of this movie's per-title ladder"""
+        return ladder_quality_settings(self.ladder, QUALITIES)
+    
+    @staticmethod
+    def target_qualities_for(source_resolution, ladder=None):
+        if ladder_renditions(ladder):
+            return ladder_renditions(ladder)
+        
+        if not source_resolution:
             return ['720p', '480p', '360p']
         
         try:
-            width, height = map(int, self.source_resolution.split('x'))
+            width, height = map(int, source_resolution.split('x'))
             
             # Calculate source quality based on pixel count, not just height
             source_pixels = width * height
@@ -154,23 +265,83 @@ class Movie(db.Model):
     #     else:
     #         return []
 
+# Keyset pagination of the listing walks (created_at, id)
+db.Index('ix_movie_created_at_id', Movie.created_at, Movie.id)
+
+# One row per file: (subdirectory, filename) is what scans diff against.
+# NULL subdirectories are coalesced so root-folder files are unique too.
+db.Index(
+    'ix_movie_subdirectory_filename',
+    db.func.coalesce(Movie.subdirectory, ''),
+    Movie.filename,
+    unique=True
+)
+
+class ProbeCache(db.Model):
+    """Cached ffprobe results keyed by file path, size and modification time"""
+    file_path = db.Column(db.String(500), primary_key=True)
+    file_size = db.Column(db.BigInteger, nullable=False)
+    mtime_ns = db.Column(db.BigInteger, nullable=False)
+    video_info = db.Column(db.Text)  # JSON string, 'null' if the probe failed
+    probed_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    def matches(self, file_size, mtime_ns):
+        return self.file_size == file_size and self.mtime_ns == mtime_ns
+    
+    def get_video_info(self):
+        try:
+            return json.loads(self.video_info) if self.video_info else None
+        except Exception:
+            return None
+    
+    def set_video_info(self, video_info):
+        self.video_info = json.dumps(video_info)
+
+class ProbeLatency(db.Model):
+    """Probe latency histogram shared by all processes, one row per bucket (see metrics.py)"""
+    le = db.Column(db.String(10), primary_key=True)  # upper bound of the bucket
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+    seconds = db.Column(db.Float, nullable=False, default=0.0)
+
+class EncodeSample(db.Model):
+    """Encode throughput of one rendition (or ladder run), sampled every few seconds"""
+    id = db.Column(db.Integer, primary_key=True)
+    movie_id = db.Column(db.String(20), nullable=False)
+    rendition = db.Column(db.String(50), nullable=False)
+    recorded_at = db.Column(db.Float, nullable=False)  # unix time
+    out_time = db.Column(db.Float)  # seconds of output encoded
+    fps = db.Column(db.Float)
+    speed = db.Column(db.Float)  # relative to realtime
+    bitrate_kbps = db.Column(db.Float)
+    output_bytes = db.Column(db.BigInteger)
+    
+    __table_args__ = (db.Index('ix_encode_sample_movie_rendition', 'movie_id', 'rendition', 'id'),)
+
+class ConversionJob(db.Model):
+    """A queued or finished conversion of a movie, see job_queue.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    movie_id = db.Column(db.String(20), nullable=False)
+    state = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.Float, nullable=False)  # unix time
+    available_at = db.Column(db.Float, nullable=False)  # not claimed before this (retry backoff)
+    owner = db.Column(db.String(100))  # process running the job
+    lease_until = db.Column(db.Float)
+    started_at = db.Column(db.Float)
+    finished_at = db.Column(db.Float)
+    last_error = db.Column(db.Text)
+    
+    __table_args__ = (
+        db.Index('ix_conversion_job_state_available', 'state', 'available_at', 'id'),
+        # At most one queued or running job per movie
+        db.Index('ix_conversion_job_active_movie', 'movie_id', unique=True,
+                 sqlite_where=db.text("state IN ('queued', 'running')")),
+    )
+
 # Utility Functions
 def get_video_info(file_path):
     try:
-        probe = ffmpeg.probe(file_path)
-        video_stream = next((stream for stream in probe['streams'] if stream['codec_type'] == 'video'), None)
-        
-        if video_stream:
-            width = int(video_stream['width'])
-            height = int(video_stream['height'])
-            duration = float(probe['format']['duration'])
-            
-            return {
-                'resolution': f"{width}x{height}",
-                'width': width,
-                'height': height,
-                'duration': duration
-            }
+        return parse_video_info(ffmpeg.probe(file_path))
     except Exception as e:
         app.logger.error(f"ERROR_[CONTEXT]: {str(e)}", exc_info=True)
         print(f"Error getting video info: {e}")
@@ -188,63 +359,168 @@ def format_file_size(size_bytes):
     
     return f"{size_bytes:.1f}{size_names[i]}"
 
+def update_probe_cache(file_path, stat, video_info, probe_cache):
+    """Store a fresh probe result for a new or changed file"""
+    cached = probe_cache.get(file_path)
+    if not cached:
+        cached = ProbeCache(file_path=file_path)
+        db.session.add(cached)
+        probe_cache[file_path] = cached
+    cached.file_size = stat.st_size
+    cached.mtime_ns = stat.st_mtime_ns
+    cached.set_video_info(video_info)
+    cached.probed_at = datetime.now(timezone.utc)
+
+def build_file_info(file_path, stat, video_info):
+    """Describe a video file found under the INPUT folder"""
+    # Get subdirectory name (relative to INPUT folder)
+    relative_path = file_path.relative_to(INPUT_FOLDER)
+    subdirectory = relative_path.parent.name if relative_path.parent != Path('.') else None
+    
+    return {
+        'filename': file_path.name,
+        'file_path': str(file_path),
+        'file_size': stat.st_size,
+        'video_info': video_info,
+        'subdirectory': subdirectory  # New field
+    }
+
 def scan_input_folder():
     """Scan INPUT folder and all subdirectories for video files"""
     video_files = []
+    scan_start_time = time.time()
     
     if not INPUT_FOLDER.exists():
-        return video_files
+        return video_files, {}
+    
+    # Load the whole probe cache in one query
+    probe_cache = {entry.file_path: entry for entry in ProbeCache.query.all()}
     
     # Recursively scan all subdirectories
+    candidates = []
     for file_path in INPUT_FOLDER.rglob('*'):  # rglob for recursive scanning
         if file_path.is_file() and file_path.suffix.lower() in SUPPORTED_FORMATS:
             try:
-                file_size = file_path.stat().st_size
-                video_info = get_video_info(str(file_path))
-                
-                # Get subdirectory name (relative to INPUT folder)
-                relative_path = file_path.relative_to(INPUT_FOLDER)
-                subdirectory = relative_path.parent.name if relative_path.parent != Path('.') else None
-                
-                video_files.append({
-                    'filename': file_path.name,
-                    'file_path': str(file_path),
-                    'file_size': file_size,
-                    'video_info': video_info,
-                    'subdirectory': subdirectory  # New field
-                })
+                candidates.append((file_path, file_path.stat()))
             except Exception as e:
                 app.logger.error(f"ERROR_[CONTEXT]: {str(e)}", exc_info=True)
                 print(f"Error processing file {file_path}: {e}")
     
-    return video_files
+    # Probe only new or changed files, in parallel
+    stale_paths = [
+        str(file_path) for file_path, stat in candidates
+        if not (str(file_path) in probe_cache
+                and probe_cache[str(file_path)].matches(stat.st_size, stat.st_mtime_ns))
+    ]
+    latencies = []
+    probe_results, scan_stats = probe_files(
+        stale_paths,
+        max_workers=PROBE_WORKERS,
+        probesize=PROBE_SIZE,
+        analyzeduration=PROBE_ANALYZE_DURATION,
+        timeout=PROBE_TIMEOUT,
+        on_latency=latencies.append
+    )
+    record_probe_latencies(db.session, ProbeLatency, latencies)
+    
+    for file_path, stat in candidates:
+        try:
+            if str(file_path) in probe_results:
+                video_info = probe_results[str(file_path)]
+                update_probe_cache(str(file_path), stat, video_info, probe_cache)
+            else:
+                video_info = probe_cache[str(file_path)].get_video_info()
+            
+            video_files.append(build_file_info(file_path, stat, video_info))
+        except Exception as e:
+            app.logger.error(f"ERROR_[CONTEXT]: {str(e)}", exc_info=True)
+            print(f"Error processing file {file_path}: {e}")
+    
+    # Forget files that are no longer in the INPUT folder
+    seen_paths = {str(file_path) for file_path, _ in candidates}
+    for path, entry in probe_cache.items():
+        if path not in seen_paths:
+            db.session.delete(entry)
+    db.session.commit()
+    
+    elapsed = time.time() - scan_start_time
+    scan_stats['scanned_files'] = len(video_files)
+    scan_stats['scan_seconds'] = round(elapsed, 3)
+    scan_stats['files_per_second'] = round(len(video_files) / elapsed, 1) if elapsed > 0 else 0
+    app.logger.info(
+        f"SCAN_THROUGHPUT: {len(video_files)} files in {elapsed:.2f}s "
+        f"({scan_stats['files_per_second']} files/s), probed {scan_stats['probed_files']} "
+        f"({scan_stats['probe_files_per_second']} files/s)"
+    )
+    
+    return video_files, scan_stats
 
 import threading
 import time
-import re
 from datetime import datetime
 
-def convert_video_simple(movie_id):
-    """Simple video conversion with subdirectory support"""
-    global conversion_status
-    
+def publish_status(movie_id, status=None):
+    """Store the live status of a movie and wake /events streams; None means it was deleted"""
+    # A running conversion reports the slot it runs in
+    slot = conversion_slots.slot_of(movie_id)
+    if slot and status and status.get('status') == 'IN_PROGRESS':
+        status = dict(status, slot=slot)
+    try:
+        status_store.publish(movie_id, status)
+    except Exception as e:
+        # The dashboard falls behind, the conversion itself goes on
+        app.logger.error(f"ERROR_[STATUS_STORE]: {str(e)}")
+
+def estimate_eta(start_time, progress):
+    """Remaining time as HH:MM from elapsed time and a 0-100 progress"""
+    if progress <= 5:  # Only calculate ETA after 5% to avoid wild estimates
+        return "--:--"
+    elapsed_time = time.time() - start_time
+    remaining_time = elapsed_time * (100 / progress) - elapsed_time
+    eta_hours = int(remaining_time // 3600)
+    eta_minutes = int((remaining_time % 3600) // 60)
+    return f"{eta_hours:02d}:{eta_minutes:02d}"
+
+def record_checkpoint(movie, rendition, rendition_dir, done=False, watcher=None):
+    """
+    Store what rendition_dir holds as the movie's checkpoint, True if it changed (caller commits).
+
+    With a PlaylistWatcher the files are only read when a new segment was written.
+    """
+    if watcher and not done and not watcher.changed(rendition_dir):
+        return False
+    checkpoints = movie.get_checkpoints()
+    checkpoint = checkpoint_for(rendition_dir, done)
+    if checkpoints.get(rendition) == checkpoint:
+        return False
+    checkpoints[rendition] = checkpoint
+    movie.set_checkpoints(checkpoints)
+    return True
+
+def convert_video_simple(movie_id, cores=None):
+    """Simple video conversion with subdirectory support, on cores ffmpeg threads if given"""
     with app.app_context():
         try:
             movie = db.session.get(Movie, movie_id)
             if not movie:
                 return
             
+            # Take the lease, unless another live process is converting this movie
+            if not claim_lease(db.session, Movie, movie_id, lease_seconds=JOB_LEASE_SECONDS):
+                app.logger.warning(f"CONVERSION_SKIPPED: Movie {movie_id} is being converted by another process")
+                return
+            db.session.refresh(movie)
+            
             # Update status
-            movie.status = 'IN_PROGRESS'
             app.logger.info(f"CONVERSION_START: Movie {movie_id} ({movie.filename}) - Status: IN_PROGRESS, Initial Progress: 0%")
             movie.overall_progress = 0
             conversion_start_time = time.time()
             db.session.commit()
-            conversion_status[movie_id] = {
+            publish_status(movie_id, {
                 'status': 'IN_PROGRESS',
                 'progress': 0,
                 'start_time': conversion_start_time
-                }
+                })
             
             # Display subdirectory info
             subdir_info = f" (Subdirectory: {movie.subdirectory})" if movie.subdirectory else " (Root folder)"
@@ -260,21 +536,48 @@ def convert_video_simple(movie_id):
                 movie.source_resolution = video_info['resolution']
                 db.session.commit()
             
+            # Pick this title's bitrates and rungs from a few trial encodes
+            if PER_TITLE_LADDER and not movie.ladder and total_duration > 0:
+                analysis_start = time.time()
+                ladder = analyze_title(
+                    movie.file_path,
+                    total_duration,
+                    movie.get_target_qualities(),
+                    QUALITIES,
+                    samples=LADDER_SAMPLES,
+                    sample_seconds=LADDER_SAMPLE_SECONDS
+                )
+                if ladder:
+                    movie.ladder = json.dumps(ladder)
+                    db.session.commit()
+                    app.logger.info(
+                        f"LADDER_CHOSEN: Movie {movie_id} - complexity {ladder['complexity_kbps']} kbps, "
+                        f"renditions {ladder['renditions']} ({time.time() - analysis_start:.1f}s)"
+                    )
+                else:
+                    app.logger.warning(f"LADDER_SKIPPED: Movie {movie_id} - analysis failed, using QUALITIES")
+            
             # Create output directory with new naming convention
             output_folder_name = movie.get_output_folder_name()
             output_dir = OUTPUT_FOLDER / output_folder_name
             output_dir.mkdir(exist_ok=True)
             
             print(f"📂 Output directory: {output_folder_name}")
+            sampler = EncodeSampler(EncodeSample, movie_id, output_dir, ENCODE_SAMPLE_INTERVAL)
+            # Samples and checkpoints written during encodes are committed in batches
+            progress_writer = ProgressWriter(db.session, PROGRESS_FLUSH_INTERVAL)
+            playlist_watcher = PlaylistWatcher()
             
             target_qualities = movie.get_target_qualities()
+            quality_settings = movie.get_quality_settings()
             
             if not target_qualities:
                 movie.status = 'DONE'
+                movie.owner = None
                 movie.overall_progress = 100
                 movie.completed_at = datetime.now(timezone.utc)
                 db.session.commit()
-                conversion_status[movie_id] = {'status': 'DONE', 'progress': 100}
+                publish_status(movie_id, {'status': 'DONE', 'progress': 100})
                 return
             
             # Start progress monitoring thread
@@ -291,91 +594,317 @@ def convert_video_simple(movie_id):
             )
             monitor_thread.start()
             
-            # Convert each quality
-            completed_qualities = []
             total_qualities = len(target_qualities)
+            has_audio = video_info.get('has_audio', True) if video_info else True
+            passthrough = passthrough_rendition(video_info, target_qualities, QUALITIES) if PASSTHROUGH else None
+            
+            # Renditions an earlier attempt finished are kept, partly written ones
+            # continue from their last complete segment (see checkpoints.py)
+            checkpoints = movie.get_checkpoints()
+            verified = {
+                rendition: verify_checkpoint(
+                    output_dir / rendition, checkpoints.get(rendition),
+                    resumable=HLS_SEGMENT_FORMAT == 'ts' and rendition not in (passthrough, AUDIO_GROUP_ID)
+                )
+                for rendition in target_qualities + [AUDIO_GROUP_ID]
+            }
+            completed_qualities = [q for q in target_qualities if verified[q]['done']]
+            partial = {q: len(verified[q]['entries']) for q in target_qualities
+                       if verified[q]['entries'] and not verified[q]['done']}
+            if completed_qualities or partial:
+                app.logger.info(
+                    f"RESUME: Movie {movie_id} - Keeping finished {completed_qualities}, "
+                    f"continuing {partial} (segments already written)"
+                )
             
-            for i, quality in enumerate(target_qualities):
+            # One audio rendition for the whole ladder, the video renditions then carry no audio
+            shared_audio = False
+            if SHARED_AUDIO and has_audio and verified[AUDIO_GROUP_ID]['done']:
+                shared_audio = True
+            elif SHARED_AUDIO and has_audio:
+                try:
+                    reset_to_checkpoint(output_dir / AUDIO_GROUP_ID, [])
+                    result = encode_audio(movie.file_path, output_dir, SEGMENT_DURATION, total_duration=total_duration,
+                                          segment_format=HLS_SEGMENT_FORMAT)
+                    shared_audio = bool(result['completed'])
+                    if shared_audio:
+                        record_checkpoint(movie, AUDIO_GROUP_ID, output_dir / AUDIO_GROUP_ID, done=True)
+                        db.session.commit()
+                        app.logger.info(f"AUDIO_DONE: Movie {movie_id} - Shared audio rendition written")
+                    else:
+                        app.logger.warning(
+                            f"AUDIO_FAILED: Movie {movie_id} - Muxing audio into every rendition instead: "
+                            + ' | '.join(result['stderr_tail'][-3:])
+                        )
+                except Exception as e:
+                    app.logger.error(f"ERROR_[CONTEXT]: {str(e)}", exc_info=True)
+            mux_audio = has_audio and not shared_audio
+            
+            # A source that already fits a rung is cut into segments as it is;
+            # the configured bitrate is the cap, the per-title one only a target
+            if passthrough and passthrough not in completed_qualities:
+                app.logger.info(f"PASSTHROUGH_START: Movie {movie_id} - Remuxing source as {passthrough}")
+                print(f"\n⚡ Source already fits {passthrough}, remuxing without re-encoding...")
+                progress_data['current_quality'] = passthrough
+                progress_data['current_progress'] = 0
+                
+                def on_passthrough_progress(percent, stats):
+                    if percent is None:
+                        return
+                    progress_data['current_progress'] = percent
+                    progress = int((len(completed_qualities) + percent / 100) / total_qualities * 90)
+                    publish_status(movie_id, {
+                        'status': 'IN_PROGRESS',
+                        'progress': progress,
+                        'eta': estimate_eta(conversion_start_time, progress),
+                        'start_time': conversion_start_time,
+                        'renditions': {passthrough: int(percent)},
+                        'fps': stats.get('fps'),
+                        'speed': stats.get('speed')
+                    })
+                    sample = sampler.sample(passthrough, stats, force=stats['done'])
+                    if sample:
+                        db.session.add(sample)
+                        progress_writer.changed()
+                
+                try:
+                    reset_to_checkpoint(output_dir / passthrough, [])
+                    result = remux_rendition(
+                        movie.file_path,
+                        output_dir,
+                        passthrough,
+                        SEGMENT_DURATION,
+                        total_duration=total_duration,
+                        has_audio=mux_audio,
+                        copy_audio=video_info.get('audio_codec') == 'aac',
+                        on_progress=on_passthrough_progress,
+                        segment_format=HLS_SEGMENT_FORMAT
+                    )
+                    if result['completed']:
+                        completed_qualities.append(passthrough)
+                        record_checkpoint(movie, passthrough, output_dir / passthrough, done=True)
+                        movie.overall_progress = int(len(completed_qualities) / total_qualities * 90)
+                        db.session.commit()
+                        print(f"✅ Remuxed {passthrough} at {datetime.now().strftime('%H:%M:%S')}")
+                    else:
+                        app.logger.warning(
+                            f"PASSTHROUGH_FAILED: Movie {movie_id} - {passthrough} will be encoded: "
+                            + ' | '.join(result['stderr_tail'][-3:])
+                        )
+                except Exception as e:
+                    app.logger.error(f"ERROR_[CONTEXT]: {str(e)}", exc_info=True)
+                    print(f"❌ Remux failed, encoding {passthrough} instead: {e}")
+            if passthrough in completed_qualities:
+                # The master playlist advertises what the rendition really is
+                quality_settings = dict(quality_settings)
+                quality_settings[passthrough] = dict(
+                    quality_settings[passthrough], bitrate=str(video_info['video_bitrate'])
+                )
+            
+            pending_qualities = [q for q in target_qualities if q not in completed_qualities]
+            
+            # Decode once and encode the whole ladder in a single ffmpeg run,
+            # split into parallel chunks when the source is long enough
+            ladder_qualities = [q for q in pending_qualities if q in quality_settings]
+            # Chunks are stitched segment file by segment file, so single-file fMP4 encodes in one pass
+            use_chunked = (ENCODE_MODE == 'chunked' and HLS_SEGMENT_FORMAT == 'ts' and ladder_qualities
+                           and total_duration > SEGMENT_DURATION * CHUNK_SEGMENTS)
+            use_ladder = ENCODE_MODE in ('ladder', 'chunked') and len(ladder_qualities) > 1
+            if use_chunked or use_ladder:
+                pass_name = f"{CHUNK_WORKERS} parallel chunks" if use_chunked else "a single pass"
+                app.logger.info(f"LADDER_START: Movie {movie_id} - Encoding {ladder_qualities} in {pass_name}")
+                print(f"\n🔄 Converting {', '.join(ladder_qualities)} in {pass_name}...")
+                print(f"⏰ Started at: {datetime.now().strftime('%H:%M:%S')}")
+                progress_data['current_quality'] = '+'.join(ladder_qualities)
+                progress_data['current_progress'] = 0
+                
+                # Chunks are written to a scratch folder, only a single pass can continue a rendition
+                resume = (0, 0) if use_chunked else resume_point({q: verified[q] for q in ladder_qualities})
+                for quality in ladder_qualities:
+                    reset_to_checkpoint(output_dir / quality, verified[quality]['entries'][:resume[0]])
+                if resume[0]:
+                    app.logger.info(f"LADDER_RESUME: Movie {movie_id} - Continuing at segment {resume[0]} ({resume[1]}s)")
+                
+                done_before = len(completed_qualities)
+                
+                def on_ladder_progress(rendition_progress, stats):
+                    progress_data['current_progress'] = sum(rendition_progress.values()) / len(rendition_progress)
+                    progress = int((done_before + progress_data['current_progress'] / 100 * len(ladder_qualities))
+                                   / total_qualities * 90)
+                    publish_status(movie_id, {
+                        'status': 'IN_PROGRESS',
+                        'progress': progress,
+                        'eta': estimate_eta(conversion_start_time, progress),
+                        'start_time': conversion_start_time,
+                        'renditions': {q: int(p) for q, p in rendition_progress.items()},
+                        'fps': stats.get('fps'),
+                        'speed': stats.get('speed')
+                    })
+                    sample = sampler.sample('+'.join(ladder_qualities), stats,
+                                            force=min(rendition_progress.values()) >= 100)
+                    if sample:
+                        db.session.add(sample)
+                    changed = [record_checkpoint(movie, q, output_dir / q, watcher=playlist_watcher)
+                               for q in ladder_qualities]
+                    if sample or any(changed):
+                        progress_writer.changed()
+                
+                try:
+                    if use_chunked:
+                        result = encode_chunked(
+                            movie.file_path,
+                            output_dir,
+                            ladder_qualities,
+                            quality_settings,
+                            SEGMENT_DURATION,
+                            total_duration,
+                            has_audio=mux_audio,
+                            chunk_segments=CHUNK_SEGMENTS,
+                            max_workers=min(CHUNK_WORKERS, cores) if cores else CHUNK_WORKERS,
+                            on_progress=on_ladder_progress,
+                            cpu_budget=cores
+                        )
+                    else:
+                        result = encode_ladder(
+                            movie.file_path,
+                            output_dir,
+                            ladder_qualities,
+                            quality_settings,
+                            SEGMENT_DURATION,
+                            total_duration=total_duration,
+                            has_audio=mux_audio,
+                            on_progress=on_ladder_progress,
+                            segment_format=HLS_SEGMENT_FORMAT,
+                            resume=resume if resume[0] else None,
+                            threads=encoder_threads(cores, len(ladder_qualities)) if cores else None
+                        )
+                    completed_qualities.extend(result['completed'])
+                    for quality in result['completed']:
+                        record_checkpoint(movie, quality, output_dir / quality, done=True)
+                    if result['failed']:
+                        app.logger.warning(
+                            f"LADDER_PARTIAL: Movie {movie_id} - Failed {result['failed']} "
+                            f"(exit code {result['returncode']}), retrying them one by one"
+                        )
+                    print(f"✅ Completed {completed_qualities} at {datetime.now().strftime('%H:%M:%S')}")
+                except Exception as e:
+                    app.logger.error(f"ERROR_[CONTEXT]: {str(e)}", exc_info=True)
+                    print(f"❌ Ladder encode failed, falling back to per-quality encodes: {e}")
+                
+                pending_qualities = [q for q in target_qualities if q not in completed_qualities]
+                movie.overall_progress = int((len(completed_qualities) / total_qualities) * 90)
+                db.session.commit()
+            
+            # Convert each remaining quality separately
+            for quality in pending_qualities:
+                i = target_qualities.index(quality)
                 app.logger.info(f"QUALITY_START: Movie {movie_id} - Starting {quality} conversion ({i+1}/{total_qualities})")
                 try:
-                    quality_config = QUALITIES[quality]
+                    quality_config = quality_settings[quality]
                     quality_dir = output_dir / quality
                     quality_dir.mkdir(exist_ok=True)
-                    playlist_path = quality_dir / 'playlist.m3u8'
+                    
+                    # Continue from the last complete segment an earlier attempt (or the ladder run) wrote
+                    checkpoint = verify_checkpoint(quality_dir, movie.get_checkpoints().get(quality),
+                                                   resumable=HLS_SEGMENT_FORMAT == 'ts' and quality != passthrough)
+                    start_number, start = resume_point({quality: checkpoint})
+                    reset_to_checkpoint(quality_dir, checkpoint['entries'])
+                    playlist_path = quality_dir / (RESUME_PLAYLIST if start_number else PLAYLIST_NAME)
+                    resume_args = {'output_ts_offset': start, 'start_number': start_number} if start_number else {}
                     
                     # Update current quality being processed
                     progress_data['current_quality'] = quality
                     progress_data['current_progress'] = 0
+                    progress_data['last_logged_progress'] = -1
                     
                     print(f"\n🔄 Converting to {quality}...")
                     print(f"⏰ Started at: {datetime.now().strftime('%H:%M:%S')}")
                     
                     # Create FFmpeg command with progress
-                    input_stream = ffmpeg.input(movie.file_path)
+                    input_stream = ffmpeg.input(movie.file_path, **({'ss': start} if start_number else {}))
+                    audio_args = {'acodec': 'aac', 'ab': AUDIO_BITRATE} if mux_audio else {'an': None}
                     output_stream = input_stream.output(
                         str(playlist_path),
                         vf=f"scale={quality_config['resolution']}",
                         vcodec='libx264',
                         vb=quality_config['bitrate'],
-                        acodec='aac',
-                        ab='128k',
-                        f='hls',
-                        hls_time=SEGMENT_DURATION,
-                        hls_playlist_type='vod',
-                        hls_segment_filename=str(quality_dir / 'segment_%03d.ts'),
-                        hls_flags='independent_segments',
+                        **audio_args,
+                        **hls_output_options(quality_dir, SEGMENT_DURATION, HLS_SEGMENT_FORMAT,
+                                             ['independent_segments']),
                         force_key_frames=f'expr:gte(t,n_forced*{SEGMENT_DURATION})',
                         g=250,
                         keyint_min=250,
                         sc_threshold=0,
+                        **resume_args,
+                        **({'threads': cores} if cores else {})
                     )
                     
-                    # Run FFmpeg with progress monitoring
-                    process = ffmpeg.run_async(
-                        output_stream, 
-                        pipe_stderr=True, 
-                        overwrite_output=True,
-                        quiet=False
-                    )
-                    
-                    # Monitor FFmpeg progress
-                    monitor_ffmpeg_progress(process, total_duration, progress_data, quality)
+                    def on_quality_progress(percent, stats):
+                        if percent is None:
+                            return
+                        progress_data['current_progress'] = percent
+                        progress = int((len(completed_qualities) + percent / 100) / total_qualities * 90)
+                        publish_status(movie_id, {
+                            'status': 'IN_PROGRESS',
+                            'progress': progress,
+                            'eta': estimate_eta(conversion_start_time, progress),
+                            'start_time': conversion_start_time,
+                            'renditions': {quality: int(percent)},
+                            'fps': stats.get('fps'),
+                            'speed': stats.get('speed')
+                        })
+                        sample = sampler.sample(quality, stats, force=stats['done'])
+                        if sample:
+                            db.session.add(sample)
+                        if record_checkpoint(movie, quality, quality_dir, watcher=playlist_watcher) or sample:
+                            progress_writer.changed()
+                        # Log every 10% progress milestone
+                        if int(percent) // 10 != progress_data.get('last_logged_progress', -1):
+                            progress_data['last_logged_progress'] = int(percent) // 10
+                            app.logger.info(
+                                f"FFMPEG_PROGRESS: {quality} conversion - {percent:.1f}% complete "
+                                f"(speed {stats.get('speed')}x, {stats.get('fps')} fps)"
+                            )
                     
-                    # Wait for completion
-                    process.wait()
+                    # Run FFmpeg with progress reported on its -progress pipe
+                    result = run_ffmpeg(
+                        output_stream.compile(overwrite_output=True),
+                        total_duration,
+                        on_quality_progress,
+                        offset=start
+                    )
                     
-                    if process.returncode == 0:
+                    if (result['returncode'] == 0 and (not start_number or merge_resumed(quality_dir))
+                            and finalize_playlist(quality_dir / PLAYLIST_NAME)):
                         completed_qualities.append(quality)
+                        record_checkpoint(movie, quality, quality_dir, done=True)
                         print(f"✅ Completed {quality} conversion at {datetime.now().strftime('%H:%M:%S')}")
                         
                         # Update overall progress
-                        overall_progress = int(((i + 1) / total_qualities) * 90)
+                        overall_progress = int((len(completed_qualities) / total_qualities) * 90)
                         app.logger.info(f"PROGRESS_UPDATE: Movie {movie_id} - Overall Progress: {overall_progress}% - Completed {quality}")
                         movie.overall_progress = overall_progress
 
                         # Calculate ETA for overall conversion
-                        elapsed_time = time.time() - conversion_start_time
-                        if overall_progress > 5:
-                            estimated_total_time = elapsed_time * (100 / overall_progress)
-                            remaining_time = estimated_total_time - elapsed_time
-                            eta_hours = int(remaining_time // 3600)
-                            eta_minutes = int((remaining_time % 3600) // 60)
-                            eta_str = f"{eta_hours:02d}:{eta_minutes:02d}"
-                        else:
-                            eta_str = "--:--"
+                        eta_str = estimate_eta(conversion_start_time, overall_progress)
 
                         db.session.commit()
-                        conversion_status[movie_id] = {
+                        publish_status(movie_id, {
                             'status': 'IN_PROGRESS',
                             'progress': overall_progress,
-                            'eta': eta_str
-                            }
+                            'eta': eta_str,
+                            'start_time': conversion_start_time
+                            })
                         app.logger.info(
                             f"PROGRESS_UPDATE: Movie {movie_id} - Overall Progress: {overall_progress}% - "
                             f"Completed {quality} - ETA: {eta_str}"
                         )
                     else:
                         print(f"❌ Failed {quality} conversion")
+                        app.logger.error(
+                            f"ERROR_[FFMPEG]: {quality} exited with {result['returncode']}: "
+                            + ' | '.join(result['stderr_tail'][-5:])
+                        )
                         
                 except Exception as e:
                     app.logger.error(f"ERROR_[CONTEXT]: {str(e)}", exc_info=True)
@@ -386,21 +915,22 @@ def convert_video_simple(movie_id):
             
             # Create master playlist
             if completed_qualities:
-                create_master_playlist(output_folder_name, completed_qualities)  # Updated function call
+                create_master_playlist(output_folder_name, completed_qualities, quality_settings, shared_audio)
                 print(f"\n📋 Created master playlist with qualities: {completed_qualities}")
             
             # Update final status
             movie.status = 'DONE' if completed_qualities else 'ERROR'
+            movie.owner = None
             app.logger.info(f"CONVERSION_COMPLETE: Movie {movie_id} - Final Status: {movie.status}, Progress: 100%, Qualities: {completed_qualities}")
             movie.overall_progress = 100
             movie.completed_at = datetime.now(timezone.utc)
             db.session.commit()
             
-            conversion_status[movie_id] = {
+            publish_status(movie_id, {
                 'status': movie.status, 
                 'progress': 100,
                 'completed_qualities': completed_qualities
-            }
+            })
             
             print(f"\n🎉 Conversion completed for {movie.filename}")
             print(f"📂 Output folder: {output_folder_name}")
@@ -415,15 +945,16 @@ def convert_video_simple(movie_id):
                 movie = db.session.get(Movie, movie_id)
                 if movie:
                     movie.status = 'ERROR'
+                    movie.owner = None
                     movie.completed_at = datetime.now()
                     db.session.commit()
             except Exception as e:
                 app.logger.error(f"ERROR_[CONTEXT]: {str(e)}", exc_info=True)
                 pass
-            conversion_status[movie_id] = {'status': 'ERROR', 'progress': 0}
+            publish_status(movie_id, {'status': 'ERROR', 'progress': 0})
 
 def monitor_progress(movie_id, filename, progress_data, subdirectory=None):
-    """Background thread to display progress every 30 seconds"""
+    """Background thread to display progress every 30 seconds, as the status store shows it to the dashboard"""
     last_update = time.time()
     
     while not progress_data['stop_monitoring']:
@@ -431,119 +962,143 @@ def monitor_progress(movie_id, filename, progress_data, subdirectory=None):
         
         # Update every 30 seconds
         if current_time - last_update >= 30:
-            if progress_data['current_quality'] and progress_data['current_progress'] > 0:
-                # Calculate ETA
-                elapsed_time = current_time - progress_data['start_time']
-                progress_percent = progress_data['current_progress']
-
-                if progress_percent > 5:  # Only calculate ETA after 5% to avoid wild estimates
-                    estimated_total_time = elapsed_time * (100 / progress_percent)
-                    remaining_time = estimated_total_time - elapsed_time
-                    eta_hours = int(remaining_time // 3600)
-                    eta_minutes = int((remaining_time % 3600) // 60)
-                    eta_str = f"{eta_hours:02d}:{eta_minutes:02d}"
-                else:
-                    eta_str = "--:--"
+            try:
+                status = status_store.get(movie_id) or {}
+            except Exception as e:
+                app.logger.error(f"ERROR_[STATUS_STORE]: {str(e)}")
+                status = {}
+            if progress_data['current_quality'] and status.get('progress'):
+                eta_str = status.get('eta') or estimate_eta(progress_data['start_time'], status['progress'])
+                renditions = status.get('renditions') or {progress_data['current_quality']: 0}
+                rendition_info = ', '.join(f"{quality} {percent}%" for quality, percent in renditions.items())
 
                 subdir_info = f" (📁 {subdirectory})" if subdirectory else " (📁 Root)"
                 logger.info(
                     f"LIVE_PROGRESS: {movie_id} | {filename}{subdir_info} | "
-                    f"{progress_data['current_quality']} | {progress_data['current_progress']:.2f}% | "
-                    f"ETA: {eta_str}"
+                    f"{rendition_info} | {status['progress']}% | ETA: {eta_str}"
                 )
                 print(f"\nPROGRESS UPDATE:")
                 print(f"-------File: {filename}{subdir_info}")
-                print(f"-------{movie_id} | {progress_data['current_quality']} | {progress_data['current_progress']:.1f}% | ETA: {eta_str} | {datetime.now().strftime('%H:%M:%S')}")
+                print(f"-------{movie_id} | {rendition_info} | {status['progress']}% | ETA: {eta_str} | {datetime.now().strftime('%H:%M:%S')}")
                 print("-" * 40)
             
             last_update = current_time
         
         time.sleep(5)  # Check every 5 seconds, update every 30
 
-def monitor_ffmpeg_progress(process, total_duration, progress_data, quality):
-    """Monitor FFmpeg stderr for progress information"""
-    try:
-        current_time = 0
-        
-        while True:
-            line = process.stderr.readline()
-            if not line:
-                break
-                
-            line = line.decode('utf-8', errors='ignore')
-            
-            # Parse FFmpeg progress line
-            # Look for time=00:01:23.45 format
-            time_match = re.search(r'time=(\d+):(\d+):(\d+\.?\d*)', line)
-            if time_match:
-                hours = int(time_match.group(1))
-                minutes = int(time_match.group(2))
-                seconds = float(time_match.group(3))
-                
-                current_time = hours * 3600 + minutes * 60 + seconds
-                
-                if total_duration > 0:
-                    progress = (current_time / total_duration) * 100
-                    progress_data['current_progress'] = min(progress, 100)
-                    # Log every 10% progress milestone
-                    if int(progress) % 10 == 0 and int(progress) != int(progress_data.get('last_logged_progress', -1)):
-                        app.logger.info(f"FFMPEG_PROGRESS: {quality} conversion - {progress:.1f}% complete")
-                        progress_data['last_logged_progress'] = progress
-                    
-    except Exception as e:
-        app.logger.error(f"ERROR_[CONTEXT]: {str(e)}", exc_info=True)
-        print(f"Error monitoring FFmpeg progress: {e}")
-
-def create_master_playlist(output_folder_name, qualities):
+def create_master_playlist(output_folder_name, qualities, quality_settings=None, shared_audio=False):
     """Create master playlist with updated folder naming"""
     output_dir = OUTPUT_FOLDER / output_folder_name
     master_playlist_path = output_dir / 'master.m3u8'
     
-    playlist_content = "#EXTM3U\n#EXT-X-VERSION:3\n"
+    playlist_content = f"#EXTM3U\n#EXT-X-VERSION:{PLAYLIST_VERSIONS[HLS_SEGMENT_FORMAT]}\n"
     
-    quality_settings = {
-        '720p': {'bandwidth': 2500000, 'resolution': '1280x720'},
-        '480p': {'bandwidth': 1000000, 'resolution': '854x480'},
-        '360p': {'bandwidth': 600000, 'resolution': '640x360'}
-    }
+    # Video-only renditions all play the one audio rendition
+    stream_audio = ''
+    audio_bandwidth = 0
+    if shared_audio:
+        playlist_content += audio_media_tag()
+        stream_audio = f',AUDIO="{AUDIO_GROUP_ID}"'
+        audio_bandwidth = parse_bitrate(AUDIO_BITRATE)
+    
+    # BANDWIDTH is the bitrate each rendition was encoded with
+    quality_settings = quality_settings or QUALITIES
     
     for quality in qualities:
         if quality in quality_settings:
             settings = quality_settings[quality]
-            playlist_content += f"#EXT-X-STREAM-INF:BANDWIDTH={settings['bandwidth']},RESOLUTION={settings['resolution']}\n"
+            bandwidth = parse_bitrate(settings['bitrate']) + audio_bandwidth
+            resolution = settings['resolution'].replace(':', 'x')
+            playlist_content += f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={resolution}{stream_audio}\n"
             playlist_content += f"{quality}/playlist.m3u8\n"
     
     with open(master_playlist_path, 'w') as f:
         f.write(playlist_content)
 
+# Columns each listing field needs, so /api/movies only selects what was asked for
+MOVIE_LIST_COLUMNS = {
+    'id': ['id'],
+    'filename': ['filename'],
+    'display_name': ['filename', 'subdirectory'],
+    'subdirectory': ['subdirectory'],
+    'file_size': ['file_size'],
+    'file_size_formatted': ['file_size'],
+    'source_resolution': ['source_resolution'],
+    'status': ['status'],
+    'overall_progress': ['overall_progress'],
+    'target_qualities': ['source_resolution', 'ladder'],
+    'output_folder': ['id', 'subdirectory'],
+    'created_at': ['created_at'],
+}
+MOVIE_LIST_DEFAULT_FIELDS = list(MOVIE_LIST_COLUMNS)
+
+def serialize_movie_row(row, fields):
+    """Build the listing dict for a projected movie row"""
+    movie = row._mapping
+    movie_dict = {}
+    for field in fields:
+        if field == 'display_name':
+            # Create display name with subdirectory
+            movie_dict[field] = (f"{movie['subdirectory']}/{movie['filename']}"
+                                 if movie['subdirectory'] else movie['filename'])
+        elif field == 'file_size_formatted':
+            movie_dict[field] = format_file_size(movie['file_size'])
+        elif field == 'target_qualities':
+            movie_dict[field] = Movie.target_qualities_for(movie['source_resolution'], movie['ladder'])
+        elif field == 'output_folder':
+            movie_dict[field] = Movie.output_folder_name_for(movie['id'], movie['subdirectory'])
+        elif field == 'created_at':
+            movie_dict[field] = movie['created_at'].strftime('%Y-%m-%d %H:%M') if movie['created_at'] else ''
+        else:
+            movie_dict[field] = movie[field]
+    return movie_dict
+
+def get_status_counts():
+    """Count movies per status in a single query"""
+    counts = dict(db.session.query(Movie.status, db.func.count(Movie.id)).group_by(Movie.status).all())
+    counts['TOTAL'] = sum(counts.values())
+    return counts
+
 @app.route('/')
 def index():
-    movies = Movie.query.order_by(Movie.created_at.desc()).all()
-    
-    movie_data = []
-    for movie in movies:
-        # Create display name with subdirectory
-        display_name = movie.filename
-        if movie.subdirectory:
-            display_name = f"{movie.subdirectory}/{movie.filename}"
-        
-        movie_dict = {
-            'id': movie.id,
-            'filename': movie.filename,
-            'display_name': display_name,  # For HTML display
-            'subdirectory': movie.subdirectory,
-            'file_size': movie.file_size,
-            'file_size_formatted': format_file_size(movie.file_size),
-            'source_resolution': movie.source_resolution,
-            'status': movie.status,
-            'overall_progress': movie.overall_progress,
-            'target_qualities': movie.get_target_qualities(),
-            'output_folder': movie.get_output_folder_name(),  # For display
-            'created_at': movie.created_at.strftime('%Y-%m-%d %H:%M') if movie.created_at else ''
-        }
-        movie_data.append(movie_dict)
-    
-    return render_template('simple_index.html', movies=movie_data)
+    # Movies are loaded page by page from /api/movies
+    return render_template('simple_index.html', stats=get_status_counts())
+
+@app.route('/api/movies')
+def list_movies():
+    """
+    Keyset-paginated movie listing, newest first.
+    
+    Query parameters: limit, cursor (next_cursor of the previous page),
+    status, subdirectory and fields (comma separated projection).
+    """
+    try:
+        page_size = parse_page_size(request.args.get('limit'))
+        fields = parse_fields(request.args.get('fields'), MOVIE_LIST_COLUMNS, MOVIE_LIST_DEFAULT_FIELDS)
+        
+        column_names = {'id', 'created_at'}
+        for field in fields:
+            column_names.update(MOVIE_LIST_COLUMNS[field])
+        query = db.session.query(*[getattr(Movie, name) for name in sorted(column_names)])
+        
+        if request.args.get('status'):
+            query = query.filter(Movie.status == request.args['status'])
+        if 'subdirectory' in request.args:
+            subdirectory = request.args['subdirectory']
+            query = query.filter(Movie.subdirectory == subdirectory if subdirectory else Movie.subdirectory.is_(None))
+        
+        rows, next_cursor = keyset_page(query, Movie.created_at, Movie.id, request.args.get('cursor'), page_size)
+        
+        return jsonify({
+            'movies': [serialize_movie_row(row, fields) for row in rows],
+            'next_cursor': next_cursor
+        })
+        
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"ERROR_[CONTEXT]: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/reset-stuck', methods=['POST'])
 def reset_stuck_conversions():
@@ -553,14 +1108,21 @@ def reset_stuck_conversions():
         
         for movie in stuck_movies:
             movie.status = 'ERROR'  # or 'NEW' if you want to retry
+            movie.owner = None
             movie.overall_progress = 0
             app.logger.warning(f"RESET_STUCK: Movie {movie.id} reset from IN_PROGRESS to ERROR")
+            job = active_job(db.session, ConversionJob, movie.id)
+            if job:
+                job.state = 'failed'
+                job.owner = None
+                job.lease_until = None
+                job.last_error = 'Reset as stuck'
         
         db.session.commit()
         
-        # Clear conversion status
-        global conversion_status
-        conversion_status.clear()
+        # Replace the live status of the reset movies, the others keep theirs
+        for movie in stuck_movies:
+            publish_status(movie.id, {'status': 'ERROR', 'progress': 0})
         
         return jsonify({
             'success': True, 
@@ -571,42 +1133,140 @@ def reset_stuck_conversions():
         app.logger.error(f"ERROR_RESET_STUCK: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def ingest_scanned_files(video_files, retry=True):
+    """
+    Add Movie rows for scanned files that are not known yet and return them.
+    
+    Known (subdirectory, filename) keys are loaded in one query and all new
+    movies are inserted in a single transaction.
+    """
+    known_keys = {
+        (subdirectory or '', filename)
+        for subdirectory, filename in db.session.query(Movie.subdirectory, Movie.filename)
+    }
+    
+    new_files = []
+    for file_info in video_files:
+        key = (file_info['subdirectory'] or '', file_info['filename'])
+        if key not in known_keys:
+            known_keys.add(key)
+            new_files.append(file_info)
+    
+    if not new_files:
+        return []
+    
+    movie_ids = Movie.generate_movie_ids(len(new_files))
+    new_movies = []
+    for movie_id, file_info in zip(movie_ids, new_files):
+        movie = Movie(
+            id=movie_id,
+            filename=file_info['filename'],
+            file_path=file_info['file_path'],
+            file_size=file_info['file_size'],
+            subdirectory=file_info['subdirectory']  # Store subdirectory
+        )
+        
+        if file_info['video_info']:
+            movie.source_resolution = file_info['video_info']['resolution']
+        
+        new_movies.append(movie)
+    
+    db.session.add_all(new_movies)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another scan or the watch folder inserted some of these meanwhile, or another
+        # process allocated one of the time-ordered IDs; the retry takes new IDs
+        db.session.rollback()
+        if not retry:
+            raise
+        return ingest_scanned_files(video_files, retry=False)
+    
+    return new_movies
+
 @app.route('/scan', methods=['POST'])
 def scan_folder():
     app.logger.info(f"SCAN_INITIATED: Starting folder scan")
     try:
-        video_files = scan_input_folder()
-        new_files = 0
-        
-        for file_info in video_files:
-            # Check for existing movie by both filename and subdirectory
-            existing_movie = Movie.query.filter_by(
-                filename=file_info['filename'],
-                subdirectory=file_info['subdirectory']
-            ).first()
-            
-            if not existing_movie:
-                movie = Movie(
-                    filename=file_info['filename'],
-                    file_path=file_info['file_path'],
-                    file_size=file_info['file_size'],
-                    subdirectory=file_info['subdirectory']  # Store subdirectory
-                )
-                
-                if file_info['video_info']:
-                    movie.source_resolution = file_info['video_info']['resolution']
-                
-                db.session.add(movie)
-                new_files += 1
-        
-        db.session.commit()
+        video_files, scan_stats = scan_input_folder()
+        new_files = len(ingest_scanned_files(video_files))
         app.logger.info(f"SCAN_COMPLETE: Found {new_files} new files out of {len(video_files)} total files")
-        return jsonify({'success': True, 'new_files': new_files})
+        return jsonify({'success': True, 'new_files': new_files, 'scan_stats': scan_stats})
         
     except Exception as e:
         app.logger.error(f"ERROR_[CONTEXT]: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+job_dispatch_lock = threading.Lock()
+
+def queue_conversion(movie):
+    """Put a movie into the job queue and mark it QUEUED (commits); returns its job"""
+    job = enqueue_job(db.session, ConversionJob, movie.id)
+    if movie.status != 'IN_PROGRESS':
+        movie.status = 'QUEUED'
+        db.session.commit()
+        publish_status(movie.id, {'status': 'QUEUED', 'progress': 0})
+    app.logger.info(f"CONVERSION_QUEUED: Movie {movie.id} as job {job.id}")
+    return job
+
+def start_queued_jobs():
+    """Claim queued jobs while a conversion slot is free and run each in its slot's thread"""
+    with job_dispatch_lock, app.app_context():
+        while True:
+            # Reserve the slot before claiming, so a claimed job always has a slot to run in
+            reserved = conversion_slots.acquire()
+            if not reserved:
+                return
+            slot, cores = reserved
+            try:
+                job = claim_next_job(db.session, ConversionJob, OWNER_ID, JOB_LEASE_SECONDS,
+                                     max_running=conversion_slots.size)
+            except Exception:
+                conversion_slots.release(slot)
+                raise
+            if not job:
+                conversion_slots.release(slot)
+                return
+            conversion_slots.assign(slot, job.id, job.movie_id)
+            thread = threading.Thread(target=run_job, args=(job.id, job.movie_id, slot, cores),
+                                      name=f'conversion-slot-{slot}', daemon=True)
+            thread.start()
+            app.logger.info(
+                f"CONVERSION_THREAD_STARTED: Job {job.id} (attempt {job.attempts}) for Movie {job.movie_id} "
+                f"in slot {slot} on {cores} cores"
+            )
+
+def run_job(job_id, movie_id, slot, cores):
+    """Convert the movie of a claimed job in its slot, complete the job and start the next queued one"""
+    try:
+        convert_video_simple(movie_id, cores)
+    finally:
+        with app.app_context():
+            movie = db.session.get(Movie, movie_id)
+            if movie and movie.status == 'DONE':
+                complete_job(db.session, ConversionJob, job_id)
+            elif not movie:
+                complete_job(db.session, ConversionJob, job_id, failed=True, error='Movie was deleted')
+            elif movie.status == 'IN_PROGRESS' and movie.owner != OWNER_ID:
+                complete_job(db.session, ConversionJob, job_id, failed=True,
+                             error=f'Movie is being converted by {movie.owner}')
+            else:
+                complete_job(db.session, ConversionJob, job_id, failed=True, error='Conversion failed')
+        conversion_slots.release(slot)
+        start_queued_jobs()
+
+@app.route('/api/slots', methods=['GET', 'POST'])
+def conversion_slot_settings():
+    """Conversion slots and what runs in them; POST {"slots": n} changes their number"""
+    if request.method == 'POST':
+        slots = (request.get_json(silent=True) or {}).get('slots')
+        if not isinstance(slots, int) or isinstance(slots, bool) or slots < 1:
+            return jsonify({'error': 'slots must be a positive integer'}), 400
+        conversion_slots.resize(slots)
+        app.logger.info(f"CONVERSION_SLOTS: {slots} slots, {conversion_slots.cores_per_slot()} cores each")
+        start_queued_jobs()
+    return jsonify(conversion_slots.snapshot())
+
 @app.route('/convert/<movie_id>', methods=['POST'])
 def start_conversion(movie_id):
     app.logger.info(f"CONVERSION_REQUEST: Movie {movie_id} conversion requested")
@@ -616,31 +1276,81 @@ def start_conversion(movie_id):
         if movie.status not in ['NEW', 'ERROR']:
             return jsonify({'error': 'Movie is not in a convertible state'}), 400
         
-        # Check if another conversion is running
-        active_movie = Movie.query.filter_by(status='IN_PROGRESS').first()
-        if active_movie:
-            return jsonify({'error': 'Another conversion is already in progress'}), 400
+        job = queue_conversion(movie)
+        start_queued_jobs()
         
-        # Start conversion in background thread
-        thread = threading.Thread(target=convert_video_simple, args=(movie_id,))
-        thread.daemon = True
-        thread.start()
-        app.logger.info(f"CONVERSION_THREAD_STARTED: Background conversion started for Movie {movie_id}")
-        return jsonify({'success': True, 'message': 'Conversion started'})
+        db.session.refresh(job)
+        position = queue_position(db.session, ConversionJob, job)
+        if position is None:
+            return jsonify({'success': True, 'message': 'Conversion started'})
+        return jsonify({'success': True, 'message': f'Conversion queued at position {position}', 'position': position})
         
     except Exception as e:
         app.logger.error(f"ERROR_[CONTEXT]: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/status/<movie_id>')
-def get_status(movie_id):
-    movie = Movie.query.get_or_404(movie_id)
-    status_info = conversion_status.get(movie_id, {})
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics; the queue depth counts the queued conversion jobs"""
+    queue_depth = ConversionJob.query.filter_by(state='queued').count()
+    return Response(render_metrics(db.session, Movie, EncodeSample, queue_depth, ProbeLatency),
+                    mimetype='text/plain; version=0.0.4')
+
+@app.route('/events')
+def status_events():
+    """
+    Server-Sent Events stream of live conversion status.
+    
+    Each event carries the status of one movie and its status store version as
+    the event id, so a reconnecting browser (Last-Event-ID) only receives
+    what it missed. A new browser rendered the movies from the database and
+    only gets the statuses that changed just before it connected; one that
+    missed removals whose tombstones expired gets a reload event. A stats
+    event follows batches that changed a status.
+    """
+    try:
+        last_version = int(request.headers['Last-Event-ID'])
+    except (KeyError, ValueError):
+        last_version = None
+    
+    def stream():
+        known_statuses = {}
+        if last_version is None:
+            version, changes = status_store.recent()
+            # Sets the browser's Last-Event-ID even when nothing changed recently
+            yield f"id: {version}\n\n"
+        elif last_version < status_store.expired_version():
+            version, changes = status_store.version(), []
+            yield f"id: {version}\nevent: reload\ndata: {{}}\n\n"
+        else:
+            version, changes = last_version, []
+        while True:
+            if changes:
+                status_moved = False
+                for changed_at, movie_id, status in changes:
+                    event = {'movie_id': movie_id}
+                    if status is None:
+                        event['removed'] = True
+                    else:
+                        event.update({k: v for k, v in status.items() if k != 'start_time'})
+                    if known_statuses.get(movie_id) != event.get('status'):
+                        known_statuses[movie_id] = event.get('status')
+                        status_moved = True
+                    yield f"id: {changed_at}\nevent: status\ndata: {json.dumps(event)}\n\n"
+                
+                if status_moved:
+                    with app.app_context():
+                        stats = get_status_counts()
+                    yield f"event: stats\ndata: {json.dumps(stats)}\n\n"
+            
+            status_store.wait(version, SSE_KEEPALIVE_SECONDS)
+            version, changes = status_store.changes_since(version)
+            if not changes:
+                yield ': keepalive\n\n'
     
-    return jsonify({
-        'status': movie.status,
-        'progress': movie.overall_progress,
-        'live_status': status_info
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
     })
 
 @app.route('/delete/<movie_id>', methods=['POST'])
@@ -659,12 +1369,13 @@ def delete_movie(movie_id):
             shutil.rmtree(output_dir)
         
         # Delete from database
+        EncodeSample.query.filter_by(movie_id=movie_id).delete()
+        ConversionJob.query.filter_by(movie_id=movie_id, state='queued').delete()
         db.session.delete(movie)
         db.session.commit()
         
         # Clean up status
-        if movie_id in conversion_status:
-            del conversion_status[movie_id]
+        publish_status(movie_id)
         
         app.logger.info(f"DELETE_COMPLETE: Movie {movie_id} successfully deleted")
         return jsonify({'success': True, 'message': 'Movie deleted'})
@@ -673,24 +1384,181 @@ def delete_movie(movie_id):
         app.logger.error(f"ERROR_[CONTEXT]: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+MIGRATIONS = [
+    ('subdirectory column', 'ALTER TABLE movie ADD COLUMN subdirectory VARCHAR(255)'),
+    ('unique (subdirectory, filename) index',
+     "CREATE UNIQUE INDEX IF NOT EXISTS ix_movie_subdirectory_filename "
+     "ON movie (coalesce(subdirectory, ''), filename)"),
+    ('(created_at, id) listing index',
+     'CREATE INDEX IF NOT EXISTS ix_movie_created_at_id ON movie (created_at, id)'),
+    ('per-title ladder column', 'ALTER TABLE movie ADD COLUMN ladder TEXT'),
+    ('conversion checkpoints column', 'ALTER TABLE movie ADD COLUMN checkpoints TEXT'),
+    ('lease owner column', 'ALTER TABLE movie ADD COLUMN owner VARCHAR(100)'),
+    ('lease heartbeat column', 'ALTER TABLE movie ADD COLUMN heartbeat_at FLOAT'),
+    # Generated movie IDs are longer than the old VARCHAR(8); SQLite ignores the length
+    ('wider movie id (PostgreSQL)', 'ALTER TABLE movie ALTER COLUMN id TYPE VARCHAR(20)'),
+    ('wider movie id (MySQL)', 'ALTER TABLE movie MODIFY id VARCHAR(20)'),
+]
+
 def migrate_database():
-    """Add subdirectory column to existing database"""
+    """Bring an existing database up to the current schema"""
     print("NOW MIGRATING")
     with app.app_context():
-        try:
-            # Try to add the column if it doesn't exist
-            db.engine.execute('ALTER TABLE movie ADD COLUMN subdirectory VARCHAR(255)')
-            print("Added subdirectory column to database")
-        except Exception as e:
-            app.logger.error(f"ERROR_[CONTEXT]: {str(e)}", exc_info=True)
-            print("Subdirectory column already exists or migration not needed")
+        for name, statement in MIGRATIONS:
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(db.text(statement))
+                print(f"Applied migration: {name}")
+            except Exception as e:
+                app.logger.info(f"MIGRATION_SKIPPED: {name} ({str(e).splitlines()[0]})")
+                print(f"Migration not needed: {name}")
+
+
+def ingest_watched_file(file_path):
+    """Register a file reported by the watch folder once it stopped growing"""
+    with app.app_context():
+        stat = file_path.stat()
+        probe_cache = {entry.file_path: entry for entry in ProbeCache.query.filter_by(file_path=str(file_path))}
+        cached = probe_cache.get(str(file_path))
+        if cached and cached.matches(stat.st_size, stat.st_mtime_ns):
+            video_info = cached.get_video_info()
+        else:
+            latencies = []
+            probe_results, _ = probe_files(
+                [str(file_path)],
+                probesize=PROBE_SIZE,
+                analyzeduration=PROBE_ANALYZE_DURATION,
+                timeout=PROBE_TIMEOUT,
+                on_latency=latencies.append
+            )
+            record_probe_latencies(db.session, ProbeLatency, latencies)
+            video_info = probe_results[str(file_path)]
+            update_probe_cache(str(file_path), stat, video_info, probe_cache)
+        
+        new_movies = ingest_scanned_files([build_file_info(file_path, stat, video_info)])
+        for movie in new_movies:
+            app.logger.info(f"WATCH_NEW_FILE: Movie {movie.id} registered for {file_path}")
+        auto_convert(new_movies)
+
+def remove_watched_file(file_path):
+    """Forget a file that was deleted or moved out of the INPUT folder"""
+    with app.app_context():
+        ProbeCache.query.filter_by(file_path=str(file_path)).delete()
+        movie = Movie.query.filter_by(file_path=str(file_path)).first()
+        # Converted movies keep their row and output, only unconverted ones go away
+        if movie and movie.status == 'NEW':
+            db.session.delete(movie)
+            app.logger.info(f"WATCH_REMOVED_FILE: Movie {movie.id} removed, {file_path} is gone")
+        db.session.commit()
+
+def reconcile_input_folder():
+    """Full-tree walk that catches anything the watcher missed"""
+    with app.app_context():
+        video_files, scan_stats = scan_input_folder()
+        new_movies = ingest_scanned_files(video_files)
+        app.logger.info(f"WATCH_RECONCILE: Found {len(new_movies)} new files out of {len(video_files)} total files")
+        auto_convert(new_movies)
+
+def auto_convert(new_movies):
+    """Queue newly found movies for conversion when auto-conversion is enabled"""
+    if not WATCH_AUTO_CONVERT or not new_movies:
+        return
+    
+    for movie in new_movies:
+        queue_conversion(movie)
+    start_queued_jobs()
+
+def reconcile_jobs():
+    """
+    Requeue conversions whose process died and start queued ones.
+    
+    Runs at startup and every RECONCILE_INTERVAL seconds. Leftover ffmpeg
+    processes of a dead conversion are killed first so they cannot keep
+    writing into OUTPUT; the job goes back into the queue after a backoff
+    and resumes from its checkpoints, or fails after JOB_MAX_ATTEMPTS.
+    """
+    with app.app_context():
+        for job in requeue_expired(db.session, ConversionJob, JOB_MAX_ATTEMPTS,
+                                   JOB_BACKOFF_SECONDS, JOB_BACKOFF_MAX_SECONDS):
+            movie = db.session.get(Movie, job.movie_id)
+            if not movie:
+                continue
+            killed = kill_orphaned_encoders(movie) if movie.status == 'IN_PROGRESS' else []
+            if job.state == 'queued':
+                app.logger.warning(
+                    f"RECONCILE_REQUEUED: Movie {movie.id} lost its owner {movie.owner or '(none)'}, "
+                    f"retry {job.attempts + 1} at {datetime.fromtimestamp(job.available_at):%H:%M:%S}"
+                    + (f", killed orphaned ffmpeg {killed}" if killed else '')
+                )
+                movie.status = 'QUEUED'
+            else:
+                app.logger.error(f"RECONCILE_GAVE_UP: Movie {movie.id} - {job.last_error}")
+                movie.status = 'ERROR'
+            movie.owner = None
+            movie.heartbeat_at = None
+        db.session.commit()
+        
+        # Conversions of a dead process without a job (from before the job queue)
+        for movie in stale_movies(db.session, Movie, JOB_LEASE_SECONDS):
+            if active_job(db.session, ConversionJob, movie.id):
+                continue
+            killed = kill_orphaned_encoders(movie)
+            app.logger.warning(
+                f"RECONCILE_REQUEUED: Movie {movie.id} lost its owner {movie.owner or '(none)'}"
+                + (f", killed orphaned ffmpeg {killed}" if killed else '')
+            )
+            movie.status = 'QUEUED'
+            movie.owner = None
+            movie.heartbeat_at = None
+        db.session.commit()
+        for movie in Movie.query.filter_by(status='QUEUED').all():
+            enqueue_job(db.session, ConversionJob, movie.id)
+        
+        # The status store may be missing these movies or still hold what a dead process published
+        for movie in Movie.query.filter(Movie.status.in_(['IN_PROGRESS', 'QUEUED'])):
+            status = status_store.get(movie.id)
+            if not status or status.get('status') != movie.status:
+                publish_status(movie.id, {'status': movie.status, 'progress': movie.overall_progress or 0})
+        
+    
+    # Jobs whose backoff passed, or that were queued while every slot was taken
+    start_queued_jobs()
+
+def renew_own_leases():
+    """Heartbeat for every movie and job this process is converting"""
+    with app.app_context():
+        renew_leases(db.session, Movie, OWNER_ID)
+        renew_job_leases(db.session, ConversionJob, OWNER_ID, JOB_LEASE_SECONDS)
 
+def start_watch_folder():
+    """Start the watch folder service for the INPUT folder"""
+    service = WatchFolderService(
+        INPUT_FOLDER,
+        SUPPORTED_FORMATS,
+        on_ready=ingest_watched_file,
+        on_removed=remove_watched_file,
+        on_reconcile=reconcile_input_folder,
+        settle_seconds=WATCH_SETTLE_SECONDS,
+        reconcile_interval=WATCH_RECONCILE_INTERVAL
+    )
+    service.start()
+    mode = "inotify" if inotify_supported() else "periodic reconciliation only"
+    app.logger.info(f"WATCH_FOLDER_STARTED: Watching {INPUT_FOLDER} ({mode})")
+    return service
 
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
         migrate_database()
     
+    if WATCH_INPUT:
+        start_watch_folder()
+    
+    # Pick up work a previous process left behind, then keep checking
+    reconcile_jobs()
+    start_periodic(renew_own_leases, HEARTBEAT_INTERVAL, 'lease-heartbeat')
+    start_periodic(reconcile_jobs, RECONCILE_INTERVAL, 'job-reconciler')
+    
     print("Simple Video Processing Dashboard")
     print("Open your browser and go to: http://localhost:5000")
     print("Press Ctrl+C to stop")
@@ -17,7 +17,7 @@ echo.
 echo To stop the worker, close this window or press Ctrl+C
 echo.
 
-REM Start Celery worker
-celery -A celery_worker.celery worker --loglevel=info --pool=solo
+REM Start Celery worker on the default, heavy and light queues (WORKER_QUEUES) sized by WORKER_CPU_BUDGET
+python celery_worker.py --pool=solo
 
 pause
@@ -3,11 +3,14 @@
 // Global variables
 let socket;
 let isConnected = false;
+let nextCursor = null;
+const MOVIES_PAGE_SIZE = 50;
 
 // Initialize dashboard
 function initializeDashboard() {
     initializeWebSocket();
     setupEventListeners();
+    loadMovies();
     startPeriodicUpdates();
 }
 
@@ -253,6 +256,10 @@ function updateActionButtons(movieId, status) {
     const actionsCell = document.querySelector(`#movie-row-${movieId} td:last-child`);
     if (!actionsCell) return;
     
+    actionsCell.innerHTML = actionButtonsHtml(movieId, status);
+}
+
+function actionButtonsHtml(movieId, status) {
     let buttonsHtml = '<div class="btn-group btn-group-sm" role="group">';
     
     if (status === 'NEW' || status === 'ERROR') {
@@ -284,7 +291,7 @@ function updateActionButtons(movieId, status) {
     }
     
     buttonsHtml += '</div>';
-    actionsCell.innerHTML = buttonsHtml;
+    return buttonsHtml;
 }
 
 function getStatusConfig(status) {
@@ -335,8 +342,11 @@ function addNewMovieRow(movie) {
 
 function createMovieRowHtml(movie) {
     const statusConfig = getStatusConfig(movie.status);
-    const fileSizeFormatted = formatFileSize(movie.file_size);
+    const fileSizeFormatted = movie.file_size_formatted || formatFileSize(movie.file_size);
     const targetQualities = movie.target_qualities ? movie.target_qualities.join(', ') : '';
+    const filename = escapeHtml(movie.filename);
+    const shortFilename = movie.filename.length > 30 ? escapeHtml(movie.filename.substring(0, 30)) + '...' : filename;
+    const queuePosition = movie.queue_position ? ` (#${movie.queue_position})` : '';
     
     return `
         <tr id="movie-row-${movie.id}" data-movie-id="${movie.id}">
@@ -344,9 +354,7 @@ function createMovieRowHtml(movie) {
             <td>
                 <div class="d-flex align-items-center">
                     <i class="bi bi-file-earmark-play me-2"></i>
-                    <span title="${movie.filename}">
-                        ${movie.filename.length > 30 ? movie.filename.substring(0, 30) + '...' : movie.filename}
-                    </span>
+                    <span title="${filename}">${shortFilename}</span>
                 </div>
             </td>
             <td>${fileSizeFormatted}</td>
@@ -372,23 +380,10 @@ function createMovieRowHtml(movie) {
             </td>
             <td>
                 <span class="badge bg-${statusConfig.color}" id="status-${movie.id}">
-                    ${statusConfig.icon} ${movie.status}
+                    ${statusConfig.icon} ${movie.status}${queuePosition}
                 </span>
             </td>
-            <td>
-                <div class="btn-group btn-group-sm" role="group">
-                    ${movie.status === 'NEW' || movie.status === 'ERROR' ? 
-                        `<button class="btn btn-success" onclick="startConversion('${movie.id}')" id="convert-btn-${movie.id}">
-                            <i class="bi bi-play-circle"></i> Convert
-                        </button>` : ''
-                    }
-                    ${movie.status !== 'IN_PROGRESS' ? 
-                        `<button class="btn btn-danger" onclick="deleteMovie('${movie.id}')" id="delete-btn-${movie.id}">
-                            <i class="bi bi-trash"></i>
-                        </button>` : ''
-                    }
-                </div>
-            </td>
+            <td>${actionButtonsHtml(movie.id, movie.status)}</td>
         </tr>
     `;
 }
@@ -400,6 +395,37 @@ function removeMovieRow(movieId) {
     }
 }
 
+// Movie listing, loaded page by page from the keyset-paginated API
+async function loadMovies() {
+    const params = new URLSearchParams({ limit: MOVIES_PAGE_SIZE });
+    const statusFilter = document.getElementById('status-filter');
+    if (statusFilter && statusFilter.value) params.set('status', statusFilter.value);
+    if (nextCursor) params.set('cursor', nextCursor);
+    
+    try {
+        const page = await apiCall(`/api/movies?${params}`);
+        const tableBody = document.getElementById('movies-table-body');
+        if (!tableBody) return;
+        
+        tableBody.insertAdjacentHTML('beforeend', page.movies.map(createMovieRowHtml).join(''));
+        nextCursor = page.next_cursor;
+        
+        const isEmpty = tableBody.children.length === 0;
+        document.getElementById('movies-table').classList.toggle('d-none', isEmpty);
+        document.getElementById('movies-empty').classList.toggle('d-none', !isEmpty);
+        document.getElementById('load-more').classList.toggle('d-none', !nextCursor);
+    } catch (error) {
+        console.error('Failed to load movies:', error);
+    }
+}
+
+function reloadMovies() {
+    nextCursor = null;
+    const tableBody = document.getElementById('movies-table-body');
+    if (tableBody) tableBody.innerHTML = '';
+    return loadMovies();
+}
+
 async function updateStatistics() {
     try {
         const stats = await apiCall('/api/stats');
@@ -430,6 +456,12 @@ function formatFileSize(bytes) {
     return (bytes / Math.pow(1024, i)).toFixed(1) + sizes[i];
 }
 
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.textContent = value;
+    return div.innerHTML;
+}
+
 function showToast(message, type = 'info') {
     const toast = document.getElementById('toast');
     const toastBody = document.getElementById('toast-body');
@@ -454,8 +486,3 @@ function checkConnectionStatus() {
         socket.connect();
     }
 }
-
-// Initialize when DOM is loaded
-document.addEventListener('DOMContentLoaded', function() {
-    initializeDashboard();
-});
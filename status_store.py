@@ -0,0 +1,329 @@
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+# Live conversion status shared between processes.
+#
+# Every change of a movie's status gets the next number of a global
+# version counter, so a reader (the /events stream) asks for everything
+# changed after the last version it saw. A removed movie keeps a
+# tombstone (status None) so readers learn about the removal too, for
+# `retention` seconds; a reader that is further behind than the newest
+# expired tombstone (expired_version) has to load the movies again. A new
+# reader without a version only gets the statuses that changed recently.
+#
+# 'memory' keeps the status in this process only, 'sqlite' in a small
+# database file that every process on the host shares (put it on /dev/shm
+# to keep it in shared memory), 'redis' in Redis for processes on several
+# hosts. Waiting readers in the publishing process wake up right away,
+# other processes notice changes by polling.
+# Kept free of Flask/Celery imports so the simple mode can use it too.
+
+POLL_INTERVAL = 0.5         # seconds between version checks of waiting readers
+SQLITE_TIMEOUT = 30         # seconds a write waits for the database lock
+TOMBSTONE_RETENTION = 3600  # seconds a removed movie's tombstone is kept
+RECENT_SECONDS = 60         # what a new reader gets: the statuses changed this long ago at most
+REDIS_PREFIX = 'video_dashboard:status:'
+
+
+class StatusStore(ABC):
+    """Common part of the stores: in-process wakeups and waiting for the next version"""
+
+    def __init__(self, retention=TOMBSTONE_RETENTION):
+        self.changed = threading.Condition()
+        self.retention = retention
+
+    def publish(self, movie_id, status=None):
+        """Store the live status of a movie (None: it was deleted) and wake waiting readers"""
+        self._publish(movie_id, status, time.time())
+        with self.changed:
+            self.changed.notify_all()
+
+    def wait(self, version, timeout):
+        """Block until the store is past version or timeout seconds passed; returns the current version"""
+        deadline = time.monotonic() + timeout
+        while True:
+            current = self.version()
+            remaining = deadline - time.monotonic()
+            if current != version or remaining <= 0:
+                return current
+            with self.changed:
+                self.changed.wait(min(POLL_INTERVAL, remaining))
+
+    @abstractmethod
+    def get(self, movie_id):
+        """The live status of a movie, None if it has none"""
+
+    @abstractmethod
+    def version(self):
+        """The current version"""
+
+    @abstractmethod
+    def changes_since(self, version):
+        """Return (latest version, [(version, movie_id, status)]) changed after version"""
+
+    @abstractmethod
+    def recent(self, seconds=RECENT_SECONDS):
+        """Return (latest version, [(version, movie_id, status)]) of the live statuses changed in the last seconds"""
+
+    @abstractmethod
+    def expired_version(self):
+        """Version of the newest expired tombstone, readers behind it missed a removal"""
+
+    @abstractmethod
+    def _publish(self, movie_id, status, now):
+        """Store the status as the next version and expire tombstones older than the retention"""
+
+
+class MemoryStatusStore(StatusStore):
+    """Statuses in a dict of this process"""
+
+    def __init__(self, retention=TOMBSTONE_RETENTION):
+        super().__init__(retention)
+        self.statuses = {}
+        self.versions = {}      # movie_id -> version of its last change
+        self.updated = {}       # movie_id -> unix time of its last change
+        self.tombstones = {}    # removed movie_id -> unix time of the removal
+        self.current = 0
+        self.expired = 0
+
+    def _publish(self, movie_id, status, now):
+        with self.changed:
+            self.current += 1
+            if status is None:
+                self.statuses.pop(movie_id, None)
+                self.tombstones[movie_id] = now
+            else:
+                self.statuses[movie_id] = status
+                self.tombstones.pop(movie_id, None)
+            self.versions[movie_id] = self.current
+            self.updated[movie_id] = now
+
+            cutoff = now - self.retention
+            for removed_id in [m for m, removed_at in self.tombstones.items() if removed_at < cutoff]:
+                self.expired = max(self.expired, self.versions.pop(removed_id))
+                del self.tombstones[removed_id], self.updated[removed_id]
+
+    def get(self, movie_id):
+        with self.changed:
+            return self.statuses.get(movie_id)
+
+    def version(self):
+        return self.current
+
+    def changes_since(self, version):
+        with self.changed:
+            changes = [
+                (changed_at, movie_id, self.statuses.get(movie_id))
+                for movie_id, changed_at in self.versions.items()
+                if changed_at > version
+            ]
+            return self.current, sorted(changes, key=lambda change: change[0])
+
+    def recent(self, seconds=RECENT_SECONDS):
+        since = time.time() - seconds
+        with self.changed:
+            changes = [
+                (self.versions[movie_id], movie_id, status)
+                for movie_id, status in self.statuses.items()
+                if self.updated[movie_id] >= since
+            ]
+            return self.current, sorted(changes, key=lambda change: change[0])
+
+    def expired_version(self):
+        return self.expired
+
+
+class SQLiteStatusStore(StatusStore):
+    """Statuses in an SQLite file shared by the processes of one host"""
+
+    def __init__(self, path, retention=TOMBSTONE_RETENTION):
+        super().__init__(retention)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.local = threading.local()
+        with self._connection() as connection:
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS live_status (
+                    movie_id TEXT PRIMARY KEY,
+                    status TEXT,
+                    version INTEGER NOT NULL,
+                    updated_at REAL NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS ix_live_status_version ON live_status (version);
+                CREATE TABLE IF NOT EXISTS live_status_version (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    version INTEGER NOT NULL,
+                    expired INTEGER NOT NULL DEFAULT 0
+                );
+                INSERT OR IGNORE INTO live_status_version (id, version) VALUES (1, 0);
+            ''')
+            # Files written before tombstones expired; their old tombstones expire on the next publish
+            for migration in ('ALTER TABLE live_status ADD COLUMN updated_at REAL NOT NULL DEFAULT 0',
+                              'ALTER TABLE live_status_version ADD COLUMN expired INTEGER NOT NULL DEFAULT 0'):
+                try:
+                    connection.execute(migration)
+                except sqlite3.OperationalError:
+                    pass  # column exists
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_live_status_tombstone ON live_status (updated_at) '
+                               'WHERE status IS NULL')
+
+    def _connection(self):
+        """This thread's connection, in autocommit mode so transactions are explicit"""
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
+
+    def _publish(self, movie_id, status, now):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('UPDATE live_status_version SET version = version + 1 WHERE id = 1')
+            version = connection.execute('SELECT version FROM live_status_version WHERE id = 1').fetchone()[0]
+            connection.execute(
+                'INSERT OR REPLACE INTO live_status (movie_id, status, version, updated_at) VALUES (?, ?, ?, ?)',
+                (movie_id, json.dumps(status) if status is not None else None, version, now)
+            )
+            cutoff = now - self.retention
+            connection.execute(
+                'UPDATE live_status_version SET expired = MAX(expired, COALESCE('
+                '(SELECT MAX(version) FROM live_status WHERE status IS NULL AND updated_at < ?), 0)) WHERE id = 1',
+                (cutoff,)
+            )
+            connection.execute('DELETE FROM live_status WHERE status IS NULL AND updated_at < ?', (cutoff,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def get(self, movie_id):
+        row = self._connection().execute('SELECT status FROM live_status WHERE movie_id = ?', (movie_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def version(self):
+        return self._connection().execute('SELECT version FROM live_status_version WHERE id = 1').fetchone()[0]
+
+    def changes_since(self, version):
+        # The counter is read first: a change published in between is in rows, one published later
+        # has a higher version than the returned one and is returned next time
+        current = self.version()
+        rows = self._connection().execute(
+            'SELECT version, movie_id, status FROM live_status WHERE version > ? ORDER BY version', (version,)
+        ).fetchall()
+        latest = max([current] + [row[0] for row in rows])
+        return latest, [(changed_at, movie_id, json.loads(status) if status else None)
+                        for changed_at, movie_id, status in rows]
+
+    def recent(self, seconds=RECENT_SECONDS):
+        current = self.version()
+        rows = self._connection().execute(
+            'SELECT version, movie_id, status FROM live_status WHERE status IS NOT NULL AND updated_at >= ? '
+            'ORDER BY version', (time.time() - seconds,)
+        ).fetchall()
+        latest = max([current] + [row[0] for row in rows])
+        return latest, [(changed_at, movie_id, json.loads(status)) for changed_at, movie_id, status in rows]
+
+    def expired_version(self):
+        return self._connection().execute('SELECT expired FROM live_status_version WHERE id = 1').fetchone()[0]
+
+
+# Bumps the version, stores the status and expires old tombstones in one atomic step
+REDIS_PUBLISH_SCRIPT = '''
+local version = redis.call('INCR', KEYS[1])
+if ARGV[2] == '' then
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    redis.call('ZADD', KEYS[5], ARGV[3], ARGV[1])
+else
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+    redis.call('ZREM', KEYS[5], ARGV[1])
+end
+redis.call('ZADD', KEYS[3], version, ARGV[1])
+redis.call('ZADD', KEYS[4], ARGV[3], ARGV[1])
+for _, movie_id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[5], '-inf', '(' .. ARGV[4])) do
+    local removed = tonumber(redis.call('ZSCORE', KEYS[3], movie_id))
+    if removed and removed > (tonumber(redis.call('GET', KEYS[6])) or 0) then
+        redis.call('SET', KEYS[6], removed)
+    end
+    redis.call('ZREM', KEYS[3], movie_id)
+    redis.call('ZREM', KEYS[4], movie_id)
+    redis.call('ZREM', KEYS[5], movie_id)
+end
+return version
+'''
+
+
+class RedisStatusStore(StatusStore):
+    """Statuses in Redis, shared by processes on any host (needs the redis package)"""
+
+    def __init__(self, url, prefix=REDIS_PREFIX, retention=TOMBSTONE_RETENTION):
+        super().__init__(retention)
+        import redis
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.version_key = prefix + 'version'
+        self.statuses_key = prefix + 'statuses'
+        self.versions_key = prefix + 'versions'
+        self.updated_key = prefix + 'updated'
+        self.tombstones_key = prefix + 'tombstones'
+        self.expired_key = prefix + 'expired'
+        self.publish_script = self.client.register_script(REDIS_PUBLISH_SCRIPT)
+
+    def _publish(self, movie_id, status, now):
+        self.publish_script(
+            keys=[self.version_key, self.statuses_key, self.versions_key, self.updated_key, self.tombstones_key,
+                  self.expired_key],
+            args=[movie_id, json.dumps(status) if status is not None else '', now, now - self.retention]
+        )
+
+    def get(self, movie_id):
+        status = self.client.hget(self.statuses_key, movie_id)
+        return json.loads(status) if status else None
+
+    def version(self):
+        return int(self.client.get(self.version_key) or 0)
+
+    def changes_since(self, version):
+        # Counter first, as in SQLiteStatusStore.changes_since
+        current = self.version()
+        changed = self.client.zrangebyscore(self.versions_key, f'({version}', '+inf', withscores=True)
+        if not changed:
+            return current, []
+        statuses = self.client.hmget(self.statuses_key, [movie_id for movie_id, _ in changed])
+        changes = [(int(changed_at), movie_id, json.loads(status) if status else None)
+                   for (movie_id, changed_at), status in zip(changed, statuses)]
+        return max(current, changes[-1][0]), changes
+
+    def recent(self, seconds=RECENT_SECONDS):
+        current = self.version()
+        movie_ids = self.client.zrangebyscore(self.updated_key, time.time() - seconds, '+inf')
+        if not movie_ids:
+            return current, []
+        pipeline = self.client.pipeline(transaction=False)
+        for movie_id in movie_ids:
+            pipeline.zscore(self.versions_key, movie_id)
+        versions = pipeline.execute()
+        statuses = self.client.hmget(self.statuses_key, movie_ids)
+        changes = sorted((int(changed_at), movie_id, json.loads(status))
+                         for movie_id, changed_at, status in zip(movie_ids, versions, statuses)
+                         if changed_at is not None and status)
+        return max([current] + [change[0] for change in changes]), changes
+
+    def expired_version(self):
+        return int(self.client.get(self.expired_key) or 0)
+
+
+def create_status_store(kind, sqlite_path=None, redis_url=None, retention=TOMBSTONE_RETENTION):
+    """Create the status store configured for this deployment ('memory', 'sqlite' or 'redis')"""
+    if kind == 'memory':
+        return MemoryStatusStore(retention)
+    if kind == 'sqlite':
+        return SQLiteStatusStore(sqlite_path, retention)
+    if kind == 'redis':
+        return RedisStatusStore(redis_url, retention=retention)
+    raise ValueError(f"Unknown status store: {kind}")
@@ -0,0 +1,115 @@
+import shutil
+import subprocess
+import time
+
+import pytest
+
+from checkpoints import (PLAYLIST_NAME, RESUME_PLAYLIST, PlaylistWatcher, checkpoint_for, finalize_playlist,
+                         merge_resumed, read_media_playlist, reset_to_checkpoint, resume_point, verify_checkpoint)
+from hls_encoder import hls_output_options, option_args
+
+
+def write_event_playlist(path, entries, ended=False):
+    """An EVENT playlist as ffmpeg leaves it while (or after) encoding"""
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:4', '#EXT-X-MEDIA-SEQUENCE:0',
+             '#EXT-X-PLAYLIST-TYPE:EVENT']
+    for duration, uri in entries:
+        lines += [f'#EXTINF:{duration:.6f},', uri]
+    if ended:
+        lines.append('#EXT-X-ENDLIST')
+    path.write_text('\n'.join(lines) + '\n')
+
+
+def truncated_rendition(rendition_dir, written=4, listed=3):
+    """A rendition whose encode died: `written` segment files, the last one empty, `listed` of them in the playlist"""
+    rendition_dir.mkdir(parents=True)
+    entries = [(4.0, f'segment_{i:03d}.ts') for i in range(written)]
+    for i, (_, uri) in enumerate(entries):
+        (rendition_dir / uri).write_bytes(b'' if i == written - 1 else b'\x47' * 188)
+    write_event_playlist(rendition_dir / PLAYLIST_NAME, entries[:listed])
+    return entries
+
+
+def test_encodes_write_event_playlists():
+    assert hls_output_options('out', 4)['hls_playlist_type'] == 'event'
+
+
+def test_resume_from_truncated_output(tmp_path):
+    rendition_dir = tmp_path / '720p'
+    entries = truncated_rendition(rendition_dir)
+
+    checkpoint = checkpoint_for(rendition_dir)
+    assert checkpoint == {'done': False, 'segments': 3, 'seconds': 12.0}
+
+    # The empty segment 2 was not finished, so the encode resumes after segment 1
+    (rendition_dir / entries[2][1]).write_bytes(b'')
+    verified = {'720p': verify_checkpoint(rendition_dir, checkpoint)}
+    assert verified['720p'] == {'done': False, 'entries': entries[:2]}
+    assert resume_point(verified) == (2, 8.0)
+
+    reset_to_checkpoint(rendition_dir, verified['720p']['entries'])
+    assert sorted(p.name for p in rendition_dir.glob('segment_*.ts')) == ['segment_000.ts', 'segment_001.ts']
+    assert read_media_playlist(rendition_dir / PLAYLIST_NAME) == (entries[:2], False)
+
+    # The resumed encode writes the rest into the resume playlist
+    rest = [(4.0, 'segment_002.ts'), (2.5, 'segment_003.ts')]
+    for _, uri in rest:
+        (rendition_dir / uri).write_bytes(b'\x47' * 188)
+    write_event_playlist(rendition_dir / RESUME_PLAYLIST, rest, ended=True)
+
+    assert merge_resumed(rendition_dir)
+    assert finalize_playlist(rendition_dir / PLAYLIST_NAME)
+    content = (rendition_dir / PLAYLIST_NAME).read_text()
+    assert '#EXT-X-PLAYLIST-TYPE:VOD' in content
+    assert read_media_playlist(rendition_dir / PLAYLIST_NAME) == (entries[:2] + rest, True)
+    assert checkpoint_for(rendition_dir, done=True) == {'done': True, 'segments': 4, 'seconds': 14.5}
+
+
+def test_finalize_playlist(tmp_path):
+    playlist = tmp_path / PLAYLIST_NAME
+    entries = [(4.0, 'segment_000.ts')]
+    write_event_playlist(playlist, entries)
+    assert not finalize_playlist(playlist)
+    assert '#EXT-X-PLAYLIST-TYPE:EVENT' in playlist.read_text()
+
+    write_event_playlist(playlist, entries, ended=True)
+    assert finalize_playlist(playlist)
+    assert '#EXT-X-PLAYLIST-TYPE:VOD' in playlist.read_text()
+    assert read_media_playlist(playlist) == (entries, True)
+    assert not finalize_playlist(tmp_path / 'missing.m3u8')
+
+
+def test_playlist_watcher_reports_new_segments_only(tmp_path):
+    rendition_dir = tmp_path / '480p'
+    rendition_dir.mkdir()
+    watcher = PlaylistWatcher()
+    assert watcher.changed(rendition_dir)
+    assert not watcher.changed(rendition_dir)
+
+    write_event_playlist(rendition_dir / PLAYLIST_NAME, [(4.0, 'segment_000.ts')])
+    assert watcher.changed(rendition_dir)
+    assert not watcher.changed(rendition_dir)
+
+    write_event_playlist(rendition_dir / PLAYLIST_NAME, [(4.0, 'segment_000.ts'), (4.0, 'segment_001.ts')])
+    assert watcher.changed(rendition_dir)
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='needs the ffmpeg binary')
+def test_killed_ffmpeg_leaves_a_resumable_playlist(tmp_path):
+    args = ['ffmpeg', '-v', 'error', '-re', '-f', 'lavfi', '-i', 'testsrc=size=160x90:rate=25',
+            '-c:v', 'libx264', '-g', '25', '-t', '30']
+    args += option_args(hls_output_options(tmp_path, 1)) + [str(tmp_path / PLAYLIST_NAME)]
+
+    process = subprocess.Popen(args, stdin=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 20
+        while checkpoint_for(tmp_path)['segments'] < 2 and time.time() < deadline:
+            time.sleep(0.2)
+    finally:
+        process.kill()
+        process.wait()
+
+    checkpoint = checkpoint_for(tmp_path)
+    assert checkpoint['segments'] >= 2
+    assert not checkpoint['done']
+    assert verify_checkpoint(tmp_path, checkpoint)['entries']
@@ -0,0 +1,109 @@
+import importlib
+import sys
+import threading
+import time
+
+import pytest
+
+from conversion_slots import SlotPool
+
+
+def run_threads(targets):
+    """Run the callables at the same time, return the exceptions they raised"""
+    errors = []
+    barrier = threading.Barrier(len(targets))
+
+    def run(target):
+        barrier.wait()
+        try:
+            target()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    return errors
+
+
+def test_concurrent_acquire_never_overfills():
+    pool = SlotPool(3, cores=12)
+    reserved = []
+    assert not run_threads([lambda: reserved.append(pool.acquire()) for _ in range(8)])
+
+    taken = [slot for slot in reserved if slot]
+    assert sorted(taken) == [(1, 4), (2, 4), (3, 4)]
+    assert reserved.count(None) == 5
+
+
+def test_shrink_counts_running_conversions_of_dropped_slots():
+    pool = SlotPool(3, cores=12)
+    for _ in range(3):
+        pool.acquire()
+    pool.resize(1)
+
+    pool.release(1)
+    assert pool.acquire() is None  # slots 2 and 3 still run
+    pool.release(2)
+    pool.release(3)
+    assert pool.acquire() == (1, 12)
+
+
+@pytest.fixture
+def simple_app(tmp_path, monkeypatch):
+    """simple_run imported against a scratch database and folders"""
+    pytest.importorskip('flask_sqlalchemy')
+    pytest.importorskip('ffmpeg')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('SIMPLE_DATABASE_PATH', str(tmp_path / 'data' / 'simple.db'))
+    monkeypatch.setenv('INPUT_FOLDER', str(tmp_path / 'INPUT'))
+    monkeypatch.setenv('OUTPUT_FOLDER', str(tmp_path / 'OUTPUT'))
+    monkeypatch.setenv('STATUS_STORE', 'memory')
+    monkeypatch.setenv('CONVERSION_SLOTS', '2')
+    sys.modules.pop('simple_run', None)
+    module = importlib.import_module('simple_run')
+    with module.app.app_context():
+        module.db.create_all()
+    yield module
+    sys.modules.pop('simple_run', None)
+
+
+def test_concurrent_dispatch_runs_every_claimed_job_in_a_slot(simple_app, monkeypatch):
+    app, db = simple_app.app, simple_app.db
+    finish = threading.Event()
+
+    def hold_slot(job_id, movie_id, slot, cores):
+        # Stands in for the conversion: keeps the slot busy until the test lets go
+        finish.wait(30)
+        with app.app_context():
+            simple_app.complete_job(db.session, simple_app.ConversionJob, job_id)
+        simple_app.conversion_slots.release(slot)
+
+    monkeypatch.setattr(simple_app, 'run_job', hold_slot)
+
+    with app.app_context():
+        for index in range(6):
+            movie = simple_app.Movie(filename=f'movie{index}.mp4', file_path=f'/in/movie{index}.mp4', file_size=1)
+            db.session.add(movie)
+            db.session.commit()
+            simple_app.enqueue_job(db.session, simple_app.ConversionJob, movie.id)
+
+    def resize_back_and_forth():
+        for size in (1, 2) * 20:
+            simple_app.conversion_slots.resize(size)
+            time.sleep(0.001)
+
+    try:
+        errors = run_threads([simple_app.start_queued_jobs, simple_app.start_queued_jobs, resize_back_and_forth])
+        assert not errors
+
+        with app.app_context():
+            running = {job.id for job in simple_app.ConversionJob.query.filter_by(state='running')}
+        in_slots = {conversion['job_id'] for conversion in simple_app.conversion_slots.snapshot()['slots']}
+        # No job is claimed without a slot to run in, and no slot is reserved without a job
+        assert running == in_slots
+        assert 1 <= len(running) <= 2
+    finally:
+        finish.set()
@@ -0,0 +1,35 @@
+import time
+
+from sqlalchemy import Column, Float, String, create_engine
+from sqlalchemy.orm import Session, declarative_base
+
+from job_leases import renew_leases
+
+Base = declarative_base()
+
+
+class Movie(Base):
+    __tablename__ = 'movie'
+    id = Column(String(20), primary_key=True)
+    status = Column(String(20))
+    owner = Column(String(100))
+    heartbeat_at = Column(Float)
+
+
+def test_renew_without_owner_only_renews_active_movies():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all([
+            Movie(id='dispatched', status='IN_PROGRESS', owner='coordinator', heartbeat_at=0),
+            Movie(id='encoding', status='IN_PROGRESS', owner='coordinator', heartbeat_at=0),
+        ])
+        session.commit()
+
+        renew_leases(session, Movie, owner=None, movie_ids=['encoding'])
+        assert session.get(Movie, 'dispatched').heartbeat_at == 0
+        assert session.get(Movie, 'encoding').heartbeat_at > time.time() - 5
+
+        renew_leases(session, Movie, owner='coordinator')
+        session.expire_all()
+        assert session.get(Movie, 'dispatched').heartbeat_at > 0
@@ -0,0 +1,74 @@
+import sqlite3
+
+import pytest
+
+import status_store
+from status_store import MemoryStatusStore, SQLiteStatusStore, StatusStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(status_store.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryStatusStore(retention=100)
+    return SQLiteStatusStore(tmp_path / 'live_status.db', retention=100)
+
+
+def test_status_store_is_abstract():
+    with pytest.raises(TypeError):
+        StatusStore()
+
+
+def test_tombstones_expire_after_the_retention(store, clock):
+    store.publish('MOV1', {'status': 'DONE'})
+    store.publish('MOV2', {'status': 'DONE'})
+    store.publish('MOV1')
+    assert store.changes_since(0)[1] == [(2, 'MOV2', {'status': 'DONE'}), (3, 'MOV1', None)]
+    assert store.expired_version() == 0
+
+    clock.now += 101
+    store.publish('MOV2', {'status': 'ERROR'})
+    assert store.changes_since(0) == (4, [(4, 'MOV2', {'status': 'ERROR'})])
+    # A reader that stopped before the removal must reload, a later one is up to date
+    assert store.expired_version() == 3
+
+
+def test_new_readers_only_get_recent_live_statuses(store, clock):
+    store.publish('MOV1', {'status': 'DONE'})
+    clock.now += status_store.RECENT_SECONDS + 1
+    store.publish('MOV2', {'status': 'IN_PROGRESS'})
+    store.publish('MOV3', {'status': 'QUEUED'})
+    store.publish('MOV3')
+    assert store.recent() == (4, [(2, 'MOV2', {'status': 'IN_PROGRESS'})])
+
+
+def test_sqlite_store_migrates_an_old_file(tmp_path, clock):
+    path = tmp_path / 'live_status.db'
+    connection = sqlite3.connect(path)
+    connection.executescript('''
+        CREATE TABLE live_status (movie_id TEXT PRIMARY KEY, status TEXT, version INTEGER NOT NULL);
+        CREATE TABLE live_status_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL);
+        INSERT INTO live_status_version (id, version) VALUES (1, 2);
+        INSERT INTO live_status VALUES ('MOV1', '{"status": "DONE"}', 1), ('MOV2', NULL, 2);
+    ''')
+    connection.commit()
+    connection.close()
+
+    store = SQLiteStatusStore(path)
+    store.publish('MOV3', {'status': 'QUEUED'})
+    assert store.changes_since(0)[1] == [(1, 'MOV1', {'status': 'DONE'}), (3, 'MOV3', {'status': 'QUEUED'})]
+    assert store.expired_version() == 2
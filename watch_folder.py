@@ -0,0 +1,223 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+
+# Watch-folder ingestion built on Linux inotify (through ctypes, no extra
+# dependencies). On platforms without inotify the service only runs the
+# periodic reconciliation callback.
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _load_libc()
+
+
+def inotify_supported():
+    """Check whether inotify is available on this platform"""
+    return _libc is not None
+
+
+class InotifyWatcher:
+    """Minimal inotify wrapper that keeps a watch on every directory of a tree"""
+
+    def __init__(self, recursive=True):
+        if not inotify_supported():
+            raise OSError('inotify is not available on this platform')
+        self.recursive = recursive
+        self.fd = _libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watches = {}  # watch descriptor -> directory path
+
+    def add_watch(self, directory):
+        """Watch a directory, and its subdirectories when recursive"""
+        directory = Path(directory)
+        wd = _libc.inotify_add_watch(self.fd, str(directory).encode(), WATCH_MASK)
+        if wd < 0:
+            return
+        self.watches[wd] = directory
+
+        if self.recursive:
+            for child in directory.iterdir():
+                if child.is_dir():
+                    self.add_watch(child)
+
+    def read_events(self, timeout):
+        """Wait up to timeout seconds and return a list of (mask, path) events"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        buffer = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buffer):
+            wd, mask, _cookie, name_length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset:offset + name_length].rstrip(b'\0').decode('utf-8', errors='surrogateescape')
+            offset += name_length
+
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+
+            directory = self.watches.get(wd)
+            if mask & IN_Q_OVERFLOW:
+                events.append((mask, None))
+            elif directory is not None:
+                events.append((mask, directory / name if name else directory))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class WatchFolderService:
+    """
+    Watches an input tree and reports files once they stopped growing.
+
+    on_ready(path) is called for new or moved-in files after their size has
+    been stable for settle_seconds, on_removed(path) for deleted or moved-out
+    files and on_reconcile() every reconcile_interval seconds (and after an
+    inotify queue overflow) so a full-tree walk can catch anything missed.
+    """
+
+    def __init__(self, root, extensions, on_ready, on_removed=None, on_reconcile=None,
+                 recursive=True, settle_seconds=10, reconcile_interval=3600):
+        self.root = Path(root)
+        self.extensions = {ext.lower() for ext in extensions}
+        self.on_ready = on_ready
+        self.on_removed = on_removed
+        self.on_reconcile = on_reconcile
+        self.recursive = recursive
+        self.settle_seconds = settle_seconds
+        self.reconcile_interval = reconcile_interval
+        self.pending = {}  # path -> (last seen size, time of last size change)
+        self.last_reconcile = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='watch-folder', daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _call(self, callback, *args):
+        # A failing callback must not stop the watcher thread
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"Error in watch folder callback {callback.__name__}: {e}")
+
+    def is_video(self, path):
+        return path.suffix.lower() in self.extensions
+
+    def _track(self, path):
+        if self.is_video(path):
+            self.pending[path] = (-1, time.time())
+
+    def _track_tree(self, directory):
+        """Track files in a directory that appeared without per-file events"""
+        pattern = directory.rglob('*') if self.recursive else directory.iterdir()
+        for path in pattern:
+            if path.is_file():
+                self._track(path)
+
+    def _handle_event(self, watcher, mask, path):
+        if path is None:
+            # Events were dropped, only a full walk can tell what changed
+            self._reconcile()
+            return
+
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO) and self.recursive:
+                watcher.add_watch(path)
+                self._track_tree(path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._reconcile()
+            return
+
+        if mask & (IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO):
+            if path not in self.pending:
+                self._track(path)
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            self.pending.pop(path, None)
+            if self.on_removed and self.is_video(path):
+                self._call(self.on_removed, path)
+
+    def _check_pending(self):
+        """Hand over files whose size did not change for settle_seconds"""
+        now = time.time()
+        for path, (last_size, changed_at) in list(self.pending.items()):
+            try:
+                size = path.stat().st_size
+            except OSError:
+                self.pending.pop(path, None)
+                continue
+
+            if size != last_size:
+                self.pending[path] = (size, now)
+            elif now - changed_at >= self.settle_seconds:
+                self.pending.pop(path, None)
+                self._call(self.on_ready, path)
+
+    def _reconcile(self):
+        if self.on_reconcile:
+            self._call(self.on_reconcile)
+        self.last_reconcile = time.time()
+
+    def run(self):
+        watcher = None
+        if inotify_supported():
+            watcher = InotifyWatcher(recursive=self.recursive)
+            watcher.add_watch(self.root)
+
+        self._reconcile()
+        try:
+            while not self.stop_event.is_set():
+                if watcher:
+                    for mask, path in watcher.read_events(timeout=1):
+                        self._handle_event(watcher, mask, path)
+                else:
+                    self.stop_event.wait(1)
+
+                self._check_pending()
+
+                if time.time() - self.last_reconcile >= self.reconcile_interval:
+                    self._reconcile()
+        finally:
+            if watcher:
+                watcher.close()